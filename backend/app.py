@@ -1,30 +1,36 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Blueprint, Flask, Response, current_app, g, has_app_context, render_template, request, jsonify, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from datetime import date
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.engine import Engine
+from collections import OrderedDict
+from datetime import date, timedelta
+from functools import lru_cache
 import os
 from dotenv import load_dotenv
 import json
-import bcrypt
+import hashlib
+import logging
+import time
+import itertools
+import subprocess
+import sys
+import threading
+import weakref
+from backend.generation_lock import GenerationInProgress
+from backend.instrumentation import (HTTP_DB_SECONDS, HTTP_SECONDS, DBTimer, current_db_timer, metric_lines,
+                                     record_db_time, registry)
+from backend.password_hasher import HasherOverloaded, PasswordHasher
+from backend.score_writer import ScoreWriter, insert_scores, update_score_counts, update_user_stats
+from concurrent.futures import TimeoutError
 
 load_dotenv()
 
-app = Flask(__name__, 
-           template_folder='../frontend/templates',
-           static_folder='../frontend/static')
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev')
-app.config['PERMANENT_SESSION_LIFETIME'] = 60 * 60 * 24 * 30  # 30 days
-app.config['SESSION_COOKIE_SECURE'] = False  # Allow non-HTTPS in development
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
-    'DATABASE_URL',
-    'postgresql://trivia_user:trivia_password@db:5432/trivia_db'
-)
-db = SQLAlchemy(app)
+logger = logging.getLogger(__name__)
+db = SQLAlchemy()
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'web.login'
+web = Blueprint('web', __name__)
 
 # Database Models
 class User(UserMixin, db.Model):
@@ -34,26 +40,429 @@ class User(UserMixin, db.Model):
     scores = db.relationship('Score', backref='user', lazy=True)
 
 class Score(db.Model):
+    # One score per user per day; also serves per-user date lookups and ranges.
+    # The (date, score) index serves the day's leaderboard as a bounded top-N read.
+    __table_args__ = (
+        db.Index('ix_score_user_date', 'user_id', 'date', unique=True),
+        db.Index('ix_score_date_score', 'date', 'score'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     score = db.Column(db.Integer, nullable=False)
     date = db.Column(db.Date, nullable=False)
 
+class UserStats(db.Model):
+    # Running aggregates, updated with each new score so reads never scan a player's history
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    games_played = db.Column(db.Integer, nullable=False, default=0)
+    total_score = db.Column(db.Integer, nullable=False, default=0)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)
+    best_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_played = db.Column(db.Date)
+
+    def to_dict(self, today: date) -> dict:
+        # A streak only counts while its last day is today or yesterday
+        active = self.last_played is not None and self.last_played >= today - timedelta(days=1)
+        return {
+            'games_played': self.games_played,
+            'average_score': round(self.total_score / self.games_played, 2) if self.games_played else None,
+            'current_streak': self.current_streak if active else 0,
+            'best_streak': self.best_streak,
+            'last_played': self.last_played.isoformat() if self.last_played else None,
+        }
+
+class ArticleSignature(db.Model):
+    # MinHash signature of the article a day's questions came from, for spotting near-duplicate articles
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False, unique=True)
+    title = db.Column(db.String(300), nullable=False)
+    signature = db.Column(db.LargeBinary, nullable=False)
+
+class DailyScoreCount(db.Model):
+    # How many players got each score on each day, counted as scores arrive
+    date = db.Column(db.Date, primary_key=True)
+    score = db.Column(db.Integer, primary_key=True)
+    players = db.Column(db.Integer, nullable=False, default=0)
+
 class DailyQuestions(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False, unique=True)
     questions = db.Column(db.Text, nullable=False)  # JSON string of questions
 
+class GenerationTrace(db.Model):
+    # Stage timings, token counts and cache hits of the run that generated a day's questions
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False, unique=True)
+    trace = db.Column(db.Text, nullable=False)  # JSON string of the trace
+
+class QuestionsPayloadCache:
+    """Per-process cache of the ready-to-send /get_questions and /stream_questions bodies for a single date."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry = None  # (date, body bytes, etag, event stream bytes, question count)
+        self.version = 0
+
+    def get(self, day: date):
+        entry = self._entry
+        if entry is not None and entry[0] == day:
+            return entry
+        return None
+
+    def put(self, day: date, body: bytes, events: bytes, question_count: int, version: int):
+        """Store a payload loaded at the given version; it is dropped if an invalidation happened meanwhile."""
+        entry = (day, body, hashlib.sha256(body).hexdigest(), events, question_count)
+        with self._lock:
+            if version == self.version:
+                self._entry = entry
+        return entry
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entry = None
+            self.version += 1
+
+questions_cache = QuestionsPayloadCache()
+
+class UserPrincipal(UserMixin):
+    """What a request needs to know about the signed-in user; never carries the password hash."""
+
+    def __init__(self, id: int, username: str):
+        self.id = id
+        self.username = username
+
+class UserCache:
+    """Per-process LRU cache of signed-in users, each entry trusted for ttl_seconds."""
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None):
+        self.max_entries = max_entries or int(os.getenv('USER_CACHE_SIZE', '10000'))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv('USER_CACHE_TTL_SECONDS', '300'))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user id -> (principal, expires at)
+
+    def get(self, user_id: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[0]
+
+    def put(self, principal: UserPrincipal) -> None:
+        with self._lock:
+            self._entries[principal.id] = (principal, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+user_cache = UserCache()
+
+def record_scores(connection, rows: list[dict]) -> set[tuple]:
+    """Insert scores and fold the new ones into their players' stats, in the caller's transaction."""
+    inserted = insert_scores(connection, Score.__table__, rows)
+    new_rows, claimed = [], set()
+    for row in rows:
+        key = (row['user_id'], row['date'])
+        if key in inserted and key not in claimed:
+            new_rows.append(row)
+            claimed.add(key)
+    update_user_stats(connection, UserStats.__table__, new_rows)
+    update_score_counts(connection, DailyScoreCount.__table__, new_rows)
+    return inserted
+
+def rebuild_score_summaries() -> None:
+    """Recompute player stats and daily score counts from the scores, for databases that predate them."""
+    db.session.query(UserStats).delete()
+    db.session.query(DailyScoreCount).delete()
+    db.session.commit()
+    rows = db.session.query(Score.user_id, Score.score, Score.date).order_by(Score.user_id, Score.date)
+    for _, user_rows in itertools.groupby(rows, key=lambda row: row.user_id):
+        user_rows = [row._asdict() for row in user_rows]
+        update_user_stats(db.session.connection(), UserStats.__table__, user_rows)
+        update_score_counts(db.session.connection(), DailyScoreCount.__table__, user_rows)
+    db.session.commit()
+
+class DailySummaryCache:
+    """Per-process cache of /daily_summary bodies, each served for ttl_seconds before it is rebuilt."""
+
+    def __init__(self, ttl_seconds: float = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv('DAILY_SUMMARY_TTL_SECONDS', '10'))
+        self._lock = threading.Lock()
+        self._entries = {}  # date -> (summary, expires at)
+
+    def get(self, day: date):
+        entry = self._entries.get(day)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def put(self, day: date, summary: dict) -> None:
+        now = time.monotonic()
+        with self._lock:
+            # Drop expired days so the cache never grows past the few being viewed
+            self._entries = {key: entry for key, entry in self._entries.items() if entry[1] > now}
+            self._entries[day] = (summary, now + self.ttl_seconds)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = {}
+
+summary_cache = DailySummaryCache()
+score_writer = ScoreWriter(record_scores)
+password_hasher = PasswordHasher()
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_user_cache(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+@event.listens_for(DailyQuestions, 'after_insert')
+@event.listens_for(DailyQuestions, 'after_update')
+@event.listens_for(DailyQuestions, 'after_delete')
+def invalidate_questions_cache(mapper, connection, target):
+    questions_cache.invalidate()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('statement_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_statement_timer(connection, cursor, statement, parameters, context, executemany):
+    record_db_time(time.perf_counter() - connection.info['statement_started'].pop())
+
+@event.listens_for(Engine, 'handle_error')
+def drop_statement_timer(context):
+    started = context.connection.info.get('statement_started') if context.connection is not None else None
+    if started:
+        record_db_time(time.perf_counter() - started.pop())
+
+def load_questions_payload(day: date):
+    """Load, validate and serialize the stored questions for a date into the cache."""
+    version = questions_cache.version
+    daily_questions = DailyQuestions.query.filter_by(date=day).first()
+    if not daily_questions:
+        return None
+    questions_data = json.loads(daily_questions.questions)
+    if not questions_data:
+        raise ValueError('Empty question data')
+    body = json.dumps(questions_data, separators=(',', ':')).encode('utf-8')
+    events = ''.join(sse_event(name, data) for name, data in questions_events(questions_data)).encode('utf-8')
+    return questions_cache.put(day, body, events, len(questions_data['questions']), version)
+
+def questions_response(entry) -> Response:
+    """Serve a cached payload, answering 304 when the client already holds it."""
+    _, body, etag, _, _ = entry
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def questions_events(questions_data: dict):
+    """Replay a stored question set as the (event, data) pairs sent by /stream_questions."""
+    yield 'source', questions_data.get('source', {})
+    for question in questions_data['questions']:
+        yield 'question', question
+    yield 'done', {'count': len(questions_data['questions'])}
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def generation_command(lock_timeout: float) -> list[str]:
+    """Command generating today's questions in a child process that prints events as JSON lines."""
+    return [sys.executable, '-m', 'backend.generate_day', '--lock-timeout', str(lock_timeout)]
+
+class GenerationTimedOut(Exception):
+    """Raised to readers of an on-demand generation child that was killed for passing its deadline."""
+
+class GenerationRun:
+    """One on-demand generation child and the events it has reported, shared by every request waiting on it."""
+
+    def __init__(self, day: date):
+        self.day = day
+        self.messages = []
+        self.finished = False
+        self._changed = threading.Condition()
+
+    def pump(self, process: subprocess.Popen, timeout: float) -> None:
+        """Read the child's JSON-line events until it exits, then stop sharing the run.
+
+        A child still running after timeout seconds is killed, and its
+        readers get GenerationTimedOut rather than waiting on it forever.
+        """
+        deadline = threading.Timer(timeout, self.expire, args=(process,))
+        deadline.daemon = True
+        deadline.start()
+        try:
+            for line in process.stdout:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                with self._changed:
+                    self.messages.append(message)
+                    self._changed.notify_all()
+        finally:
+            deadline.cancel()
+            process.stdout.close()
+            self.unshare()
+            with self._changed:
+                self.finished = True
+                self._changed.notify_all()
+            process.wait()
+
+    def unshare(self) -> None:
+        """Stop handing this run to new requests, so the next one starts a fresh child."""
+        with _generation_runs_guard:
+            if _generation_runs.get(self.day) is self:
+                del _generation_runs[self.day]
+
+    def expire(self, process: subprocess.Popen) -> None:
+        logger.error(f"Question generation for {self.day} passed its deadline, killing the child process")
+        self.unshare()
+        with self._changed:
+            self.messages.append({'event': 'timeout', 'data': {}})
+            self._changed.notify_all()
+        process.kill()
+
+    def follow(self):
+        """Yield every (event, data) pair reported so far, then each new one as it arrives."""
+        position = 0
+        while True:
+            with self._changed:
+                while position == len(self.messages) and not self.finished:
+                    self._changed.wait()
+                if position == len(self.messages):
+                    return
+                message = self.messages[position]
+            position += 1
+            if message['event'] == 'busy':
+                raise GenerationInProgress(self.day, message['data']['retry_after'])
+            if message['event'] == 'timeout':
+                raise GenerationTimedOut(f"Question generation for {self.day} timed out")
+            if message['event'] == 'error':
+                raise RuntimeError(message['data']['error'])
+            yield message['event'], message['data']
+
+_generation_runs = {}  # date -> GenerationRun of this process
+_generation_runs_guard = threading.Lock()
+
+def generation_events(lock_timeout: float):
+    """Generate today's questions on demand, yielding the (event, data) pairs as the child reports them.
+
+    Generation runs in a separate process so web workers never import the
+    LLM and tokenizer stack. A worker starts at most one child per date;
+    concurrent requests follow the running child's events from the start.
+    The child keeps going if every reader stops early, so a quiz whose
+    player disconnected is still stored. Raises GenerationInProgress when
+    another process holds the day's lock, and GenerationTimedOut when the
+    child runs past GENERATION_TIMEOUT_SECONDS.
+    """
+    today = date.today()
+    with _generation_runs_guard:
+        run = _generation_runs.get(today)
+        if run is None:
+            process = subprocess.Popen(generation_command(lock_timeout), stdout=subprocess.PIPE, text=True,
+                                       cwd=PROJECT_ROOT)
+            run = _generation_runs[today] = GenerationRun(today)
+            timeout = float(os.getenv('GENERATION_TIMEOUT_SECONDS', '300'))
+            threading.Thread(target=run.pump, args=(process, timeout), daemon=True).start()
+    yield from run.follow()
+
+def on_demand_generation() -> bool:
+    """Whether a missing day is generated from the web service; lean deployments leave it to the scheduler."""
+    return os.getenv('ON_DEMAND_GENERATION', 'true').lower() == 'true'
+
+def sse_event(name: str, data) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+def event_stream_response(body) -> Response:
+    """Serve an event stream body, either ready-made bytes or a generator, without proxy buffering."""
+    response = Response(body, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def sse_response(events) -> Response:
+    """Serve (event, data) pairs as server-sent events, ending with an error event if the source fails."""
+    def generate():
+        try:
+            for name, data in events:
+                yield sse_event(name, data)
+        except Exception as e:
+            logger.error(f"Error streaming questions: {str(e)}")
+            yield sse_event('error', {'error': 'Question generation failed'})
+    
+    return event_stream_response(generate())
+
+def retry_later_response(error: str, retry_after: int):
+    response = jsonify({'error': error, 'retry_after': retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 503
+
+def overloaded_response():
+    """Answer quickly when password hashing is saturated rather than tying up the worker."""
+    response = jsonify({'error': 'Too many sign-ins right now, please try again in a moment'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    """Resolve the session's user from the cache, loading only id and username on a miss."""
+    user_id = int(user_id)
+    principal = user_cache.get(user_id)
+    if principal is None:
+        row = db.session.query(User.id, User.username).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        principal = UserPrincipal(row.id, row.username)
+        user_cache.put(principal)
+    return principal
+
+@web.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.db_timer = DBTimer()
+    g.db_timer_token = current_db_timer.set(g.db_timer)
+
+@web.after_request
+def observe_request(response):
+    """Record the request's latency and database time, and report both in a Server-Timing header."""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    elapsed = time.perf_counter() - g.request_started
+    HTTP_SECONDS.observe(elapsed, route=route, method=request.method, status=response.status_code)
+    HTTP_DB_SECONDS.observe(g.db_timer.seconds, route=route)
+    response.headers['Server-Timing'] = (
+        f'db;dur={g.db_timer.seconds * 1000:.1f};desc="{g.db_timer.statements} statements", '
+        f'total;dur={elapsed * 1000:.1f}'
+    )
+    return response
+
+@web.teardown_request
+def stop_request_timer(exception=None):
+    token = g.pop('db_timer_token', None)
+    if token is not None:
+        current_db_timer.reset(token)
 
 # Routes
-@app.route('/')
+@web.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/signup', methods=['GET', 'POST'])
+@web.route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
         data = request.get_json()
@@ -63,7 +472,10 @@ def signup():
         if User.query.filter_by(username=username).first():
             return jsonify({'error': 'Username already exists'}), 400
         
-        hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        try:
+            hashed = password_hasher.hash(password)
+        except HasherOverloaded:
+            return overloaded_response()
         new_user = User(username=username, password=hashed)
         db.session.add(new_user)
         db.session.commit()
@@ -73,13 +485,25 @@ def signup():
     
     return render_template('signup.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@web.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         data = request.get_json()
         user = User.query.filter_by(username=data.get('username')).first()
         
-        if user and bcrypt.checkpw(data.get('password').encode('utf-8'), user.password):
+        try:
+            valid = user is not None and password_hasher.verify(data.get('password'), user.password)
+        except HasherOverloaded:
+            return overloaded_response()
+        
+        if valid:
+            if password_hasher.needs_rehash(user.password):
+                # Upgrade the stored hash to the current cost while the password is at hand
+                try:
+                    user.password = password_hasher.hash(data.get('password'))
+                    db.session.commit()
+                except HasherOverloaded:
+                    pass
             login_user(user, remember=True)
             session.permanent = True
             return jsonify({'message': 'Logged in successfully'})
@@ -88,69 +512,332 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/logout')
+@web.route('/logout')
 @login_required
 def logout():
+    user_cache.invalidate(current_user.id)
     logout_user()
     return jsonify({'message': 'Logged out successfully'})
 
-@app.route('/get_questions')
+@web.route('/get_questions')
 @login_required
 def get_questions():
-    print("User authenticated:", current_user.is_authenticated)
-    print("Current user:", current_user.get_id() if current_user.is_authenticated else None)
     today = date.today()
-    daily_questions = DailyQuestions.query.filter_by(date=today).first()
+    cached = questions_cache.get(today)
+    if cached:
+        return questions_response(cached)
     
-    if daily_questions:
-        try:
-            questions_data = json.loads(daily_questions.questions)
-            if not questions_data:
-                return jsonify({'error': 'Invalid question data'}), 500
-            return jsonify(questions_data)
-        except json.JSONDecodeError:
-            return jsonify({'error': 'Invalid question format'}), 500
+    try:
+        cached = load_questions_payload(today)
+        if cached:
+            return questions_response(cached)
+    except json.JSONDecodeError:
+        return jsonify({'error': 'Invalid question format'}), 500
+    except ValueError:
+        return jsonify({'error': 'Invalid question data'}), 500
+    
+    if not on_demand_generation():
+        return jsonify({'error': 'Quiz not available yet'}), 404
     
-    # If no questions available, try to generate them
+    # If no questions available, generate them; concurrent callers wait for the single generator
     try:
-        from question_generator import generate_daily_questions
-        generate_daily_questions()
+        for _ in generation_events(float(os.getenv('GENERATION_WAIT_SECONDS', '10'))):
+            pass
         
         # Try fetching again
-        daily_questions = DailyQuestions.query.filter_by(date=today).first()
-        if daily_questions:
-            return jsonify(json.loads(daily_questions.questions))
+        cached = load_questions_payload(today)
+        if cached:
+            return questions_response(cached)
+    except GenerationInProgress as e:
+        return retry_later_response('Questions are being generated', e.retry_after)
+    except GenerationTimedOut:
+        return retry_later_response('Question generation timed out',
+                                    int(os.getenv('GENERATION_RETRY_AFTER_SECONDS', '15')))
     except Exception as e:
-        print(f"Error generating questions: {e}")
+        logger.error(f"Error generating questions: {str(e)}")
     
     return jsonify({'error': 'No questions available'}), 404
 
-@app.route('/submit_score', methods=['POST'])
+@web.route('/stream_questions')
+@login_required
+def stream_questions():
+    """Today's questions as server-sent events, generated and streamed on demand if needed."""
+    today = date.today()
+    try:
+        cached = questions_cache.get(today) or load_questions_payload(today)
+    except ValueError:
+        return jsonify({'error': 'Invalid question data'}), 500
+    if cached:
+        # A stored day replays its events as cached bytes, like /get_questions
+        return event_stream_response(cached[3])
+    if not on_demand_generation():
+        return jsonify({'error': 'Quiz not available yet'}), 404
+    
+    events = generation_events(float(os.getenv('GENERATION_WAIT_SECONDS', '10')))
+    try:
+        # Wait for the source event so a busy lock or failed ingestion still gets a plain status code
+        first = next(events)
+    except StopIteration:
+        return jsonify({'error': 'No questions available'}), 404
+    except GenerationInProgress as e:
+        return retry_later_response('Questions are being generated', e.retry_after)
+    except GenerationTimedOut:
+        return retry_later_response('Question generation timed out',
+                                    int(os.getenv('GENERATION_RETRY_AFTER_SECONDS', '15')))
+    except Exception as e:
+        logger.error(f"Error generating questions: {str(e)}")
+        return jsonify({'error': 'No questions available'}), 404
+    return sse_response(itertools.chain([first], events))
+
+@web.route('/submit_score', methods=['POST'])
 @login_required
 def submit_score():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     score_value = data.get('score')
     today = date.today()
+    try:
+        cached = questions_cache.get(today) or load_questions_payload(today)
+    except ValueError:
+        cached = None
+    if not cached:
+        return jsonify({'error': 'No quiz available for today'}), 400
+    # Checked before the write, so a bad score never reaches a shared write-behind batch
+    question_count = cached[4]
+    if type(score_value) is not int or not 0 <= score_value <= question_count:
+        return jsonify({'error': f'Score must be a whole number from 0 to {question_count}'}), 400
+    row = {'user_id': current_user.id, 'score': score_value, 'date': today}
     
-    # Check if user already submitted a score today
-    existing_score = Score.query.filter_by(user_id=current_user.id, date=today).first()
-    if existing_score:
+    # A single insert; the unique (user_id, date) index rejects a second score for today
+    if score_writer.enabled:
+        try:
+            inserted = score_writer.submit(db.engine, row)
+        except TimeoutError:
+            return jsonify({'error': 'Score could not be saved in time, please retry'}), 503
+    else:
+        inserted = bool(record_scores(db.session.connection(), [row]))
+        db.session.commit()
+    if not inserted:
         return jsonify({'error': 'Already submitted score for today'}), 400
     
-    new_score = Score(user_id=current_user.id, score=score_value, date=today)
-    db.session.add(new_score)
-    db.session.commit()
-    
-    return jsonify({'message': 'Score submitted successfully'})
+    # A few summary rows, already counting this score; the score table itself is not read
+    return jsonify({
+        'message': 'Score submitted successfully',
+        'beat_percent': beat_percent(score_distribution(today), score_value),
+    })
 
-@app.route('/get_user_scores')
+@web.route('/get_user_scores')
 @login_required
 def get_user_scores():
     scores = Score.query.filter_by(user_id=current_user.id).all()
     score_data = [{'date': score.date.isoformat(), 'score': score.score} for score in scores]
     return jsonify(score_data)
 
-if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-    app.run(host='0.0.0.0', debug=True)
+@web.route('/score_history')
+@login_required
+def score_history():
+    """The player's scores between start and end, newest first, a page at a time, with their stats.
+
+    Pages are keyed on date (pass next_cursor back as cursor), so each one
+    is a range read on the (user_id, date) index however long the history.
+    """
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+        cursor = date.fromisoformat(request.args['cursor']) if request.args.get('cursor') else None
+        limit = min(max(int(request.args.get('limit', '31')), 1), 366)
+    except ValueError:
+        return jsonify({'error': 'Invalid date or limit'}), 400
+    
+    query = db.session.query(Score.date, Score.score).filter(Score.user_id == current_user.id)
+    if start:
+        query = query.filter(Score.date >= start)
+    if end:
+        query = query.filter(Score.date <= end)
+    if cursor:
+        query = query.filter(Score.date < cursor)
+    rows = query.order_by(Score.date.desc()).limit(limit + 1).all()
+    
+    stats = db.session.get(UserStats, current_user.id)
+    return jsonify({
+        'scores': [{'date': row.date.isoformat(), 'score': row.score} for row in rows[:limit]],
+        'next_cursor': rows[limit - 1].date.isoformat() if len(rows) > limit else None,
+        'stats': stats.to_dict(date.today()) if stats else UserStats(games_played=0, best_streak=0).to_dict(date.today()),
+    })
+
+def score_distribution(day: date) -> list[tuple[int, int]]:
+    """The day's (score, players) counts in ascending score order, read from the summary table."""
+    rows = db.session.query(DailyScoreCount.score, DailyScoreCount.players).filter(
+        DailyScoreCount.date == day
+    ).order_by(DailyScoreCount.score)
+    return [(row.score, row.players) for row in rows]
+
+def beat_percent(distribution: list[tuple[int, int]], score: int):
+    """Share of the day's players, as a whole percentage, who scored lower than score."""
+    total = sum(players for _, players in distribution)
+    if not total:
+        return None
+    below = sum(players for value, players in distribution if value < score)
+    return round(100 * below / total)
+
+def build_daily_summary(day: date) -> dict:
+    """The day's score histogram with percentiles and its top players, without scanning the score table."""
+    distribution = score_distribution(day)
+    total = sum(players for _, players in distribution)
+    leaders = db.session.query(User.username, Score.score).join(User, User.id == Score.user_id).filter(
+        Score.date == day
+    ).order_by(Score.score.desc(), Score.id).limit(int(os.getenv('LEADERBOARD_SIZE', '10'))).all()
+    return {
+        'date': day.isoformat(),
+        'players': total,
+        'histogram': [
+            {'score': score, 'players': players, 'beat_percent': beat_percent(distribution, score)}
+            for score, players in distribution
+        ],
+        'leaderboard': [{'username': row.username, 'score': row.score} for row in leaders],
+    }
+
+@web.route('/daily_summary')
+@login_required
+def daily_summary():
+    """How everyone did on a day (today by default), served from a short-lived cache."""
+    try:
+        day = date.fromisoformat(request.args['date']) if request.args.get('date') else date.today()
+    except ValueError:
+        return jsonify({'error': 'Invalid date'}), 400
+    summary = summary_cache.get(day)
+    if summary is None:
+        summary = build_daily_summary(day)
+        summary_cache.put(day, summary)
+    return jsonify(summary)
+
+def generation_metric_lines() -> list[str]:
+    """Gauges from the latest stored generation trace; generation runs outside the web process."""
+    row = db.session.query(GenerationTrace.date, GenerationTrace.trace).order_by(GenerationTrace.id.desc()).first()
+    if row is None:
+        return []
+    try:
+        trace = json.loads(row.trace)
+    except ValueError:
+        return []
+    day = row.date.isoformat()
+    return metric_lines(
+        'trivia_last_generation_seconds', 'gauge', 'Duration of the latest generation run',
+        [('', {'date': day}, trace.get('duration_ms', 0) / 1000)]
+    ) + metric_lines(
+        'trivia_last_generation_stage_seconds', 'gauge', 'Time per stage in the latest generation run',
+        [('', {'date': day, 'stage': stage}, totals['total_ms'] / 1000) for stage, totals in trace.get('stages', {}).items()]
+    ) + metric_lines(
+        'trivia_last_generation_total', 'gauge', 'Tokens, LLM calls, cache hits and retries of the latest generation run',
+        [('', {'date': day, 'name': name}, value) for name, value in trace.get('totals', {}).items()]
+    )
+
+@web.route('/metrics')
+def metrics():
+    """Prometheus text-format metrics of every worker sharing the metrics directory, plus the latest
+    generation run's trace.
+
+    Needs the METRICS_TOKEN bearer token when one is set; without one only
+    local requests are answered.
+    """
+    token = os.getenv('METRICS_TOKEN')
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return jsonify({'error': 'Unauthorized'}), 401
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        return jsonify({'error': 'Set METRICS_TOKEN to scrape metrics remotely'}), 403
+    body = registry.render() + '\n'.join(generation_metric_lines() + [''])
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+def remove_duplicates(index) -> int:
+    """Delete rows that would break a unique index, keeping the first stored (lowest id) of each key."""
+    table = index.table
+    keep = select(func.min(table.c.id)).group_by(*index.columns)
+    with db.engine.begin() as connection:
+        return connection.execute(table.delete().where(table.c.id.not_in(keep))).rowcount
+
+def ensure_indexes() -> int:
+    """Create indexes added to existing tables, which create_all leaves alone.
+
+    Rows stored before a unique index existed may repeat its key; all but
+    the first of each are removed so the index, and the ON CONFLICT
+    inserts that rely on it, can work. Returns the number of rows removed.
+    Any other failure to create an index stops startup.
+    """
+    removed = 0
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if index.unique:
+                duplicates = remove_duplicates(index)
+                if duplicates:
+                    logger.warning(f"Removed {duplicates} rows of {table.name} repeating a key of {index.name}")
+                removed += duplicates
+            try:
+                index.create(db.engine, checkfirst=True)
+            except Exception as e:
+                logger.error(f"Could not create index {index.name}: {str(e)}")
+                raise
+    return removed
+
+def engine_options(database_url: str) -> dict:
+    """Connection pool settings for the app's engine, read from the environment."""
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE_SECONDS', '1800')),
+    }
+    # SQLite uses a single-connection pool that takes no size settings
+    if not database_url.startswith('sqlite'):
+        options['pool_size'] = int(os.getenv('DB_POOL_SIZE', '5'))
+        options['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+        options['pool_timeout'] = int(os.getenv('DB_POOL_TIMEOUT_SECONDS', '30'))
+    return options
+
+_apps = weakref.WeakSet()
+
+def dispose_engines_after_fork() -> None:
+    """Drop pooled connections inherited from the parent without closing them under the parent's feet."""
+    for flask_app in list(_apps):
+        with flask_app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=dispose_engines_after_fork)
+
+def create_app(config: dict = None) -> Flask:
+    """Build the Flask app; config overrides the settings read from the environment."""
+    flask_app = Flask(__name__, 
+                      template_folder='../frontend/templates',
+                      static_folder='../frontend/static')
+    flask_app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev')
+    flask_app.config['PERMANENT_SESSION_LIFETIME'] = 60 * 60 * 24 * 30  # 30 days
+    # Non-HTTPS cookies are allowed unless SESSION_COOKIE_SECURE is set, as in development
+    flask_app.config['SESSION_COOKIE_SECURE'] = os.getenv('SESSION_COOKIE_SECURE', 'false').lower() == 'true'
+    flask_app.config['SESSION_COOKIE_HTTPONLY'] = True
+    flask_app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
+        'DATABASE_URL',
+        'postgresql://trivia_user:trivia_password@db:5432/trivia_db'
+    )
+    flask_app.config.update(config or {})
+    flask_app.config.setdefault(
+        'SQLALCHEMY_ENGINE_OPTIONS', engine_options(flask_app.config['SQLALCHEMY_DATABASE_URI'])
+    )
+    
+    db.init_app(flask_app)
+    login_manager.init_app(flask_app)
+    flask_app.register_blueprint(web)
+    _apps.add(flask_app)
+    return flask_app
+
+@lru_cache(maxsize=None)
+def get_app() -> Flask:
+    """The process-wide app for code running outside a request, such as the scheduler and backfill."""
+    return create_app()
+
+def app_context():
+    """A new app context for the app handling the current request, or for get_app() outside one."""
+    flask_app = current_app._get_current_object() if has_app_context() else get_app()
+    return flask_app.app_context()
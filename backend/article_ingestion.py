@@ -1,87 +1,180 @@
-import wikipediaapi
 import logging
-import random
-import requests
+import asyncio
+import os
+import aiohttp
+from .category_index import CategoryIndex
+from .instrumentation import count, span
 
 logger = logging.getLogger(__name__)
 
+USER_AGENT = "DailyTriviaAI/1.0 (https://github.com/robinsanders/daily_trivia_ai; contact@dailytriviaai.com)"
+DEFAULT_CATEGORIES = ['Pirates', 'Association_football', 'Basketball', 'Artificial_intelligence', 'Personal_finance']
+MIN_ARTICLE_LENGTH = 1000
+
+def is_suitable(title: str, text: str, is_disambiguation: bool = False) -> bool:
+    """Check that an article is long enough and not a disambiguation page."""
+    return (len(text) > MIN_ARTICLE_LENGTH and
+            not is_disambiguation and
+            not title.lower().endswith('(disambiguation)'))
+
+def create_article_ingestion(dedup_index=None, session: aiohttp.ClientSession = None,
+                             category_index: CategoryIndex = None):
+    """The article source chosen by ARTICLE_SOURCE: the MediaWiki API ("api") or a local dump ("dump").
+
+    The shared HTTP session and category index are only used by the API source.
+    """
+    if os.getenv('ARTICLE_SOURCE', 'api').lower() == 'dump':
+        from .dump_ingestion import DumpArticleIngestion
+        return DumpArticleIngestion(dedup_index=dedup_index)
+    return ArticleIngestion(session=session, category_index=category_index, dedup_index=dedup_index)
+
+def create_http_session(user_agent: str = USER_AGENT, limit: int = 8) -> aiohttp.ClientSession:
+    """Create a keep-alive HTTP session that can be shared by several ArticleIngestion instances."""
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        keepalive_timeout=30,
+        ttl_dns_cache=300
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers={"User-Agent": user_agent},
+        timeout=aiohttp.ClientTimeout(total=30)
+    )
+
 class ArticleIngestion:
-    def __init__(self):
-        user_agent = "DailyTriviaAI/1.0 (https://github.com/robinsanders/daily_trivia_ai; contact@dailytriviaai.com)"
-        self.wiki = wikipediaapi.Wikipedia(
-            language='en',
-            user_agent=user_agent
-        )
+    def __init__(self, api_url: str = None, session: aiohttp.ClientSession = None,
+                 max_parallel_candidates: int = None, category_index: CategoryIndex = None, dedup_index=None):
         self.article_text = ""
         self.article_title = ""
-        self.api_url = "https://en.wikipedia.org/w/api.php"
-        self.user_agent = user_agent
+        self.api_url = api_url or os.getenv('WIKIPEDIA_API_URL', "https://en.wikipedia.org/w/api.php")
+        self.user_agent = USER_AGENT
+        self.categories = list(DEFAULT_CATEGORIES)
+        # Number of candidate articles fetched at once; the first suitable one wins
+        self.max_parallel_candidates = max_parallel_candidates or int(os.getenv('INGESTION_PARALLEL_CANDIDATES', '4'))
+        self.category_index = category_index or CategoryIndex()
+        # Articles used on earlier days are skipped before any text reaches the LLM
+        self.dedup_index = dedup_index
+        self._session = session
+        self._owns_session = session is None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled HTTP session, creating it on first use."""
+        if self._session is None or self._session.closed:
+            self._session = create_http_session(self.user_agent, limit=self.max_parallel_candidates * 2)
+            self._owns_session = True
+        return self._session
+
+    async def close(self) -> None:
+        """Close the HTTP session if this instance created it."""
+        if self._owns_session and self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
-    def _get_random_article_from_category(self, category: str) -> str:
-        """Get a random article from a category using the MediaWiki API."""
+    async def _api_get(self, params: dict) -> dict:
+        """Run a MediaWiki API query on the pooled session."""
+        async with self._get_session().get(self.api_url, params={"format": "json", **params}) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    def _is_suitable(self, title: str, text: str, is_disambiguation: bool = False) -> bool:
+        return is_suitable(title, text, is_disambiguation)
+
+    async def _fetch_article(self, title: str) -> tuple[str, str]:
+        """Fetch the plain text of an article, returning (title, text) if it is suitable."""
         params = {
             "action": "query",
-            "format": "json",
-            "list": "categorymembers",
-            "cmtitle": f"Category:{category}",
-            "cmtype": "page",
-            "cmlimit": "50"  # Get 50 articles at a time
+            "prop": "extracts|pageprops",
+            "ppprop": "disambiguation",
+            "explaintext": "1",
+            "exsectionformat": "wiki",
+            "redirects": "1",
+            "titles": title
         }
-        
-        headers = {
-            "User-Agent": self.user_agent
-        }
-        
+
         try:
-            response = requests.get(self.api_url, params=params, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            
-            if "query" in data and "categorymembers" in data["query"]:
-                members = data["query"]["categorymembers"]
-                if members:
-                    random_page = random.choice(members)
-                    return random_page["title"]
+            with span("ingestion.page_fetch"):
+                data = await self._api_get(params)
+            for page in data.get("query", {}).get("pages", {}).values():
+                if "missing" in page:
+                    self.category_index.mark_rejected(title)
+                    continue
+                text = page.get("extract", "")
+                is_disambiguation = "disambiguation" in page.get("pageprops", {})
+                if self._is_suitable(page["title"], text, is_disambiguation):
+                    repeat = self.dedup_index.article_repeat(page["title"], text) if self.dedup_index else None
+                    if repeat:
+                        logger.info(f"Skipping {page['title']}, a repeat of earlier article {repeat}")
+                        continue
+                    return page["title"], text
+                logger.info(f"Skipping incompatible article: {page['title']}")
+                self.category_index.mark_rejected(title)
         except Exception as e:
-            logger.warning(f"Error getting category members: {str(e)}")
-        
+            logger.warning(f"Error fetching article {title}: {str(e)}")
+
+        return None
+
+    async def _refresh_category_index(self) -> None:
+        """Page in members of any category whose index entry is missing or past its TTL."""
+        stale = [c for c in self.categories if self.category_index.is_stale(c)]
+        if not stale:
+            return
+        logger.info(f"Refreshing category index for: {', '.join(stale)}")
+        with span("ingestion.category_query", categories=len(stale)):
+            results = await asyncio.gather(
+                *(self.category_index.refresh(c, self._api_get) for c in stale),
+                return_exceptions=True
+            )
+        for category, result in zip(stale, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"Error getting category members for {category}: {str(result)}")
+        self.category_index.save()
+
+    async def _pick_candidates(self, count: int) -> list[str]:
+        """Pick up to count distinct candidate titles from the local category index."""
+        await self._refresh_category_index()
+        skip = self.dedup_index.seen_title if self.dedup_index else None
+        candidates = self.category_index.sample(self.categories, count, skip)
+        if not candidates:
+            logger.warning(f"No unrejected articles found in categories: {', '.join(self.categories)}")
+        return candidates
+
+    async def _race_candidates(self, titles: list[str]) -> tuple[str, str]:
+        """Fetch candidates concurrently and return the first suitable article."""
+        tasks = [asyncio.create_task(self._fetch_article(title)) for title in titles]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result:
+                    return result
+        finally:
+            for task in tasks:
+                task.cancel()
         return None
 
     async def get_random_article(self) -> None:
         """Fetch and store text content from a random Wikipedia article."""
         logger.info("Fetching random Wikipedia article")
-        
-        categories = ['Pirates', 'Association_football', 'Basketball', 'Artificial_intelligence', 'Personal_finance']
+
         max_retries = 10
         attempts = 0
-        
+
         while attempts < max_retries:
+            batch_size = min(self.max_parallel_candidates, max_retries - attempts)
             try:
-                # Get a random category and article
-                random_category = random.choice(categories)
-                logger.info(f"Trying category: {random_category}")
-                
-                article_title = self._get_random_article_from_category(random_category)
-                if not article_title:
-                    logger.warning(f"No articles found in category: {random_category}")
-                    attempts += 1
-                    continue
-                
-                page = self.wiki.page(article_title)
-                
-                # If we got a valid page with enough content
-                if (page and page.exists() and 
-                    len(page.text) > 1000 and 
-                    not page.title.lower().endswith('(disambiguation)')):
-                    logger.info(f"Selected article: {page.title}")
-                    self.article_text = page.text
-                    self.article_title = page.title
+                candidates = await self._pick_candidates(batch_size)
+                result = await self._race_candidates(candidates) if candidates else None
+                if result:
+                    self.article_title, self.article_text = result
+                    if self.dedup_index:
+                        self.dedup_index.reserve_article(self.article_title, self.article_text)
+                    logger.info(f"Selected article: {self.article_title}")
                     return
-                
-                logger.info(f"Skipping incompatible article: {page.title if page else 'None'}")
             except Exception as e:
                 logger.warning(f"Error fetching article: {str(e)}")
-            
-            attempts += 1
-        
+            finally:
+                self.category_index.save()
+
+            attempts += batch_size
+            count("ingestion_retries")
+
         raise Exception(f"Failed to find suitable article after {max_retries} attempts")
@@ -1,21 +1,121 @@
 import logging
+import os
+import re
+from functools import lru_cache
+from typing import Iterator
 import tiktoken
 
 logger = logging.getLogger(__name__)
 
+# "== History ==" headings from the extracts API, or bare title lines from wikipediaapi text
+WIKI_HEADING = re.compile(r"^=+\s*[^=].*?\s*=+$")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+@lru_cache(maxsize=None)
+def get_encoder(model_name: str = "gpt-4"):
+    """Return the tiktoken encoder for a model, loaded once per process."""
+    return tiktoken.encoding_for_model(model_name)
+
+def iter_paragraphs(text: str) -> Iterator[str]:
+    """Yield blank-line separated blocks of text without splitting the whole document up front."""
+    position = 0
+    length = len(text)
+    while position < length:
+        end = text.find("\n\n", position)
+        if end == -1:
+            end = length
+        paragraph = text[position:end].strip()
+        if paragraph:
+            yield paragraph
+        position = end + 2
+
+def starts_section(paragraph: str) -> bool:
+    """Whether a block opens a new Wikipedia section."""
+    first_line, _, rest = paragraph.partition("\n")
+    first_line = first_line.strip()
+    if WIKI_HEADING.match(first_line):
+        return True
+    # wikipediaapi puts the bare section title on the line above the section text
+    return bool(rest) and len(first_line) < 80 and not first_line.endswith((".", ":", ";", "!", "?", ","))
+
 class ArticleProcessor:
-    def __init__(self):
-        self.encoder = tiktoken.encoding_for_model("gpt-4")
+    def __init__(self, encoder=None, target_tokens: int = None, overlap_tokens: int = None):
+        self.encoder = encoder or get_encoder()
         self.max_tokens = 30000
+        # Chunks aim for target_tokens and repeat up to overlap_tokens of trailing context
+        self.target_tokens = min(target_tokens or int(os.getenv('CHUNK_TARGET_TOKENS', '2000')), self.max_tokens)
+        self.overlap_tokens = overlap_tokens if overlap_tokens is not None else int(os.getenv('CHUNK_OVERLAP_TOKENS', '100'))
         self.chunks = []
+        self.chunk_token_counts = []
+        # Tokens of the article itself, without the overlap repeated across chunks
+        self.article_tokens = 0
 
-    def process_text(self, text: str) -> None:
-        """Split text into chunks that fit within token limits."""
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoder.encode(text))
+
+    def _split_oversized(self, paragraph: str, tokens: int) -> Iterator[tuple[str, int]]:
+        """Split a paragraph larger than the target on sentence boundaries, or on tokens as a last resort."""
+        if tokens <= self.target_tokens:
+            yield paragraph, tokens
+            return
+        sentences = SENTENCE_END.split(paragraph)
+        if len(sentences) == 1:
+            encoded = self.encoder.encode(paragraph)
+            for i in range(0, len(encoded), self.target_tokens):
+                window = encoded[i:i + self.target_tokens]
+                yield self.encoder.decode(window), len(window)
+            return
+        for sentence in sentences:
+            yield from self._split_oversized(sentence, self.count_tokens(sentence))
+
+    def iter_chunks(self, text: str) -> Iterator[str]:
+        """Yield chunks of about target_tokens, split on section and paragraph boundaries.
+
+        Tokens are counted per paragraph as it is read, so the document is
+        never encoded as a whole and callers can start on the first chunk
+        before the rest are cut. A new section starts a new chunk once the
+        current one is at least half full; otherwise chunks carry over the
+        trailing paragraphs that fit in overlap_tokens.
+        """
         logger.info(f"Processing text of length {len(text)}")
-        tokens = self.encoder.encode(text)
-        self.chunks = [
-            self.encoder.decode(tokens[i:i + self.max_tokens])
-            for i in range(0, len(tokens), self.max_tokens)
-        ]
+        self.chunks = []
+        self.chunk_token_counts = []
+        self.article_tokens = 0
+        current = []  # (paragraph, tokens)
+        current_tokens = 0
+
+        def emit():
+            chunk = "\n\n".join(paragraph for paragraph, _ in current)
+            self.chunks.append(chunk)
+            self.chunk_token_counts.append(current_tokens)
+            return chunk
+
+        for block in iter_paragraphs(text):
+            if current and current_tokens >= self.target_tokens // 2 and starts_section(block):
+                yield emit()
+                current, current_tokens = [], 0
+
+            for piece, tokens in self._split_oversized(block, self.count_tokens(block)):
+                if current and current_tokens + tokens > self.target_tokens:
+                    yield emit()
+                    # Carry trailing paragraphs over as context, leaving room for the new piece
+                    budget = min(self.overlap_tokens, self.target_tokens - tokens)
+                    overlap, overlap_tokens = [], 0
+                    for paragraph, paragraph_tokens in reversed(current):
+                        if overlap_tokens + paragraph_tokens > budget:
+                            break
+                        overlap.insert(0, (paragraph, paragraph_tokens))
+                        overlap_tokens += paragraph_tokens
+                    current, current_tokens = overlap, overlap_tokens
+                current.append((piece, tokens))
+                current_tokens += tokens
+                self.article_tokens += tokens
+
+        if current:
+            yield emit()
         logger.info(f"Split into {len(self.chunks)} chunks")
 
+    def process_text(self, text: str) -> None:
+        """Split text into chunks that fit within token limits."""
+        for _ in self.iter_chunks(text):
+            pass
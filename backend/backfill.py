@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import logging
+import os
+from datetime import date, timedelta
+from sqlalchemy.exc import IntegrityError
+from .app import app_context, db, DailyQuestions
+from .article_ingestion import create_article_ingestion, create_http_session
+from .article_processor import ArticleProcessor, get_encoder
+from .category_index import CategoryIndex
+from .dedup_index import dedup_index
+from .instrumentation import Trace, trace
+from .question_generator import QuestionGenerator, build_questions_data, create_chat_model, daily_rows
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def date_range(start: date, end: date) -> list[date]:
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+def stored_dates(start: date, end: date) -> set[date]:
+    with app_context():
+        return {
+            row.date for row in DailyQuestions.query
+            .with_entities(DailyQuestions.date)
+            .filter(DailyQuestions.date >= start, DailyQuestions.date <= end)
+        }
+
+def write_batch(batch: list[tuple[date, dict, Trace]]) -> int:
+    """Store a batch of generated days and their traces in one transaction, skipping days stored meanwhile."""
+    with app_context():
+        taken = stored_dates(min(day for day, _, _ in batch), max(day for day, _, _ in batch))
+        days = [(day, data, run) for day, data, run in batch if day not in taken]
+        try:
+            db.session.add_all([row for day, data, run in days for row in daily_rows(day, data, run)])
+            db.session.commit()
+            return len(days)
+        except IntegrityError:
+            # Another generator stored one of these days; fall back to one row per transaction
+            db.session.rollback()
+            written = 0
+            for day, data, run in batch:
+                try:
+                    db.session.add_all(daily_rows(day, data, run))
+                    db.session.commit()
+                    written += 1
+                except IntegrityError:
+                    db.session.rollback()
+            return written
+
+def release_articles(batch: list, stored: bool) -> None:
+    """Drop the dedup reservations of a batch's articles once it is written or has failed."""
+    for _, data, _ in batch:
+        dedup_index.release_article(data['source']['title'], stored)
+
+def refresh_dedup_index() -> None:
+    """Pick up the questions just stored so later days in the run avoid them."""
+    with app_context():
+        dedup_index.refresh()
+
+async def backfill(start: date, end: date, workers: int = 8, max_in_flight: int = 16,
+                   batch_size: int = 10) -> dict:
+    """Generate questions for every missing day in [start, end].
+
+    Days already stored are skipped, so re-running the same range resumes
+    where an interrupted run stopped. Workers share one chat model, one
+    tokenizer, one HTTP session, one category index and one dedup index,
+    and a single semaphore caps LLM calls in flight across all of them.
+    """
+    done = stored_dates(start, end)
+    pending = [day for day in date_range(start, end) if day not in done]
+    logger.info(f"Backfilling {len(pending)} missing days between {start} and {end}")
+    if not pending:
+        return {"generated": 0, "failed": []}
+
+    refresh_dedup_index()
+    model = create_chat_model()
+    encoder = get_encoder()
+    category_index = CategoryIndex()
+    llm_semaphore = asyncio.Semaphore(max_in_flight)
+    session = create_http_session(limit=workers * 4)
+    queue = asyncio.Queue()
+    for day in pending:
+        queue.put_nowait(day)
+
+    batch = []
+    failed = []
+    generated = 0
+    # Batches are written one at a time, each followed by its dedup refresh
+    write_lock = asyncio.Lock()
+
+    async def flush() -> None:
+        """Store the pending batch; a batch that cannot be written is reported as failed, day by day."""
+        nonlocal batch, generated
+        if batch:
+            to_write, batch = batch, []
+            async with write_lock:
+                try:
+                    written = await asyncio.to_thread(write_batch, to_write)
+                except Exception as e:
+                    logger.error(f"Failed to store {len(to_write)} days: {str(e)}")
+                    failed.extend(day for day, _, _ in to_write)
+                    release_articles(to_write, stored=False)
+                    return
+                release_articles(to_write, stored=True)
+                try:
+                    await asyncio.to_thread(refresh_dedup_index)
+                except Exception as e:
+                    logger.error(f"Failed to refresh the dedup index: {str(e)}")
+            generated += written
+            logger.info(f"Stored {written} days ({generated}/{len(pending)} done)")
+
+    async def worker() -> None:
+        while True:
+            try:
+                day = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            question_gen = QuestionGenerator(
+                model=model,
+                llm_semaphore=llm_semaphore,
+                article_ingestion=create_article_ingestion(dedup_index, session=session,
+                                                           category_index=category_index),
+                article_processor=ArticleProcessor(encoder=encoder),
+                dedup_index=dedup_index
+            )
+            try:
+                with trace(f"backfill {day}") as run:
+                    data = await build_questions_data(question_gen)
+            except Exception as e:
+                logger.error(f"Failed to generate questions for {day}: {str(e)}")
+                dedup_index.release_article(question_gen.article_ingestion.article_title, stored=False)
+                failed.append(day)
+                continue
+            batch.append((day, data, run))
+            if len(batch) >= batch_size:
+                await flush()
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        await flush()
+    finally:
+        await session.close()
+        category_index.save()
+
+    logger.info(f"Backfill finished: {generated} days stored, {len(failed)} failed")
+    return {"generated": generated, "failed": sorted(failed)}
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate daily questions for a range of dates.")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="First date (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, required=True, help="Last date, inclusive (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv('BACKFILL_WORKERS', '8')),
+                        help="Days generated concurrently")
+    parser.add_argument("--max-in-flight", type=int, default=int(os.getenv('BACKFILL_MAX_IN_FLIGHT', '16')),
+                        help="LLM calls in flight across all workers")
+    parser.add_argument("--batch-size", type=int, default=10, help="Days stored per transaction")
+    args = parser.parse_args(argv)
+    if args.end < args.start:
+        parser.error("--end must not be before --start")
+
+    result = asyncio.run(backfill(args.start, args.end, args.workers, args.max_in_flight, args.batch_size))
+    if result["failed"]:
+        logger.warning(f"Days that failed and can be retried by re-running: {', '.join(str(d) for d in result['failed'])}")
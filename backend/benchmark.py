@@ -0,0 +1,461 @@
+import argparse
+import asyncio
+import http.client
+import json
+import logging
+import math
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+import bcrypt
+from langchain_core.messages import AIMessage, AIMessageChunk
+from sqlalchemy import insert
+from werkzeug.serving import WSGIRequestHandler, make_server
+from . import article_processor as article_processor_module
+from . import question_generator as question_generator_module
+from .app import (db, DailyQuestions, DailyScoreCount, GenerationTrace, Score, User, UserStats, get_app,
+                  password_hasher, rebuild_score_summaries)
+from .article_processor import ArticleProcessor
+from .instrumentation import record_tokens
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ARTICLES = [os.path.join(os.path.dirname(__file__), "tests", "test_data", "raw_scraped.txt")]
+# Copies of each fixture article concatenated into one, so every generation strategy gets exercised
+ARTICLE_SIZES = {"short": 1, "medium": 4, "long": 16}
+# Generated days start here, well clear of the dates players use
+FIRST_GENERATED_DAY = date(2000, 1, 1)
+QUESTION_COUNT = re.compile(r"Generate exactly (\d+) questions")
+WORD = re.compile(r"[A-Za-z]{4,}")
+
+class WhitespaceEncoder:
+    """One token per whitespace-separated word, for machines without the tiktoken BPE files."""
+
+    def encode(self, text: str) -> list:
+        return text.split()
+
+    def decode(self, tokens: list) -> str:
+        return " ".join(tokens)
+
+def benchmark_encoder():
+    """The real tokenizer when its files are cached locally, else a whitespace stand-in."""
+    try:
+        return article_processor_module.get_encoder()
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable offline ({type(e).__name__}); counting whitespace tokens instead")
+        return WhitespaceEncoder()
+
+def read_fixture(path: str) -> tuple[str, str]:
+    """(title, text) of a raw_scraped.txt-style file: a Title line, a URL line, a blank line, then the text."""
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    title = lines[0].removeprefix("Title:").strip() if lines and lines[0].startswith("Title:") else os.path.basename(path)
+    return title, "".join(lines[3:] if lines and lines[0].startswith("Title:") else lines)
+
+class FakeChatModel:
+    """Offline chat model answering synthesis and quiz prompts after a latency that grows with output length.
+
+    Quiz answers are valid question sets with the number of questions the
+    prompt asks for, worded from the prompt so days never repeat each
+    other. Token counts are charged to the current span like real calls.
+    """
+
+    def __init__(self, encoder, latency: float = 0.02, seconds_per_token: float = 0.0001,
+                 completion_tokens: int = 300, seed: int = 0):
+        self.encoder = encoder
+        self.latency = latency
+        self.seconds_per_token = seconds_per_token
+        self.completion_tokens = completion_tokens
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def _answer(self, messages) -> str:
+        system, human = messages[0].content, messages[-1].content
+        words = WORD.findall(human) or ["trivia"]
+        if system.startswith("Synthesize"):
+            facts = max(1, self.completion_tokens // 25)
+            return "\n".join(
+                f"{i + 1}. " + " ".join(self.random.choice(words) for _ in range(20)) for i in range(facts)
+            )
+        match = QUESTION_COUNT.search(system)
+        count = int(match.group(1)) if match else 4
+        return json.dumps({"questions": [{
+            "text": " ".join(self.random.choice(words) for _ in range(8)) + f" {self.random.randrange(10 ** 9)}?",
+            "answers": [{"text": " ".join(self.random.choice(words) for _ in range(6)), "is_correct": i == 0}
+                        for i in range(4)],
+        } for _ in range(count)]})
+
+    async def _respond(self, messages) -> str:
+        self.calls += 1
+        content = self._answer(messages)
+        prompt_tokens = sum(len(self.encoder.encode(str(message.content))) for message in messages)
+        await asyncio.sleep(self.latency + self.completion_tokens * self.seconds_per_token)
+        record_tokens(prompt_tokens, self.completion_tokens)
+        return content
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        return AIMessage(content=await self._respond(messages))
+
+    async def astream(self, messages, config=None, **kwargs):
+        content = await self._respond(messages)
+        for start in range(0, len(content), 64):
+            yield AIMessageChunk(content=content[start:start + 64])
+
+class FixtureArticleIngestion:
+    """Serves a fixture article in place of Wikipedia after a simulated fetch latency."""
+
+    def __init__(self, title: str, text: str, latency: float = 0.0):
+        self.title = title
+        self.text = text
+        self.latency = latency
+        self.article_title = ""
+        self.article_text = ""
+
+    async def get_random_article(self) -> None:
+        await asyncio.sleep(self.latency)
+        self.article_title, self.article_text = self.title, self.text
+
+    async def close(self) -> None:
+        pass
+
+def percentile(ordered: list[float], percent: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered), max(1, math.ceil(percent / 100 * len(ordered)))) - 1]
+
+def latency_summary(latencies: list[float], elapsed: float, errors: int = 0) -> dict:
+    """Throughput and latency percentiles, in milliseconds, of a set of timed operations."""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "requests_per_second": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p90_ms": round(percentile(ordered, 90) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+def bench_chunking(articles: list[tuple[str, str]], encoder, runs: int) -> dict:
+    """Chunking throughput of ArticleProcessor over each article size."""
+    results = {}
+    for size, copies in ARTICLE_SIZES.items():
+        text = "\n\n".join(article_text for _, article_text in articles for _ in range(copies))
+        timings = []
+        for _ in range(runs):
+            processor = ArticleProcessor(encoder=encoder)
+            started = time.perf_counter()
+            processor.process_text(text)
+            timings.append(time.perf_counter() - started)
+        median = statistics.median(timings)
+        tokens = sum(processor.chunk_token_counts)
+        results[size] = {
+            "characters": len(text),
+            "chunks": len(processor.chunks),
+            "p50_ms": round(median * 1000, 3),
+            "megabytes_per_second": round(len(text.encode('utf-8')) / median / 1e6, 2),
+            "tokens_per_second": round(tokens / median),
+        }
+    return results
+
+async def bench_generation(articles: list[tuple[str, str]], encoder, runs: int, llm_options: dict,
+                           fetch_latency: float) -> dict:
+    """End-to-end generate_daily_questions per article size, with each run's stages read from its stored trace."""
+    results = {}
+    day = FIRST_GENERATED_DAY
+    with get_app().app_context():
+        day = max(day, (db.session.query(db.func.max(DailyQuestions.date)).scalar() or day) + timedelta(days=1))
+    for size, copies in ARTICLE_SIZES.items():
+        title = f"{articles[0][0]} ({size})"
+        text = "\n\n".join(article_text for _, article_text in articles for _ in range(copies))
+        model = FakeChatModel(encoder, **llm_options)
+        timings, traces = [], []
+        with mock.patch.object(question_generator_module, 'create_chat_model', lambda: model), \
+                mock.patch.object(question_generator_module, 'create_article_ingestion',
+                                  lambda dedup_index=None: FixtureArticleIngestion(title, text, fetch_latency)):
+            for _ in range(runs):
+                started = time.perf_counter()
+                await question_generator_module.generate_daily_questions(day)
+                timings.append(time.perf_counter() - started)
+                with get_app().app_context():
+                    traces.append(json.loads(db.session.query(GenerationTrace.trace).filter_by(date=day).scalar()))
+                day += timedelta(days=1)
+        stages = {}
+        for trace in traces:
+            for stage, totals in trace["stages"].items():
+                stages.setdefault(stage, []).append(totals["total_ms"])
+        generation = next((span for span in traces[0]["spans"] if span["name"] == "generation"), {})
+        summary = latency_summary(timings, sum(timings))
+        results[size] = {
+            **{key: summary[key] for key in ("mean_ms", "p50_ms", "max_ms")},
+            "strategy": generation.get("strategy", "per_chunk"),
+            "llm_calls": statistics.fmean(trace["totals"].get("llm_calls", 0) for trace in traces),
+            "prompt_tokens": statistics.fmean(trace["totals"].get("prompt_tokens", 0) for trace in traces),
+            "completion_tokens": statistics.fmean(trace["totals"].get("completion_tokens", 0) for trace in traces),
+            "stages_ms": {stage: round(statistics.fmean(values), 3) for stage, values in stages.items()},
+        }
+    return results
+
+class QuietRequestHandler(WSGIRequestHandler):
+    # Keep-alive connections, as browsers use, and no access log per request
+    protocol_version = "HTTP/1.1"
+
+    def log_request(self, *args, **kwargs) -> None:
+        pass
+
+class Player:
+    """One simulated player: a keep-alive connection carrying that player's session cookie."""
+
+    def __init__(self, port: int, username: str):
+        self.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        self.username = username
+        self.cookie = None
+
+    def request(self, method: str, path: str, body: dict = None) -> int:
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.connection.request(method, path, body=payload, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        for cookie in response.headers.get_all('Set-Cookie') or []:
+            if cookie.startswith('session='):
+                self.cookie = cookie.split(';', 1)[0]
+        return response.status
+
+    def close(self) -> None:
+        self.connection.close()
+
+def run_players(players: list[Player], concurrency: int, requests: list) -> dict:
+    """Send (player, method, path, body) requests from concurrency threads, each player used by one thread."""
+    slots = {id(player): i % concurrency for i, player in enumerate(players)}
+    queues = [[] for _ in range(concurrency)]
+    for request in requests:
+        queues[slots[id(request[0])]].append(request)
+    latencies, errors = [], []
+
+    def client(queue: list) -> None:
+        timings, failed = [], 0
+        for player, method, path, body in queue:
+            started = time.perf_counter()
+            status = player.request(method, path, body)
+            timings.append(time.perf_counter() - started)
+            failed += status >= 400
+        latencies.extend(timings)
+        errors.append(failed)
+
+    threads = [threading.Thread(target=client, args=(queue,)) for queue in queues if queue]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latency_summary(latencies, time.perf_counter() - started, sum(errors))
+
+def seed_players(count: int, history_days: int, today: date) -> list[str]:
+    """Create players with history_days of past scores each, plus today's questions."""
+    password = bcrypt.hashpw(b"secret", bcrypt.gensalt(4))
+    usernames = [f"bench_player_{i}" for i in range(count)]
+    db.session.execute(insert(User), [{'username': name, 'password': password} for name in usernames])
+    user_ids = [row.id for row in db.session.query(User.id).filter(User.username.in_(usernames))]
+    rng = random.Random(0)
+    rows = [{'user_id': user_id, 'score': rng.randint(0, 4), 'date': today - timedelta(days=offset)}
+            for user_id in user_ids for offset in range(1, history_days + 1) if rng.random() < 0.8]
+    for start in range(0, len(rows), 5000):
+        db.session.execute(insert(Score), rows[start:start + 5000])
+    question = {"text": "Which club won the first FA Cup?",
+                "answers": [{"text": name, "is_correct": i == 0}
+                            for i, name in enumerate(["Wanderers", "Royal Engineers", "Old Etonians", "Queen's Park"])]}
+    db.session.merge(DailyQuestions(date=today, questions=json.dumps({
+        "questions": [question] * 4, "source": {"title": "Association football", "preview": "..."}
+    })))
+    db.session.commit()
+    rebuild_score_summaries()
+    return usernames
+
+def bench_http(player_count: int, concurrency: int, request_count: int, history_days: int, submit_rounds: int) -> dict:
+    """Requests per second and latency percentiles of the hot routes under concurrent simulated players."""
+    flask_app = get_app()
+    today = date.today()
+    # Players sign in with a cheap hash; sign-in cost is benchmarked by the password hasher itself
+    password_hasher.rounds = 4
+    with flask_app.app_context():
+        usernames = seed_players(player_count, history_days, today)
+        stats_snapshot = [
+            {column.name: getattr(row, column.name) for column in UserStats.__table__.columns}
+            for row in UserStats.query
+        ]
+
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True, request_handler=QuietRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    players = [Player(server.server_port, username) for username in usernames]
+    try:
+        for player in players:
+            player.request('POST', '/login', {'username': player.username, 'password': 'secret'})
+
+        def reads(path: str) -> list:
+            return [(players[i % len(players)], 'GET', path, None) for i in range(request_count)]
+
+        results = {
+            '/get_questions': run_players(players, concurrency, reads('/get_questions')),
+            '/get_user_scores': run_players(players, concurrency, reads('/get_user_scores')),
+            '/score_history': run_players(players, concurrency, reads('/score_history')),
+        }
+        # Each player can submit once a day, so every round clears today's scores first
+        rounds = []
+        for _ in range(submit_rounds):
+            with flask_app.app_context():
+                db.session.query(Score).filter(Score.date == today).delete()
+                db.session.query(DailyScoreCount).filter(DailyScoreCount.date == today).delete()
+                db.session.query(UserStats).delete()
+                if stats_snapshot:
+                    db.session.execute(insert(UserStats), stats_snapshot)
+                db.session.commit()
+            submits = [(player, 'POST', '/submit_score', {'score': i % 5}) for i, player in enumerate(players)]
+            rounds.append(run_players(players, concurrency, submits))
+        if rounds:
+            results['/submit_score'] = min(rounds, key=lambda result: result['p50_ms'])
+        return results
+    finally:
+        for player in players:
+            player.close()
+        server.shutdown()
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=PROJECT_ROOT, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """Numeric leaves of the results keyed by dotted path, for comparing runs."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare(previous: dict, current: dict, max_regression: float = None) -> tuple[list[str], list[str]]:
+    """Percent change of every timing, throughput and token metric, and those worse than max_regression."""
+    lines, regressions = [], []
+    for name, value in current.items():
+        old = previous.get(name)
+        if not old or not name.endswith(("_ms", "_per_second", "_tokens")):
+            continue
+        change = (value - old) / old * 100
+        # Throughput regresses when it drops; times and token counts when they grow
+        worse = -change if name.endswith("_per_second") else change
+        line = f"{name}: {old} -> {value} ({change:+.1f}%)"
+        lines.append(line)
+        if max_regression is not None and worse > max_regression:
+            regressions.append(line)
+    return lines, regressions
+
+def run(args) -> dict:
+    articles = [read_fixture(path) for path in args.articles]
+    encoder = benchmark_encoder()
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "encoder": "whitespace" if isinstance(encoder, WhitespaceEncoder) else "tiktoken",
+            "database": get_app().config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+    }
+    with get_app().app_context():
+        db.create_all()
+    suites = set(args.suites.split(","))
+    if "chunking" in suites:
+        logger.info("Benchmarking chunking")
+        results["chunking"] = bench_chunking(articles, encoder, args.chunking_runs)
+    if "generation" in suites:
+        logger.info("Benchmarking generation")
+        llm_options = {"latency": args.llm_latency_ms / 1000, "seconds_per_token": args.llm_ms_per_token / 1000,
+                       "completion_tokens": args.llm_completion_tokens}
+        # The tokenizer is swapped in here too, so generation never reaches for the network
+        with mock.patch.object(article_processor_module, 'get_encoder', lambda model_name="gpt-4": encoder):
+            results["generation"] = asyncio.run(bench_generation(
+                articles, encoder, args.generation_runs, llm_options, args.fetch_latency_ms / 1000
+            ))
+    if "http" in suites:
+        logger.info("Benchmarking HTTP routes")
+        results["http"] = bench_http(args.players, args.concurrency, args.requests, args.history_days,
+                                     args.submit_rounds)
+    results["metrics"] = flatten({key: value for key, value in results.items() if key != "meta"})
+    return results
+
+def main(argv: list[str] = None) -> int:
+    # Only the benchmark's own progress; the pipeline's per-chunk logging would drown it out
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(description="Run the offline generation and HTTP benchmarks, writing JSON results.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results")
+    parser.add_argument("--compare", default=None, help="Earlier results file to report changes against")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="Exit with status 1 if any metric is this many percent worse than --compare")
+    parser.add_argument("--suites", default="chunking,generation,http", help="Comma-separated suites to run")
+    parser.add_argument("--articles", nargs="+", default=DEFAULT_ARTICLES, help="raw_scraped.txt-style fixture articles")
+    parser.add_argument("--database-url", default=None, help="Database to use (default a fresh SQLite file)")
+    parser.add_argument("--chunking-runs", type=int, default=5)
+    parser.add_argument("--generation-runs", type=int, default=3, help="Days generated per article size")
+    parser.add_argument("--llm-latency-ms", type=float, default=20, help="Fixed latency of each fake LLM call")
+    parser.add_argument("--llm-ms-per-token", type=float, default=0.1, help="Added latency per completion token")
+    parser.add_argument("--llm-completion-tokens", type=int, default=300, help="Completion tokens per fake LLM call")
+    parser.add_argument("--fetch-latency-ms", type=float, default=50, help="Simulated article fetch latency")
+    parser.add_argument("--players", type=int, default=50, help="Simulated players")
+    parser.add_argument("--concurrency", type=int, default=8, help="Players sending requests at once")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per read route")
+    parser.add_argument("--history-days", type=int, default=365, help="Past days of scores per player")
+    parser.add_argument("--submit-rounds", type=int, default=3, help="Rounds of every player submitting once")
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    elif get_app.cache_info().currsize == 0:
+        directory = tempfile.mkdtemp(prefix="trivia-benchmark-")
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'benchmark.sqlite3')}"
+    results = run(args)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Wrote results to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous.get("meta", {}).get("config") != results["meta"]["config"]:
+            logger.warning(f"{args.compare} was run with different settings; changes may not be regressions")
+        lines, regressions = compare(previous.get("metrics", {}), results["metrics"], args.max_regression)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.max_regression}%:", file=sys.stderr)
+            print("\n".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(__file__), "data", "category_index.json")
+
+class CategoryIndex:
+    """On-disk index of category members and of titles known to be unsuitable.
+
+    Members are paged in full via cmcontinue on first use and afterwards
+    refreshed incrementally (members added since the newest timestamp seen)
+    once the TTL expires, so picking a candidate is an in-memory sample.
+    Incremental refreshes never see removals, so every full_refresh_seconds
+    the category is paged in full again and members missing from that
+    pass are dropped.
+    """
+
+    def __init__(self, path: str = None, ttl_seconds: int = None, full_refresh_seconds: int = None):
+        self.path = path or os.getenv('CATEGORY_INDEX_PATH', DEFAULT_INDEX_PATH)
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(os.getenv('CATEGORY_INDEX_TTL_SECONDS', str(24 * 60 * 60)))
+        self.full_refresh_seconds = full_refresh_seconds if full_refresh_seconds is not None else int(
+            os.getenv('CATEGORY_INDEX_FULL_REFRESH_SECONDS', str(7 * 24 * 60 * 60)))
+        self.categories = {}
+        self.rejected = set()
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        """Load the index from disk, starting empty if it is missing or unreadable."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.categories = data.get("categories", {})
+            self.rejected = set(data.get("rejected", []))
+            logger.info(f"Loaded category index with {len(self.categories)} categories from {self.path}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable category index {self.path}: {str(e)}")
+
+    def save(self) -> None:
+        """Atomically write the index to disk if it changed."""
+        if not self._dirty:
+            return
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        data = {"categories": self.categories, "rejected": sorted(self.rejected)}
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".category_index.")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        self._dirty = False
+
+    def is_stale(self, category: str) -> bool:
+        entry = self.categories.get(category)
+        return entry is None or time.time() - entry["fetched_at"] > self.ttl_seconds
+
+    async def refresh(self, category: str, api_get: Callable[[dict], Awaitable[dict]]) -> None:
+        """Fetch category members added since the last refresh, or all of them when a full pass is due."""
+        entry = self.categories.get(category) or {"members": [], "last_timestamp": None, "fetched_at": 0}
+        full = not entry["last_timestamp"] or time.time() - entry.get("full_at", 0) > self.full_refresh_seconds
+        params = {
+            "action": "query",
+            "list": "categorymembers",
+            "cmtitle": f"Category:{category}",
+            "cmtype": "page",
+            "cmprop": "title|timestamp",
+            "cmsort": "timestamp",
+            "cmdir": "ascending",
+            "cmlimit": "500"
+        }
+        if not full:
+            params["cmstart"] = entry["last_timestamp"]
+
+        # A full pass starts empty, so pages removed from the category drop out
+        members = {} if full else dict.fromkeys(entry["members"])
+        last_timestamp = None if full else entry["last_timestamp"]
+        pages = 0
+        while True:
+            data = await api_get(params)
+            pages += 1
+            for member in data.get("query", {}).get("categorymembers", []):
+                members[member["title"]] = None
+                if member.get("timestamp") and (last_timestamp is None or member["timestamp"] > last_timestamp):
+                    last_timestamp = member["timestamp"]
+            if "continue" not in data:
+                break
+            params.update(data["continue"])
+
+        previous = set(entry["members"])
+        added = len(members.keys() - previous)
+        removed = len(previous - members.keys())
+        now = time.time()
+        self.categories[category] = {
+            "members": list(members),
+            "last_timestamp": last_timestamp,
+            "fetched_at": now,
+            "full_at": now if full else entry.get("full_at", 0)
+        }
+        self._dirty = True
+        logger.info(f"Refreshed category {category}: {added} new and {removed} removed members over {pages} pages, "
+                    f"{len(members)} total")
+
+    def mark_rejected(self, title: str) -> None:
+        """Remember that a title failed the article filters so it is never fetched again."""
+        if title not in self.rejected:
+            self.rejected.add(title)
+            self._dirty = True
+
+    def sample(self, categories: list[str], count: int, skip: Callable[[str], bool] = None) -> list[str]:
+        """Pick up to count distinct, not-rejected titles, choosing a random category for each.
+
+        Titles for which skip returns True, such as ones already used, are left out too.
+        """
+        pools = {
+            category: [t for t in self.categories.get(category, {}).get("members", [])
+                       if t not in self.rejected and not (skip and skip(t))]
+            for category in categories
+        }
+        candidates = []
+        for _ in range(count):
+            available = [c for c in categories if any(t not in candidates for t in pools[c])]
+            if not available:
+                break
+            category = random.choice(available)
+            candidates.append(random.choice([t for t in pools[category] if t not in candidates]))
+        return candidates
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from array import array
+from datetime import date
+from .app import ArticleSignature, DailyQuestions, db
+
+logger = logging.getLogger(__name__)
+
+NUM_HASHES = 64
+BANDS = 16     # LSH bands of NUM_HASHES // BANDS rows; pairs above about 0.5 similarity share a band
+EMPTY = (1 << 64) - 1
+WORD = re.compile(r"\w+")
+
+def normalize_title(title: str) -> str:
+    return title.replace("_", " ").strip().casefold()
+
+def word_shingles(text: str, size: int = 5) -> set[str]:
+    """Overlapping runs of size words, for comparing long texts."""
+    words = WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def char_shingles(text: str, size: int = 4) -> set[str]:
+    """Overlapping runs of size characters of the normalized text, for comparing short texts."""
+    text = " ".join(WORD.findall(text.lower()))
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def minhash(shingles: set[str]) -> tuple[int, ...]:
+    """One-permutation MinHash signature of NUM_HASHES values.
+
+    Each shingle is hashed once and only the smallest hash per bin is
+    kept, so signing an article costs one pass over its shingles rather
+    than one per hash function. Empty bins borrow from the next full one,
+    which keeps the signatures of similar sets aligned.
+    """
+    bins = [EMPTY] * NUM_HASHES
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        slot = value % NUM_HASHES
+        value //= NUM_HASHES
+        if value < bins[slot]:
+            bins[slot] = value
+    if all(value == EMPTY for value in bins):
+        return tuple(bins)
+    for i in range(NUM_HASHES):
+        offset = 1
+        while bins[i] == EMPTY:
+            source = bins[(i + offset) % NUM_HASHES]
+            if source != EMPTY:
+                bins[i] = source + offset  # keep borrowed values distinct per distance
+            offset += 1
+    return tuple(bins)
+
+def similarity(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+class SignatureIndex:
+    """Locality-sensitive hash buckets over MinHash signatures.
+
+    A query only compares against entries sharing at least one band of
+    their signature, so lookups take a few dict probes however many
+    entries there are.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.rows = NUM_HASHES // BANDS
+        self.buckets = [{} for _ in range(BANDS)]
+        self.signatures = {}  # label -> signature
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def _bands(self, signature: tuple[int, ...]):
+        for band in range(BANDS):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def add(self, label: str, signature: tuple[int, ...]) -> None:
+        """Index signature under label, replacing any earlier signature with that label."""
+        if self.signatures.get(label) == signature:
+            return
+        self.remove(label)
+        self.signatures[label] = signature
+        for band, key in self._bands(signature):
+            self.buckets[band].setdefault(key, set()).add(label)
+
+    def remove(self, label: str) -> None:
+        signature = self.signatures.pop(label, None)
+        if signature is None:
+            return
+        for band, key in self._bands(signature):
+            bucket = self.buckets[band][key]
+            bucket.discard(label)
+            if not bucket:
+                del self.buckets[band][key]
+
+    def match(self, signature: tuple[int, ...]):
+        """The label of the most similar entry at or above the threshold, or None."""
+        candidates = set()
+        for band, key in self._bands(signature):
+            candidates.update(self.buckets[band].get(key, ()))
+        best, best_score = None, self.threshold
+        for label in candidates:
+            score = similarity(signature, self.signatures[label])
+            if score >= best_score:
+                best, best_score = label, score
+        return best
+
+class DedupIndex:
+    """Titles, article signatures and question signatures of every stored day.
+
+    Candidates are checked against it before any LLM call: an article is a
+    repeat if its title was used before or its text is a near-duplicate of
+    an earlier article, and a generated question is a repeat if it nearly
+    matches one already stored. refresh() reads only rows added since the
+    last call. Stored days are never removed from the index; reservations
+    last only until their day is stored or fails.
+    """
+
+    def __init__(self, article_threshold: float = None, question_threshold: float = None):
+        self.titles = set()
+        self.articles = SignatureIndex(article_threshold if article_threshold is not None
+                                       else float(os.getenv('ARTICLE_DUPLICATE_THRESHOLD', '0.5')))
+        self.questions = SignatureIndex(question_threshold if question_threshold is not None
+                                        else float(os.getenv('QUESTION_DUPLICATE_THRESHOLD', '0.8')))
+        self.reserved = {}  # normalized title -> signature of articles picked but not yet stored
+        self._lock = threading.Lock()
+        self._last_questions_id = 0
+        self._last_signature_id = 0
+
+    def refresh(self) -> None:
+        """Add the days stored since the last refresh; needs an app context."""
+        with self._lock:
+            rows = db.session.query(DailyQuestions.id, DailyQuestions.questions).filter(
+                DailyQuestions.id > self._last_questions_id
+            ).order_by(DailyQuestions.id)
+            for row in rows:
+                try:
+                    data = json.loads(row.questions)
+                except ValueError:
+                    data = {}
+                self.add_questions(data.get("questions", []))
+                if data.get("source", {}).get("title"):
+                    self.titles.add(normalize_title(data["source"]["title"]))
+                self._last_questions_id = row.id
+            signatures = db.session.query(ArticleSignature).filter(
+                ArticleSignature.id > self._last_signature_id
+            ).order_by(ArticleSignature.id)
+            for row in signatures:
+                self.articles.add(row.title, tuple(array("Q", row.signature)))
+                self._last_signature_id = row.id
+        logger.info(f"Dedup index holds {len(self.titles)} titles, {len(self.articles)} articles "
+                    f"and {len(self.questions)} questions")
+
+    def seen_title(self, title: str) -> bool:
+        key = normalize_title(title)
+        return key in self.titles or key in self.reserved
+
+    def article_repeat(self, title: str, text: str):
+        """The earlier article this one repeats, or None if it is new."""
+        if self.seen_title(title):
+            return title
+        return self.articles.match(minhash(word_shingles(text)))
+
+    def reserve_article(self, title: str, text: str) -> None:
+        """Count a picked article as used, so concurrent generators in this process skip it too."""
+        signature = minhash(word_shingles(text))
+        with self._lock:
+            self.reserved[normalize_title(title)] = signature
+            self.articles.add(title, signature)
+
+    def release_article(self, title: str, stored: bool) -> None:
+        """Drop a reservation once its day is stored or its generation failed.
+
+        A stored article stays excluded as a used title; a failed one can be
+        picked again.
+        """
+        key = normalize_title(title)
+        with self._lock:
+            if self.reserved.pop(key, None) is None:
+                return
+            if stored:
+                self.titles.add(key)
+            else:
+                self.articles.remove(title)
+
+    def signature_row(self, day: date, title: str):
+        """The ArticleSignature to store with a day's questions, if the article was reserved here."""
+        signature = self.reserved.get(normalize_title(title))
+        if signature is None:
+            return None
+        return ArticleSignature(date=day, title=title, signature=array("Q", signature).tobytes())
+
+    def question_repeat(self, question: dict) -> bool:
+        return self.questions.match(minhash(char_shingles(question["text"]))) is not None
+
+    def add_questions(self, questions: list[dict]) -> None:
+        for question in questions:
+            if question.get("text"):
+                self.questions.add(question["text"], minhash(char_shingles(question["text"])))
+
+dedup_index = DedupIndex()
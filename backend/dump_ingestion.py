@@ -0,0 +1,450 @@
+import argparse
+import asyncio
+import bisect
+import bz2
+import heapq
+import logging
+import mmap
+import os
+import random
+import re
+import shutil
+import struct
+import tempfile
+import xml.etree.ElementTree as ElementTree
+from array import array
+from typing import Iterator
+from .article_ingestion import DEFAULT_CATEGORIES, MIN_ARTICLE_LENGTH, is_suitable
+from .instrumentation import count, span
+
+logger = logging.getLogger(__name__)
+
+# Index file layout: header, then fixed-size article records, the titles blob,
+# each article's category ids, the category table sorted by name, the category
+# names blob, and each category's article ids. Integers are little-endian.
+INDEX_MAGIC = b"WIKIDX01"
+HEADER = struct.Struct("<8sII5Q")      # magic, articles, categories, section offsets
+RECORD = struct.Struct("<QIIIHH")      # stream offset, title offset, text length, categories start, title length, category count
+CATEGORY = struct.Struct("<IIII")      # name offset, name length, articles start, article count
+READ_SIZE = 1 << 20
+RUN_SIZE = 1 << 20                     # postings sorted in memory at a time while indexing
+
+CATEGORY_LINK = re.compile(r"\[\[\s*Category\s*:\s*([^\]|]+)", re.IGNORECASE)
+DISAMBIGUATION_TEMPLATE = re.compile(r"\{\{\s*(disambiguation|disambig|dab|hndis|geodis|numberdis)\s*[|}]", re.IGNORECASE)
+HIDDEN_LINK = re.compile(r"^(file|image|category|media):", re.IGNORECASE)
+LENGTH_NOISE = re.compile(r"<!--.*?-->|<ref[^>]*/>|<ref[^>]*>.*?</ref>|\[\[(?:file|image|category|media):[^\]]*\]\]"
+                          r"|\{\|.*?\|\}|'{2,}|<[^>]+>", re.DOTALL | re.IGNORECASE)
+TEMPLATE = re.compile(r"\{\{[^{}]*\}\}")
+
+def category_key(name: str) -> str:
+    """Category names as MediaWiki compares them: spaces for underscores, first letter upper case."""
+    name = name.replace("_", " ").strip()
+    return name[:1].upper() + name[1:]
+
+def _strip_nested(text: str, opening: str, closing: str, keep=None) -> str:
+    """Remove balanced opening...closing spans, replacing each with keep(inner) when given."""
+    out = []
+    depth = 0
+    start = 0
+    position = 0
+    while position < len(text):
+        if text.startswith(opening, position):
+            if depth == 0:
+                out.append(text[start:position])
+                start = position
+            depth += 1
+            position += len(opening)
+        elif depth and text.startswith(closing, position):
+            depth -= 1
+            position += len(closing)
+            if depth == 0:
+                if keep is not None:
+                    out.append(keep(text[start + len(opening):position - len(closing)]))
+                start = position
+        else:
+            position += 1
+    if depth == 0:
+        out.append(text[start:])
+    return "".join(out)
+
+def _link_text(inner: str) -> str:
+    if HIDDEN_LINK.match(inner.strip()):
+        return ""
+    return inner.rsplit("|", 1)[-1]
+
+def wikitext_to_text(wikitext: str) -> str:
+    """Reduce wikitext to plain text with "== Heading ==" lines, like the API's plain-text extracts."""
+    text = re.sub(r"<!--.*?-->", "", wikitext, flags=re.DOTALL)
+    text = re.sub(r"<ref[^>]*/>|<ref[^>]*>.*?</ref>", "", text, flags=re.DOTALL | re.IGNORECASE)
+    text = _strip_nested(text, "{{", "}}")
+    text = _strip_nested(text, "{|", "|}")
+    text = _strip_nested(text, "[[", "]]", keep=_link_text)
+    text = re.sub(r"\[https?://[^\s\]]+\s*([^\]]*)\]", r"\1", text)
+    text = re.sub(r"'{2,}", "", text)
+    text = re.sub(r"<[^>]+>", "", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+def iter_streams(path: str) -> Iterator[tuple[int, bytes]]:
+    """Yield (file offset, decompressed XML) for each bz2 stream of a multistream dump."""
+    with open(path, "rb") as f:
+        decompressor = bz2.BZ2Decompressor()
+        parts = []
+        start = 0
+        position = 0
+        while True:
+            block = f.read(READ_SIZE)
+            if not block:
+                break
+            while block:
+                parts.append(decompressor.decompress(block))
+                if not decompressor.eof:
+                    position += len(block)
+                    break
+                # The stream ended inside this block; the rest belongs to the next one
+                end = position + len(block) - len(decompressor.unused_data)
+                yield start, b"".join(parts)
+                block = decompressor.unused_data
+                start = position = end
+                decompressor = bz2.BZ2Decompressor()
+                parts = []
+
+def read_stream(path: str, offset: int) -> bytes:
+    """Decompress the single bz2 stream starting at offset."""
+    decompressor = bz2.BZ2Decompressor()
+    parts = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while not decompressor.eof:
+            block = f.read(READ_SIZE)
+            if not block:
+                break
+            parts.append(decompressor.decompress(block))
+    return b"".join(parts)
+
+def iter_pages(xml: bytes) -> Iterator[dict]:
+    """Yield main-namespace, non-redirect pages from the XML of one stream as {title, text}."""
+    position = 0
+    while True:
+        start = xml.find(b"<page>", position)
+        if start == -1:
+            return
+        end = xml.find(b"</page>", start)
+        if end == -1:
+            return
+        position = end + len(b"</page>")
+        page = ElementTree.fromstring(xml[start:position])
+        if page.findtext("ns") != "0" or page.find("redirect") is not None:
+            continue
+        yield {"title": page.findtext("title"), "text": page.findtext("revision/text") or ""}
+
+def approximate_text_length(wikitext: str) -> int:
+    """Length of wikitext with templates, references, comments, tags and file and category links cut out.
+
+    A cheap stand-in for len(wikitext_to_text(...)) when indexing a whole
+    dump: each pass is one regex substitution, and templates only need as
+    many passes as they are nested deep. Link brackets and targets are
+    still counted, so it runs a little long.
+    """
+    text = LENGTH_NOISE.sub("", wikitext)
+    removed = 1
+    while removed:
+        text, removed = TEMPLATE.subn("", text)
+    return len(text)
+
+def _write_run(values: list, path: str) -> None:
+    with open(path, "wb") as f:
+        array("Q", values).tofile(f)
+
+def _read_run(path: str) -> Iterator[int]:
+    with open(path, "rb") as f:
+        while True:
+            block = array("Q")
+            block.frombytes(f.read(READ_SIZE))
+            if not block:
+                return
+            yield from block
+
+def build_index(dump_path: str, index_path: str, run_size: int = RUN_SIZE) -> int:
+    """Index every suitable article of a multistream dump, returning how many were indexed.
+
+    Runs once per dump. Each article is stored with the offset of the bz2
+    stream holding it, its title, approximate plain-text length and
+    categories, and each category with the ids of its articles, so picking
+    an article afterwards needs neither a scan nor the API. Only the
+    category names stay in memory: (category, article) postings are
+    written to disk in runs of run_size, sorted and merged.
+    """
+    directory = os.path.dirname(os.path.abspath(index_path))
+    category_ids = {}        # name -> provisional id, in order of first appearance
+    category_sizes = array("I")  # provisional id -> article count
+    count = 0
+    with tempfile.TemporaryDirectory(dir=directory) as work:
+        records = open(os.path.join(work, "records"), "wb")
+        titles = open(os.path.join(work, "titles"), "wb")
+        article_categories = open(os.path.join(work, "categories"), "wb")
+        chunks = []
+        pending = array("Q")  # provisional category id << 32 | article id
+        titles_size = categories_size = 0
+        for offset, xml in iter_streams(dump_path):
+            for page in iter_pages(xml):
+                is_disambiguation = bool(DISAMBIGUATION_TEMPLATE.search(page["text"]))
+                if is_disambiguation or page["title"].lower().endswith("(disambiguation)"):
+                    continue
+                text_length = approximate_text_length(page["text"])
+                if text_length <= MIN_ARTICLE_LENGTH:
+                    continue
+                page_categories = list(dict.fromkeys(category_key(name) for name in CATEGORY_LINK.findall(page["text"])))
+                title = page["title"].encode("utf-8")
+                records.write(RECORD.pack(offset, titles_size, text_length, categories_size,
+                                          len(title), len(page_categories)))
+                titles.write(title)
+                titles_size += len(title)
+                ids = array("I")
+                for name in page_categories:
+                    if name not in category_ids:
+                        category_ids[name] = len(category_sizes)
+                        category_sizes.append(0)
+                    ids.append(category_ids[name])
+                    category_sizes[category_ids[name]] += 1
+                    pending.append(category_ids[name] << 32 | count)
+                ids.tofile(article_categories)
+                categories_size += len(ids)
+                count += 1
+                if len(pending) >= run_size:
+                    chunks.append(os.path.join(work, f"chunk{len(chunks)}"))
+                    with open(chunks[-1], "wb") as f:
+                        pending.tofile(f)
+                    pending = array("Q")
+        records.close()
+        titles.close()
+        article_categories.close()
+
+        # Category ids follow name order so lookups can bisect the table
+        names = sorted(category_ids)
+        final_ids = array("I", [0] * len(names))
+        for final_id, name in enumerate(names):
+            final_ids[category_ids[name]] = final_id
+
+        # Renumber each chunk of postings by final category id and sort it into a run
+        runs = []
+        for chunk in chunks + [None]:
+            if chunk is None:
+                postings = pending
+            else:
+                postings = array("Q")
+                with open(chunk, "rb") as f:
+                    postings.frombytes(f.read())
+                os.unlink(chunk)
+            if postings:
+                runs.append(os.path.join(work, f"run{len(runs)}"))
+                _write_run(sorted(final_ids[value >> 32] << 32 | value & 0xFFFFFFFF for value in postings), runs[-1])
+        del pending, postings
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".dump_index.")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(b"\0" * HEADER.size)
+                with open(os.path.join(work, "records"), "rb") as f:
+                    shutil.copyfileobj(f, out)
+                titles_offset = out.tell()
+                with open(os.path.join(work, "titles"), "rb") as f:
+                    shutil.copyfileobj(f, out)
+                categories_offset = out.tell()
+                with open(os.path.join(work, "categories"), "rb") as f:
+                    while True:
+                        block = array("I")
+                        block.frombytes(f.read(READ_SIZE))
+                        if not block:
+                            break
+                        array("I", (final_ids[i] for i in block)).tofile(out)
+                table_offset = out.tell()
+                encoded = [name.encode("utf-8") for name in names]
+                name_offset = article_start = 0
+                for name, data in zip(names, encoded):
+                    members = category_sizes[category_ids[name]]
+                    out.write(CATEGORY.pack(name_offset, len(data), article_start, members))
+                    name_offset += len(data)
+                    article_start += members
+                names_offset = out.tell()
+                for data in encoded:
+                    out.write(data)
+                postings_offset = out.tell()
+                block = array("I")
+                for value in heapq.merge(*(_read_run(run) for run in runs)):
+                    block.append(value & 0xFFFFFFFF)
+                    if len(block) >= READ_SIZE // 4:
+                        block.tofile(out)
+                        block = array("I")
+                block.tofile(out)
+                out.seek(0)
+                out.write(HEADER.pack(INDEX_MAGIC, count, len(names), titles_offset, categories_offset,
+                                      table_offset, names_offset, postings_offset))
+            os.replace(tmp_path, index_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+    logger.info(f"Indexed {count} articles in {len(names)} categories from {dump_path}")
+    return count
+
+class DumpIndex:
+    """Read-only view of an index built by build_index, memory-mapped rather than loaded."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.article_count, self.category_count, self._titles, self._article_categories,
+         self._category_table, self._category_names, self._postings) = HEADER.unpack_from(self._map, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a dump index")
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __len__(self) -> int:
+        return self.article_count
+
+    def article(self, article_id: int) -> dict:
+        """The stored fields of one article, found by position in the fixed-size record table."""
+        offset, title_offset, text_length, categories_start, title_length, category_count = RECORD.unpack_from(
+            self._map, HEADER.size + article_id * RECORD.size
+        )
+        start = self._titles + title_offset
+        ids = array("I")
+        ids.frombytes(self._map[self._article_categories + categories_start * 4:
+                                self._article_categories + (categories_start + category_count) * 4])
+        return {
+            "stream_offset": offset,
+            "title": self._map[start:start + title_length].decode("utf-8"),
+            "text_length": text_length,
+            "categories": [self._category_name(i) for i in ids],
+        }
+
+    def _category(self, category_id: int) -> tuple:
+        return CATEGORY.unpack_from(self._map, self._category_table + category_id * CATEGORY.size)
+
+    def _category_name(self, category_id: int) -> str:
+        name_offset, name_length, _, _ = self._category(category_id)
+        start = self._category_names + name_offset
+        return self._map[start:start + name_length].decode("utf-8")
+
+    def category_id(self, name: str):
+        """Binary search of the name-sorted category table; None if no indexed article has the category."""
+        key = category_key(name)
+        names = _CategoryNames(self)
+        position = bisect.bisect_left(names, key)
+        if position < self.category_count and names[position] == key:
+            return position
+        return None
+
+    def members(self, category_id: int) -> tuple[int, int]:
+        """(start, count) of a category's run in the postings table."""
+        _, _, start, count = self._category(category_id)
+        return start, count
+
+    def member(self, position: int) -> int:
+        return struct.unpack_from("<I", self._map, self._postings + position * 4)[0]
+
+class _CategoryNames:
+    """Sequence view of category names for bisect, decoding only the entries it touches."""
+
+    def __init__(self, index: DumpIndex):
+        self.index = index
+
+    def __len__(self) -> int:
+        return self.index.category_count
+
+    def __getitem__(self, position: int) -> str:
+        return self.index._category_name(position)
+
+class DumpArticleIngestion:
+    """Article source reading a local multistream pages-articles dump instead of the MediaWiki API.
+
+    Drop-in for ArticleIngestion: get_random_article() fills article_title
+    and article_text. Only articles that passed the length and
+    disambiguation checks are in the index, so a pick is a random number,
+    one record read and the decompression of the stream holding it.
+    Build the index once with `python -m backend.dump_ingestion <dump>`.
+    """
+
+    def __init__(self, dump_path: str = None, index_path: str = None, categories: list[str] = None,
+                 dedup_index=None):
+        self.dump_path = dump_path or os.getenv('WIKIPEDIA_DUMP_PATH')
+        if not self.dump_path:
+            raise ValueError("WIKIPEDIA_DUMP_PATH must point at a multistream pages-articles dump")
+        self.index_path = index_path or os.getenv('WIKIPEDIA_DUMP_INDEX', self.dump_path + ".idx")
+        self.index = DumpIndex(self.index_path)
+        self.article_text = ""
+        self.article_title = ""
+        # The same categories as the API path; an empty list picks from every indexed article
+        self.categories = list(DEFAULT_CATEGORIES) if categories is None else categories
+        self.dedup_index = dedup_index
+
+    async def close(self) -> None:
+        pass
+
+    def _pick(self) -> int:
+        """A random article id from the selected categories, weighted by their sizes."""
+        if not self.categories:
+            if not len(self.index):
+                raise Exception("The dump index holds no suitable articles")
+            return random.randrange(len(self.index))
+        runs = []
+        for category in self.categories:
+            category_id = self.index.category_id(category)
+            if category_id is not None:
+                runs.append(self.index.members(category_id))
+        total = sum(count for _, count in runs)
+        if not total:
+            raise Exception(f"No indexed articles found in categories: {', '.join(self.categories)}")
+        position = random.randrange(total)
+        for start, count in runs:
+            if position < count:
+                return self.index.member(start + position)
+            position -= count
+
+    def _load(self, article_id: int) -> tuple[str, str]:
+        article = self.index.article(article_id)
+        with span("ingestion.dump_read"):
+            for page in iter_pages(read_stream(self.dump_path, article["stream_offset"])):
+                if page["title"] == article["title"]:
+                    return page["title"], wikitext_to_text(page["text"])
+        raise Exception(f"{article['title']} is not in its stream; rebuild the index for this dump")
+
+    async def get_random_article(self) -> None:
+        """Pick a random indexed article and read its text from the dump, skipping repeats of earlier days."""
+        logger.info("Picking random article from Wikipedia dump")
+        max_retries = 10
+        for _ in range(max_retries):
+            article_id = self._pick()
+            if self.dedup_index and self.dedup_index.seen_title(self.index.article(article_id)["title"]):
+                count("ingestion_retries")
+                continue
+            title, text = await asyncio.to_thread(self._load, article_id)
+            if not is_suitable(title, text):
+                # The index only holds an approximate length; the plain text turned out too short
+                count("ingestion_retries")
+                continue
+            repeat = self.dedup_index.article_repeat(title, text) if self.dedup_index else None
+            if repeat:
+                logger.info(f"Skipping {title}, a repeat of earlier article {repeat}")
+                count("ingestion_retries")
+                continue
+            self.article_title, self.article_text = title, text
+            if self.dedup_index:
+                self.dedup_index.reserve_article(title, text)
+            logger.info(f"Selected article: {self.article_title}")
+            return
+        raise Exception(f"Failed to find an unused article after {max_retries} attempts")
+
+def main(argv: list[str] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Index a multistream pages-articles dump for offline ingestion.")
+    parser.add_argument("dump", help="Path to enwiki-...-pages-articles-multistream.xml.bz2")
+    parser.add_argument("--index", default=None, help="Where to write the index (default <dump>.idx)")
+    args = parser.parse_args(argv)
+    build_index(args.dump, args.index or args.dump + ".idx")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
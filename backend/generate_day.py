@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from datetime import date
+from .generation_lock import GenerationInProgress
+from .question_generator import stream_daily_questions
+
+# Events go to stdout, so logs go to stderr
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    stream=sys.stderr
+)
+logger = logging.getLogger(__name__)
+
+class EventWriter:
+    """Write (event, data) pairs as JSON lines, going quiet once the reader has gone away."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.connected = True
+
+    def write(self, name: str, data) -> None:
+        if not self.connected:
+            return
+        try:
+            self.stream.write(json.dumps({'event': name, 'data': data}, separators=(',', ':')) + '\n')
+            self.stream.flush()
+        except (BrokenPipeError, ValueError):
+            # The web request ended early; keep generating so the day is still stored
+            self.connected = False
+
+async def run(target_date: date = None, lock_timeout: float = None, writer: EventWriter = None) -> int:
+    writer = writer or EventWriter()
+    try:
+        async for name, data in stream_daily_questions(target_date, lock_timeout):
+            writer.write(name, data)
+        return 0
+    except GenerationInProgress as e:
+        writer.write('busy', {'retry_after': e.retry_after})
+        return 2
+    except Exception as e:
+        logger.error(f"Error generating questions: {str(e)}")
+        writer.write('error', {'error': str(e)})
+        return 1
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate one day's questions, streaming events as JSON lines.")
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="Date to generate (default today)")
+    parser.add_argument("--lock-timeout", type=float, default=None,
+                        help="Seconds to wait for another generator of the same day")
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args.date, args.lock_timeout))
+
+if __name__ == "__main__":
+    sys.exit(main())
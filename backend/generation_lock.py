@@ -0,0 +1,93 @@
+import logging
+import os
+import threading
+import time
+from datetime import date
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# First key of the two-key advisory lock, reserved for daily question generation
+ADVISORY_LOCK_NAMESPACE = 0x7471  # "tq"
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+class GenerationInProgress(Exception):
+    """Raised when another caller is already generating questions for the date."""
+
+    def __init__(self, day: date, retry_after: int = None):
+        self.day = day
+        self.retry_after = retry_after if retry_after is not None else int(os.getenv('GENERATION_RETRY_AFTER_SECONDS', '15'))
+        super().__init__(f"Questions for {day} are already being generated, retry after {self.retry_after}s")
+
+def _local_lock(day: date) -> threading.Lock:
+    with _local_locks_guard:
+        return _local_locks.setdefault(day, threading.Lock())
+
+class GenerationLock:
+    """Single-flight lock for generating one day's questions.
+
+    A per-date threading lock serializes callers inside a process, and a
+    Postgres session-level advisory lock keyed on the date serializes the
+    web and scheduler containers. On other databases only the in-process
+    lock applies.
+    """
+
+    def __init__(self, engine: Engine, day: date, poll_interval: float = 0.25):
+        self.engine = engine
+        self.day = day
+        self.poll_interval = poll_interval
+        self._local = _local_lock(day)
+        self._conn = None
+
+    def acquire(self, timeout: float) -> None:
+        """Block for up to timeout seconds, raising GenerationInProgress if the lock stays held."""
+        deadline = time.monotonic() + timeout
+        if not self._local.acquire(timeout=max(timeout, 0)):
+            raise GenerationInProgress(self.day)
+        try:
+            if self.engine.dialect.name == 'postgresql':
+                self._acquire_advisory(deadline)
+        except BaseException:
+            self._local.release()
+            raise
+        logger.info(f"Acquired generation lock for {self.day}")
+
+    def _acquire_advisory(self, deadline: float) -> None:
+        conn = self.engine.connect()
+        try:
+            while True:
+                acquired = conn.execute(
+                    text("SELECT pg_try_advisory_lock(:namespace, :key)"),
+                    {"namespace": ADVISORY_LOCK_NAMESPACE, "key": self.day.toordinal()}
+                ).scalar()
+                conn.commit()
+                if acquired:
+                    self._conn = conn
+                    return
+                if time.monotonic() >= deadline:
+                    raise GenerationInProgress(self.day)
+                time.sleep(self.poll_interval)
+        except BaseException:
+            conn.close()
+            raise
+
+    def release(self) -> None:
+        try:
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        text("SELECT pg_advisory_unlock(:namespace, :key)"),
+                        {"namespace": ADVISORY_LOCK_NAMESPACE, "key": self.day.toordinal()}
+                    )
+                    self._conn.commit()
+                finally:
+                    # Closing the connection also drops the lock if the unlock failed
+                    self._conn.invalidate()
+                    self._conn.close()
+                    self._conn = None
+        finally:
+            self._local.release()
+            logger.info(f"Released generation lock for {self.day}")
@@ -0,0 +1,113 @@
+import logging
+import math
+import os
+from dataclasses import asdict, dataclass, field
+
+logger = logging.getLogger(__name__)
+
+FUSED = "fused"            # one quiz call over the whole article
+MAP_REDUCE = "map_reduce"  # synthesize every chunk, then one quiz call over all facts
+SAMPLED = "sampled"        # synthesize only the chunks the question count needs, then one quiz call
+PER_CHUNK = "per_chunk"    # synthesize and quiz every chunk separately (the original pipeline)
+STRATEGIES = (FUSED, MAP_REDUCE, SAMPLED, PER_CHUNK)
+
+@dataclass
+class GenerationPlan:
+    strategy: str
+    chunk_indices: list[int]
+    num_questions: int
+    estimated_calls: int
+    estimated_prompt_tokens: int
+    baseline_calls: int
+    baseline_prompt_tokens: int
+    actual_calls: int = field(default=0)
+
+    @property
+    def calls_saved(self) -> int:
+        return self.baseline_calls - self.estimated_calls
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.baseline_prompt_tokens - self.estimated_prompt_tokens
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "calls_saved": self.calls_saved, "tokens_saved": self.tokens_saved}
+
+class GenerationPlanner:
+    """Pick the cheapest generation strategy for an article from its chunk token counts.
+
+    Estimates are prompt tokens only, compared against the per-chunk
+    baseline of one synthesis and one quiz call for every chunk. Chunks
+    repeat some overlap, so the fused call over the whole article is
+    sized by the article's own tokens rather than the chunks' sum.
+    """
+
+    def __init__(self, target_questions: int = 4, strategy: str = None, fused_max_tokens: int = None,
+                 map_reduce_max_chunks: int = None, facts_per_chunk: int = 10, facts_per_question: int = 3,
+                 synthesis_output_tokens: int = 400):
+        self.target_questions = target_questions
+        self.strategy = strategy or os.getenv('GENERATION_STRATEGY', 'auto')
+        if self.strategy != 'auto' and self.strategy not in STRATEGIES:
+            raise ValueError(f"Unknown generation strategy: {self.strategy}")
+        self.fused_max_tokens = fused_max_tokens or int(os.getenv('FUSED_MAX_TOKENS', '6000'))
+        self.map_reduce_max_chunks = map_reduce_max_chunks or int(os.getenv('MAP_REDUCE_MAX_CHUNKS', '6'))
+        self.facts_per_chunk = facts_per_chunk
+        self.facts_per_question = facts_per_question
+        self.synthesis_output_tokens = synthesis_output_tokens
+
+    def chunks_needed(self) -> int:
+        """Chunks whose synthesized facts cover the target number of questions."""
+        return max(1, math.ceil(self.target_questions * self.facts_per_question / self.facts_per_chunk))
+
+    def _sample_indices(self, num_chunks: int) -> list[int]:
+        """Evenly spaced chunks, always including the article's lead."""
+        needed = min(self.chunks_needed(), num_chunks)
+        step = num_chunks / needed
+        return sorted({int(i * step) for i in range(needed)})
+
+    def _estimate(self, strategy: str, indices: list[int], chunk_tokens: list[int], article_tokens: int,
+                  synthesis_prompt_tokens: int, quiz_prompt_tokens: int) -> tuple[int, int]:
+        """Return (calls, prompt tokens) for running a strategy over the chosen chunks."""
+        if strategy == FUSED:
+            return 1, quiz_prompt_tokens + article_tokens
+        selected = sum(chunk_tokens[i] for i in indices)
+        synthesis_tokens = len(indices) * synthesis_prompt_tokens + selected
+        if strategy == PER_CHUNK:
+            quiz_tokens = len(indices) * (quiz_prompt_tokens + self.synthesis_output_tokens)
+            return 2 * len(indices), synthesis_tokens + quiz_tokens
+        return len(indices) + 1, synthesis_tokens + quiz_prompt_tokens + len(indices) * self.synthesis_output_tokens
+
+    def plan(self, chunk_tokens: list[int], synthesis_prompt_tokens: int, quiz_prompt_tokens: int,
+             article_tokens: int = None) -> GenerationPlan:
+        """Plan generation from the chunks' token counts and the article's unique tokens (default their sum)."""
+        num_chunks = len(chunk_tokens)
+        all_indices = list(range(num_chunks))
+        if article_tokens is None:
+            article_tokens = sum(chunk_tokens)
+        strategy = self.strategy
+        if strategy == 'auto':
+            if article_tokens <= self.fused_max_tokens:
+                strategy = FUSED
+            elif num_chunks <= self.map_reduce_max_chunks:
+                strategy = MAP_REDUCE
+            else:
+                strategy = SAMPLED
+
+        indices = self._sample_indices(num_chunks) if strategy == SAMPLED else all_indices
+        calls, tokens = self._estimate(strategy, indices, chunk_tokens, article_tokens,
+                                       synthesis_prompt_tokens, quiz_prompt_tokens)
+        baseline_calls, baseline_tokens = self._estimate(PER_CHUNK, all_indices, chunk_tokens, article_tokens,
+                                                         synthesis_prompt_tokens, quiz_prompt_tokens)
+        plan = GenerationPlan(
+            strategy=strategy,
+            chunk_indices=indices,
+            num_questions=self.target_questions,
+            estimated_calls=calls,
+            estimated_prompt_tokens=tokens,
+            baseline_calls=baseline_calls,
+            baseline_prompt_tokens=baseline_tokens
+        )
+        logger.info(f"Planned {strategy} generation over {len(indices)} of {num_chunks} chunks: "
+                    f"{calls} calls and ~{tokens} prompt tokens "
+                    f"(saves {plan.calls_saved} calls and ~{plan.tokens_saved} tokens)")
+        return plan
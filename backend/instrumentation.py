@@ -0,0 +1,358 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from fast routes up to slow LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Spans kept per trace, so a long per-chunk run still stores a bounded row
+MAX_SPANS = 500
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def metric_lines(name: str, kind: str, help_text: str, samples) -> list[str]:
+    """Prometheus text-format lines for a metric from (suffix, labels, value) samples."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for suffix, labels, value in samples:
+        lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return lines
+
+class Counter:
+    """Monotonic count per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(label, "")) for label in self.labels), 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def add_to(self, values: dict, key: tuple, value) -> None:
+        values[key] = values.get(key, 0) + value
+
+    def samples(self, values: dict = None):
+        for key, value in sorted((self._values if values is None else values).items()):
+            yield "", dict(zip(self.labels, key)), value
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}  # label values -> [count per bucket..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(tuple(str(labels.get(label, "")) for label in self.labels))
+        return entry[-1] if entry else 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: list(entry) for key, entry in self._values.items()}
+
+    def add_to(self, values: dict, key: tuple, entry: list) -> None:
+        total = values.setdefault(key, [0] * (len(self.buckets) + 2))
+        if len(entry) == len(total):
+            for i, value in enumerate(entry):
+                total[i] += value
+
+    def samples(self, values: dict = None):
+        for key, entry in sorted((self._values if values is None else values).items()):
+            labels = dict(zip(self.labels, key))
+            for bound, count in zip(self.buckets, entry):
+                yield "_bucket", {**labels, "le": _format_value(bound)}, count
+            yield "_bucket", {**labels, "le": "+Inf"}, entry[-1]
+            yield "_sum", labels, entry[-2]
+            yield "_count", labels, entry[-1]
+
+class MetricsRegistry:
+    """The process's metrics, rendered in the Prometheus text format.
+
+    Once share() is called, the process writes a snapshot of its metrics
+    to a directory every few seconds, and render() adds up the snapshots
+    of every other process there, so any worker can answer for all of them.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.directory = None
+        self._shared_pid = None
+
+    def _register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def share(self, directory: str, interval: float = None) -> None:
+        """Start writing this process's snapshot to directory; call it in each worker after fork."""
+        if interval is None:
+            interval = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        if self._shared_pid == os.getpid():
+            return
+        self._shared_pid = os.getpid()
+
+        def flush() -> None:
+            while True:
+                time.sleep(interval)
+                self.write_snapshot()
+
+        threading.Thread(target=flush, daemon=True).start()
+
+    def write_snapshot(self) -> None:
+        if self.directory is None:
+            return
+        data = {name: [[list(key), value] for key, value in metric.snapshot().items()]
+                for name, metric in self.metrics.items()}
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        try:
+            with open(path + ".tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning(f"Failed to write metrics snapshot: {str(e)}")
+
+    def _combined_values(self) -> dict:
+        """This process's live values plus the latest snapshot of every other process sharing the directory."""
+        values = {name: metric.snapshot() for name, metric in self.metrics.items()}
+        if self.directory is None:
+            return values
+        own = f"{os.getpid()}.json"
+        for entry in os.scandir(self.directory):
+            if entry.name == own or not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, samples in data.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in samples:
+                    metric.add_to(values[name], tuple(key), value)
+        return values
+
+    def render(self) -> str:
+        values = self._combined_values()
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric_lines(metric.name, metric.kind, metric.help_text, metric.samples(values[metric.name])))
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+STAGE_SECONDS = registry.histogram("trivia_stage_seconds", "Time spent in each pipeline stage", ("stage",))
+PIPELINE_EVENTS = registry.counter("trivia_pipeline_events_total",
+                                   "Pipeline events such as retries, LLM calls and cache hits", ("event",))
+LLM_TOKENS = registry.counter("trivia_llm_tokens_total", "Prompt and completion tokens per LLM stage", ("stage", "kind"))
+HTTP_SECONDS = registry.histogram("trivia_http_request_seconds", "Request latency per route",
+                                  ("route", "method", "status"))
+HTTP_DB_SECONDS = registry.histogram("trivia_http_db_seconds", "Database time per request", ("route",))
+
+class Span:
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+class Trace:
+    """Spans and running totals of one generation run, serialized to JSON when the day is stored."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self.spans = []
+        self.dropped_spans = 0
+        self.stages = {}  # span name -> count and total milliseconds, kept even for dropped spans
+        self.totals = {}
+        self.attrs = {}  # facts about the run as a whole, such as its generation plan
+        self._lock = threading.Lock()
+
+    def record(self, span: Span, start: float, duration: float) -> None:
+        with self._lock:
+            stage = self.stages.setdefault(span.name, {"count": 0, "total_ms": 0})
+            stage["count"] += 1
+            stage["total_ms"] = round(stage["total_ms"] + duration * 1000, 1)
+            if len(self.spans) >= MAX_SPANS:
+                self.dropped_spans += 1
+                return
+            self.spans.append({
+                "name": span.name,
+                "start_ms": round((start - self._start) * 1000, 1),
+                "duration_ms": round(duration * 1000, 1),
+                **span.attrs,
+            })
+
+    def add(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.totals[name] = self.totals.get(name, 0) + amount
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round((time.perf_counter() - self._start) * 1000, 1),
+            "totals": {name: round(value, 3) for name, value in self.totals.items()},
+            "attrs": self.attrs,
+            "stages": self.stages,
+            "spans": self.spans,
+            "dropped_spans": self.dropped_spans,
+        }
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+current_span = contextvars.ContextVar("current_span", default=None)
+current_db_timer = contextvars.ContextVar("current_db_timer", default=None)
+
+def _reset(var: contextvars.ContextVar, token) -> None:
+    try:
+        var.reset(token)
+    except ValueError:
+        # An async generator closed from another context; that context never saw the value
+        pass
+
+@contextmanager
+def trace(name: str):
+    """Collect the spans and totals of everything run inside the block, including tasks it starts."""
+    run = Trace(name)
+    token = current_trace.set(run)
+    try:
+        yield run
+    finally:
+        _reset(current_trace, token)
+
+def _finish(span: Span, start: float, duration: float) -> None:
+    STAGE_SECONDS.observe(duration, stage=span.name)
+    run = current_trace.get()
+    if run is not None:
+        run.record(span, start, duration)
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a pipeline stage into the stage histogram and the current trace."""
+    current = Span(name, attrs)
+    token = current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        _reset(current_span, token)
+        _finish(current, start, time.perf_counter() - start)
+
+def timed_iter(name: str, iterable):
+    """Yield from iterable, recording the time spent producing its items as one span."""
+    current = Span(name, {"items": 0})
+    start = time.perf_counter()
+    busy = 0.0
+    iterator = iter(iterable)
+    try:
+        while True:
+            resumed = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                busy += time.perf_counter() - resumed
+                return
+            busy += time.perf_counter() - resumed
+            current.attrs["items"] += 1
+            yield item
+    finally:
+        _finish(current, start, busy)
+
+def annotate(**attrs) -> None:
+    """Add attributes to the innermost open span, if any."""
+    current = current_span.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+def annotate_trace(**attrs) -> None:
+    """Add attributes to the current trace as a whole, if any."""
+    run = current_trace.get()
+    if run is not None:
+        run.attrs.update(attrs)
+
+def count(event: str, amount: float = 1) -> None:
+    """Count a pipeline event in the process metrics and the current trace's totals."""
+    PIPELINE_EVENTS.inc(amount, event=event)
+    run = current_trace.get()
+    if run is not None:
+        run.add(event, amount)
+
+def record_tokens(prompt_tokens: int, completion_tokens: int, estimated: bool = False) -> None:
+    """Charge an LLM call's tokens to the innermost span's stage."""
+    current = current_span.get()
+    stage = current.name if current is not None else "llm"
+    LLM_TOKENS.inc(prompt_tokens, stage=stage, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, stage=stage, kind="completion")
+    annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    if estimated:
+        annotate(tokens_estimated=True)
+    run = current_trace.get()
+    if run is not None:
+        run.add("prompt_tokens", prompt_tokens)
+        run.add("completion_tokens", completion_tokens)
+
+class DBTimer:
+    def __init__(self):
+        self.seconds = 0.0
+        self.statements = 0
+
+def record_db_time(seconds: float) -> None:
+    """Add one statement's time to the current request's timer and the current trace."""
+    timer = current_db_timer.get()
+    if timer is not None:
+        timer.seconds += seconds
+        timer.statements += 1
+    run = current_trace.get()
+    if run is not None:
+        run.add("db_seconds", seconds)
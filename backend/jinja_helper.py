@@ -1,11 +1,63 @@
 from typing import Any
+import hashlib
+import json
 import os
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+import threading
+from functools import lru_cache
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+
+PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "prompts")
+
+class PromptRegistry:
+    """Prompt templates compiled once per process.
+
+    Templates are never re-checked on disk after their first load, renders
+    that depend only on constant data are memoized, and each template has a
+    content hash identifying its version.
+    """
+
+    def __init__(self, search_path: str = PROMPTS_DIR):
+        self.env = Environment(
+            loader=FileSystemLoader(searchpath=search_path),
+            autoescape=select_autoescape(),
+            auto_reload=False,
+            cache_size=-1
+        )
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._hashes = {}
+        self._static_renders = {}
+
+    def get_template(self, template_file: str) -> Template:
+        template = self._templates.get(template_file)
+        if template is None:
+            with self._lock:
+                source, _, _ = self.env.loader.get_source(self.env, template_file)
+                template = self.env.get_template(template_file)
+                self._hashes[template_file] = hashlib.sha256(source.encode('utf-8')).hexdigest()
+                self._templates[template_file] = template
+        return template
+
+    def template_hash(self, template_file: str) -> str:
+        """Content hash of a template, usable to version anything derived from it."""
+        self.get_template(template_file)
+        return self._hashes[template_file]
+
+    def render(self, template_file: str, data: dict[str, Any]) -> str:
+        return self.get_template(template_file).render(**data)
+
+    def render_static(self, template_file: str, data: dict[str, Any]) -> str:
+        """Render a template whose data is constant for the process, memoizing the result."""
+        key = (template_file, json.dumps(data, sort_keys=True))
+        rendered = self._static_renders.get(key)
+        if rendered is None:
+            rendered = self.render(template_file, data)
+            self._static_renders[key] = rendered
+        return rendered
+
+@lru_cache(maxsize=None)
+def get_prompt_registry() -> PromptRegistry:
+    return PromptRegistry()
 
 def process_template(template_file: str, data: dict[str, Any]) -> str:
-    jinja_env = Environment(
-        loader=FileSystemLoader(searchpath=os.path.join(os.path.dirname(__file__), "prompts")), 
-        autoescape=select_autoescape()
-    )
-    template = jinja_env.get_template(template_file)
-    return template.render(**data) 
\ No newline at end of file
+    return get_prompt_registry().render(template_file, data)
@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from langchain_core.messages import AIMessage, BaseMessage, convert_to_messages, messages_from_dict, messages_to_dict
+from .instrumentation import annotate, count
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, create_engine, delete, func, select, update
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_URL = "sqlite:///" + os.path.join(os.path.dirname(__file__), "data", "llm_cache.sqlite3")
+
+class LLMCacheBackend:
+    """Storage for serialized LLM responses keyed by a content hash."""
+
+    def __init__(self, max_bytes: int = None, max_age_seconds: int = None, evict_every: int = 50):
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv('LLM_CACHE_MAX_MB', '256')) * 1024 * 1024
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else int(os.getenv('LLM_CACHE_MAX_AGE_SECONDS', str(30 * 24 * 60 * 60)))
+        self.evict_every = evict_every
+        self.evictions = 0
+        self._writes_since_evict = 0
+
+    def get(self, key: str) -> str:
+        raise NotImplementedError
+
+    def set(self, key: str, model: str, value: str) -> None:
+        self._set(key, model, value)
+        self._writes_since_evict += 1
+        if self._writes_since_evict >= self.evict_every:
+            self.evict()
+
+    def _set(self, key: str, model: str, value: str) -> None:
+        raise NotImplementedError
+
+    def evict(self) -> int:
+        """Drop entries older than max_age_seconds, then least recently used ones beyond max_bytes."""
+        self._writes_since_evict = 0
+        removed = self._evict(time.time() - self.max_age_seconds)
+        self.evictions += removed
+        if removed:
+            logger.info(f"Evicted {removed} LLM cache entries")
+        return removed
+
+    def _evict(self, cutoff: float) -> int:
+        raise NotImplementedError
+
+class SQLCacheBackend(LLMCacheBackend):
+    """Cache stored in a SQL table: a SQLite file in development, the app's Postgres in production."""
+
+    def __init__(self, url: str, **kwargs):
+        super().__init__(**kwargs)
+        if url.startswith("sqlite:///"):
+            os.makedirs(os.path.dirname(os.path.abspath(url[len("sqlite:///"):])), exist_ok=True)
+        self.engine = create_engine(url, pool_pre_ping=True)
+        self.table = Table(
+            "llm_response_cache", MetaData(),
+            Column("key", String(64), primary_key=True),
+            Column("model", String(100), nullable=False),
+            Column("response", Text, nullable=False),
+            Column("size", Integer, nullable=False),
+            Column("created_at", Float, nullable=False, index=True),
+            Column("accessed_at", Float, nullable=False, index=True),
+        )
+        self.table.metadata.create_all(self.engine)
+
+    def get(self, key: str) -> str:
+        with self.engine.begin() as conn:
+            row = conn.execute(
+                select(self.table.c.response, self.table.c.created_at).where(self.table.c.key == key)
+            ).first()
+            if row is None or row.created_at < time.time() - self.max_age_seconds:
+                return None
+            conn.execute(update(self.table).where(self.table.c.key == key).values(accessed_at=time.time()))
+            return row.response
+
+    def _set(self, key: str, model: str, value: str) -> None:
+        now = time.time()
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.key == key))
+            conn.execute(self.table.insert().values(
+                key=key, model=model, response=value, size=len(value),
+                created_at=now, accessed_at=now
+            ))
+
+    def _evict(self, cutoff: float) -> int:
+        with self.engine.begin() as conn:
+            removed = conn.execute(delete(self.table).where(self.table.c.created_at < cutoff)).rowcount
+            total = conn.execute(select(func.coalesce(func.sum(self.table.c.size), 0))).scalar()
+            if total > self.max_bytes:
+                rows = conn.execute(
+                    select(self.table.c.key, self.table.c.size).order_by(self.table.c.accessed_at)
+                ).all()
+                stale_keys = []
+                for row in rows:
+                    if total <= self.max_bytes:
+                        break
+                    stale_keys.append(row.key)
+                    total -= row.size
+                conn.execute(delete(self.table).where(self.table.c.key.in_(stale_keys)))
+                removed += len(stale_keys)
+        return removed
+
+class FileCacheBackend(LLMCacheBackend):
+    """Cache stored as one JSON file per entry, sharded by key prefix."""
+
+    def __init__(self, directory: str, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> str:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry["created_at"] < time.time() - self.max_age_seconds:
+            return None
+        os.utime(path)  # mtime doubles as the last access time for eviction
+        return entry["response"]
+
+    def _set(self, key: str, model: str, value: str) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"model": model, "response": value, "created_at": time.time()}, f)
+        os.replace(tmp_path, path)
+
+    def _evict(self, cutoff: float) -> int:
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+        removed = 0
+        total = sum(size for _, size, _ in entries)
+        for accessed_at, size, path in sorted(entries):
+            with open(path, 'r', encoding='utf-8') as f:
+                created_at = json.load(f)["created_at"]
+            if created_at < cutoff or total > self.max_bytes:
+                os.remove(path)
+                total -= size
+                removed += 1
+        return removed
+
+def create_cache_backend(url: str = None) -> LLMCacheBackend:
+    """Build the cache backend named by LLM_CACHE_URL ("off" disables caching).
+
+    sqlite:// and postgresql:// URLs use SQLCacheBackend, file:///path uses
+    FileCacheBackend. Defaults to a SQLite file under backend/data.
+    """
+    url = url or os.getenv('LLM_CACHE_URL', DEFAULT_CACHE_URL)
+    if url.lower() in ("off", "none", "disabled"):
+        return None
+    if url.startswith("file://"):
+        return FileCacheBackend(url[len("file://"):])
+    return SQLCacheBackend(url)
+
+_UNSET = object()
+_shared_cache_backend = _UNSET
+_shared_lock = threading.Lock()
+
+def shared_cache_backend() -> LLMCacheBackend:
+    """The process-wide cache backend, so every model created here shares one engine and its pool."""
+    global _shared_cache_backend
+    with _shared_lock:
+        if _shared_cache_backend is _UNSET:
+            _shared_cache_backend = create_cache_backend()
+        return _shared_cache_backend
+
+class CachedChatModel:
+    """Chat model wrapper that replays stored responses for identical requests.
+
+    The key hashes the model name, its identifying parameters, the rendered
+    messages and any per-call keyword arguments, so a changed prompt or
+    setting is always a miss.
+    """
+
+    def __init__(self, model, backend: LLMCacheBackend):
+        self.model = model
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    @property
+    def model_id(self) -> str:
+        return getattr(self.model, "model_name", type(self.model).__name__)
+
+    def cache_key(self, messages, **kwargs) -> str:
+        payload = {
+            "model": self.model_id,
+            "params": getattr(self.model, "_identifying_params", {}),
+            "messages": [
+                {"type": m.type, "content": m.content, "additional_kwargs": m.additional_kwargs}
+                for m in convert_to_messages(messages)
+            ],
+            "kwargs": kwargs,
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _lookup(self, key: str) -> BaseMessage:
+        try:
+            cached = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"LLM cache read failed: {str(e)}")
+            cached = None
+        if cached is None:
+            self.misses += 1
+            count("llm_cache_misses")
+            return None
+        self.hits += 1
+        count("llm_cache_hits")
+        annotate(cache_hit=True)
+        return messages_from_dict([json.loads(cached)])[0]
+
+    def _store(self, key: str, response: BaseMessage) -> None:
+        try:
+            self.backend.set(key, self.model_id, json.dumps(messages_to_dict([response])[0]))
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {str(e)}")
+
+    def invoke(self, input, config=None, **kwargs) -> BaseMessage:
+        key = self.cache_key(input, **kwargs)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        response = self.model.invoke(input, config, **kwargs)
+        self._store(key, response)
+        return response
+
+    async def ainvoke(self, input, config=None, **kwargs) -> BaseMessage:
+        key = self.cache_key(input, **kwargs)
+        cached = await asyncio.to_thread(self._lookup, key)
+        if cached is not None:
+            return cached
+        response = await self.model.ainvoke(input, config, **kwargs)
+        await asyncio.to_thread(self._store, key, response)
+        return response
+
+    async def astream(self, input, config=None, **kwargs):
+        """Stream a response, replaying a cached one as a single chunk and caching the assembled stream."""
+        key = self.cache_key(input, **kwargs)
+        cached = await asyncio.to_thread(self._lookup, key)
+        if cached is not None:
+            yield cached
+            return
+        response = None
+        async for chunk in self.model.astream(input, config, **kwargs):
+            response = chunk if response is None else response + chunk
+            yield chunk
+        if response is not None:
+            await asyncio.to_thread(self._store, key, AIMessage(
+                content=response.content, additional_kwargs=response.additional_kwargs
+            ))
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.backend.evictions}
@@ -0,0 +1,341 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import openai
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import convert_to_messages
+from sqlalchemy import Column, Float, MetaData, String, Table, case, create_engine, select, update
+from sqlalchemy.exc import IntegrityError
+from .instrumentation import count, record_tokens
+
+logger = logging.getLogger(__name__)
+
+# Failures worth another attempt: throttling, timeouts, dropped connections and server errors
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+    TimeoutError,
+)
+
+class TokenBucket:
+    """In-process token bucket refilled continuously at rate_per_minute, holding at most capacity."""
+
+    def __init__(self, name: str, rate_per_minute: float, capacity: float = None):
+        self.name = name
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, amount: float) -> float:
+        """Take amount tokens if they are there and return 0, else return the seconds until they will be."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0
+            return (amount - self._tokens) / self.rate
+
+class SQLTokenBucket:
+    """Token bucket kept in a SQL row, so every process pointed at the same database shares one budget.
+
+    A take is a single conditional UPDATE that refills and debits the row
+    at once, which is atomic on both SQLite and Postgres.
+    """
+
+    def __init__(self, engine, table: Table, name: str, rate_per_minute: float, capacity: float = None):
+        self.engine = engine
+        self.table = table
+        self.name = name
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        try:
+            with engine.begin() as conn:
+                conn.execute(table.insert().values(name=name, tokens=self.capacity, updated_at=time.time()))
+        except IntegrityError:
+            pass
+
+    def take(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        now = time.time()
+        refilled = self.table.c.tokens + (now - self.table.c.updated_at) * self.rate
+        available = case((refilled > self.capacity, self.capacity), else_=refilled)
+        with self.engine.begin() as conn:
+            taken = conn.execute(
+                update(self.table)
+                .where(self.table.c.name == self.name, available >= amount)
+                .values(tokens=available - amount, updated_at=now)
+            ).rowcount
+            if taken:
+                return 0
+            current = conn.execute(select(available).where(self.table.c.name == self.name)).scalar()
+        # Another process may have refilled past amount in between; look again shortly
+        return max((amount - (current or 0)) / self.rate, 0.01)
+
+def create_rate_limits(url: str = None) -> tuple:
+    """Request and token buckets sized by LLM_REQUESTS_PER_MINUTE and LLM_TOKENS_PER_MINUTE.
+
+    With LLM_RATE_LIMIT_URL set to a sqlite:// or postgresql:// URL the
+    buckets live in that database and are shared by the scheduler, web
+    generation and backfills; otherwise each process has its own.
+    """
+    url = url or os.getenv('LLM_RATE_LIMIT_URL', '')
+    requests_per_minute = float(os.getenv('LLM_REQUESTS_PER_MINUTE', '500'))
+    tokens_per_minute = float(os.getenv('LLM_TOKENS_PER_MINUTE', '30000'))
+    if not url:
+        return TokenBucket("requests", requests_per_minute), TokenBucket("tokens", tokens_per_minute)
+    engine = create_engine(url, pool_pre_ping=True)
+    table = Table(
+        "llm_rate_limit", MetaData(),
+        Column("name", String(50), primary_key=True),
+        Column("tokens", Float, nullable=False),
+        Column("updated_at", Float, nullable=False),
+    )
+    table.metadata.create_all(engine)
+    return (SQLTokenBucket(engine, table, "requests", requests_per_minute),
+            SQLTokenBucket(engine, table, "tokens", tokens_per_minute))
+
+_shared_rate_limits = None
+_shared_lock = threading.Lock()
+
+def shared_rate_limits() -> tuple:
+    """The process-wide buckets, so every model created here draws on the same budget."""
+    global _shared_rate_limits
+    with _shared_lock:
+        if _shared_rate_limits is None:
+            _shared_rate_limits = create_rate_limits()
+        return _shared_rate_limits
+
+def retry_after(error: Exception):
+    """Seconds the server asked us to wait, from the retry-after-ms or retry-after header."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Keeps the token usage the API reported for a call, when it reports one."""
+
+    def __init__(self):
+        self.usage = None
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        self.usage = (response.llm_output or {}).get("token_usage") or None
+
+def with_callback(config, handler) -> dict:
+    config = dict(config or {})
+    config["callbacks"] = list(config.get("callbacks") or []) + [handler]
+    return config
+
+class RateLimitedChatModel:
+    """Chat model wrapper that paces, retries and bounds every call.
+
+    Each call first takes one request and its estimated tokens from the
+    buckets, waiting if the per-minute budget is spent. Throttling,
+    timeouts and server errors are retried with jittered exponential
+    backoff (or the server's Retry-After) until max_retries or the overall
+    deadline runs out, and each attempt is cut off after call_timeout.
+    With hedge_after set, a call still running after that many seconds is
+    raced against a second copy and the first answer wins. The wrapped
+    model should have its own retries turned off.
+    """
+
+    def __init__(self, model, requests_bucket=None, tokens_bucket=None, max_retries: int = None,
+                 base_delay: float = None, max_delay: float = None, call_timeout: float = None,
+                 deadline: float = None, hedge_after: float = None, completion_tokens: int = None):
+        self.model = model
+        if requests_bucket is None or tokens_bucket is None:
+            default_requests, default_tokens = shared_rate_limits()
+            requests_bucket = requests_bucket or default_requests
+            tokens_bucket = tokens_bucket or default_tokens
+        self.requests_bucket = requests_bucket
+        self.tokens_bucket = tokens_bucket
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('LLM_MAX_RETRIES', '5'))
+        self.base_delay = base_delay if base_delay is not None else float(os.getenv('LLM_RETRY_BASE_SECONDS', '1'))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv('LLM_RETRY_MAX_SECONDS', '60'))
+        self.call_timeout = call_timeout or float(os.getenv('LLM_CALL_TIMEOUT_SECONDS', '120'))
+        self.deadline = deadline or float(os.getenv('LLM_DEADLINE_SECONDS', '600'))
+        # 0 turns hedging off
+        self.hedge_after = hedge_after if hedge_after is not None else float(os.getenv('LLM_HEDGE_AFTER_SECONDS', '0'))
+        # Expected completion size, counted against the token budget along with the prompt
+        self.completion_tokens = completion_tokens if completion_tokens is not None else int(os.getenv('LLM_COMPLETION_TOKENS', '1000'))
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.throttled_seconds = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def estimate_tokens(self, messages) -> int:
+        """Prompt tokens at about four characters each, plus the expected completion."""
+        characters = sum(len(str(message.content)) for message in convert_to_messages(messages))
+        return characters // 4 + self.completion_tokens
+
+    def _buckets(self, tokens: int):
+        return ((self.tokens_bucket, tokens), (self.requests_bucket, 1))
+
+    async def _admit(self, tokens: int) -> None:
+        """Wait until the token budget, then the request budget, covers the call."""
+        for bucket, amount in self._buckets(tokens):
+            while True:
+                wait = await asyncio.to_thread(bucket.take, amount)
+                if not wait:
+                    break
+                self.throttled_seconds += wait
+                count("llm_throttled_seconds", wait)
+                await asyncio.sleep(wait)
+
+    def _admit_sync(self, tokens: int) -> None:
+        for bucket, amount in self._buckets(tokens):
+            while True:
+                wait = bucket.take(amount)
+                if not wait:
+                    break
+                self.throttled_seconds += wait
+                count("llm_throttled_seconds", wait)
+                time.sleep(wait)
+
+    def _backoff(self, error: Exception, attempt: int, deadline: float) -> float:
+        """Delay before the next attempt, re-raising the error when it should not be retried."""
+        if not isinstance(error, RETRYABLE_ERRORS) or attempt >= self.max_retries:
+            raise error
+        delay = retry_after(error)
+        if delay is None:
+            # Full jitter keeps concurrent callers from retrying in lockstep
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            raise error
+        self.retries += 1
+        count("llm_retries")
+        logger.warning(f"LLM call failed ({type(error).__name__}), retry {attempt + 1} in {delay:.2f}s")
+        return delay
+
+    def _timeout(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError("LLM call deadline exceeded")
+        return min(self.call_timeout, remaining)
+
+    def _record_usage(self, input, usage: dict, content) -> None:
+        """Charge the call's reported tokens, or an estimate when the API reported none, to the current span."""
+        if usage:
+            record_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        else:
+            record_tokens(self.estimate_tokens(input) - self.completion_tokens, len(str(content)) // 4, estimated=True)
+
+    async def _call(self, input, config, kwargs, deadline: float):
+        self.calls += 1
+        usage = TokenUsageCallback()
+        response = await asyncio.wait_for(self.model.ainvoke(input, with_callback(config, usage), **kwargs),
+                                          self._timeout(deadline))
+        self._record_usage(input, usage.usage, response.content)
+        return response
+
+    async def _hedged_call(self, input, config, kwargs, deadline: float, tokens: int):
+        """Race a second copy of a slow call against the first, returning whichever answers first."""
+        first = asyncio.create_task(self._call(input, config, kwargs, deadline))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return first.result()
+        await self._admit(tokens)
+        self.hedges += 1
+        count("llm_hedges")
+        pending = {first, asyncio.create_task(self._call(input, config, kwargs, deadline))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        tokens = self.estimate_tokens(input)
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            await self._admit(tokens)
+            try:
+                if self.hedge_after:
+                    return await self._hedged_call(input, config, kwargs, deadline, tokens)
+                return await self._call(input, config, kwargs, deadline)
+            except Exception as e:
+                await asyncio.sleep(self._backoff(e, attempt, deadline))
+            attempt += 1
+
+    async def astream(self, input, config=None, **kwargs):
+        """Stream a response, retrying only failures that happen before the first chunk arrives."""
+        tokens = self.estimate_tokens(input)
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            await self._admit(tokens)
+            self.calls += 1
+            usage = TokenUsageCallback()
+            stream = self.model.astream(input, with_callback(config, usage), **kwargs).__aiter__()
+            started = False
+            content = ""
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), self._timeout(deadline))
+                    except StopAsyncIteration:
+                        self._record_usage(input, usage.usage, content)
+                        return
+                    started = True
+                    content += str(chunk.content)
+                    yield chunk
+            except Exception as e:
+                if started:
+                    raise
+                delay = self._backoff(e, attempt, deadline)
+            finally:
+                if hasattr(stream, "aclose"):
+                    await stream.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def invoke(self, input, config=None, **kwargs):
+        tokens = self.estimate_tokens(input)
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            self._admit_sync(tokens)
+            self.calls += 1
+            usage = TokenUsageCallback()
+            try:
+                response = self.model.invoke(input, with_callback(config, usage), **kwargs)
+                self._record_usage(input, usage.usage, response.content)
+                return response
+            except Exception as e:
+                time.sleep(self._backoff(e, attempt, deadline))
+            attempt += 1
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+        }
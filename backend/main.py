@@ -2,6 +2,11 @@ import schedule
 import time
 import logging
 import asyncio
+import os
+import random
+import threading
+from datetime import date, timedelta
+from .app import app_context, DailyQuestions
 from .question_generator import generate_daily_questions
 
 # Configure logging
@@ -11,23 +16,88 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def run_daily_questions():
-    """Run the daily question generation process."""
+# Number of future days kept generated ahead of today
+BUFFER_DAYS = int(os.getenv('QUESTION_BUFFER_DAYS', '3'))
+REFILL_MAX_RETRIES = int(os.getenv('REFILL_MAX_RETRIES', '5'))
+REFILL_BACKOFF_SECONDS = float(os.getenv('REFILL_BACKOFF_SECONDS', '30'))
+REFILL_MAX_BACKOFF_SECONDS = float(os.getenv('REFILL_MAX_BACKOFF_SECONDS', '1800'))
+
+_refill_guard = threading.Lock()
+
+def missing_buffer_dates(today: date = None) -> list[date]:
+    """Return the dates from today through the end of the buffer that have no questions yet."""
+    today = today or date.today()
+    wanted = [today + timedelta(days=offset) for offset in range(BUFFER_DAYS + 1)]
+    with app_context():
+        stored = {
+            row.date for row in DailyQuestions.query
+            .with_entities(DailyQuestions.date)
+            .filter(DailyQuestions.date >= wanted[0], DailyQuestions.date <= wanted[-1])
+        }
+    return [day for day in wanted if day not in stored]
+
+async def generate_with_retries(target_date: date) -> bool:
+    """Generate one day's questions, retrying with jittered exponential backoff."""
+    for attempt in range(1, REFILL_MAX_RETRIES + 1):
+        try:
+            await generate_daily_questions(target_date)
+            return True
+        except Exception as e:
+            if attempt == REFILL_MAX_RETRIES:
+                logger.error(f"Giving up on questions for {target_date} after {attempt} attempts: {str(e)}")
+                break
+            delay = min(REFILL_BACKOFF_SECONDS * 2 ** (attempt - 1), REFILL_MAX_BACKOFF_SECONDS)
+            delay *= random.uniform(0.5, 1.0)
+            logger.warning(f"Attempt {attempt} for {target_date} failed ({str(e)}), retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+    return False
+
+async def refill_buffer() -> None:
+    """Generate every missing day in the buffer, nearest day first."""
+    missing = missing_buffer_dates()
+    if not missing:
+        logger.info(f"Question buffer is full ({BUFFER_DAYS} days ahead)")
+        return
+    logger.info(f"Refilling question buffer for: {', '.join(str(day) for day in missing)}")
+    for day in missing:
+        await generate_with_retries(day)
+
+def _run_refill() -> None:
     try:
-        await generate_daily_questions()
+        asyncio.run(refill_buffer())
     except Exception as e:
-        logger.error(f"Error in daily question generation: {str(e)}")
+        logger.error(f"Error refilling question buffer: {str(e)}")
+    finally:
+        _refill_guard.release()
+
+def start_refill() -> bool:
+    """Refill the buffer on a background thread unless a refill is already running."""
+    if not _refill_guard.acquire(blocking=False):
+        logger.info("Question buffer refill already running")
+        return False
+    threading.Thread(target=_run_refill, name="question-buffer-refill", daemon=True).start()
+    return True
+
+def publish_today() -> None:
+    """At rollover, today's quiz comes straight from the buffer; top the buffer back up."""
+    today = date.today()
+    if today in missing_buffer_dates(today):
+        logger.warning(f"No buffered questions for {today}, generating now")
+    else:
+        logger.info(f"Published buffered questions for {today}")
+    start_refill()
 
 def run_scheduler():
     """Configure and run the scheduler for daily question generation."""
-    logger.info("Starting question generator scheduler")
-    
-    # Run immediately
-    asyncio.run(run_daily_questions())
-    
-    # Schedule for daily runs
-    schedule.every().day.at("00:00").do(lambda: asyncio.run(run_daily_questions()))
-    
+    logger.info(f"Starting question generator scheduler with a {BUFFER_DAYS}-day buffer")
+
+    # Fill the buffer immediately
+    start_refill()
+
+    # Publish at rollover and keep topping up the buffer in the background
+    schedule.every().day.at("00:00").do(publish_today)
+    schedule.every().hour.do(start_refill)
+
     while True:
         try:
             schedule.run_pending()
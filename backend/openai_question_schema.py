@@ -10,4 +10,25 @@ class OpenAIQuestion(BaseModel):
     answers: List[OpenAIAnswer]
 
 class OpenAIQuestionSet(BaseModel):
-    questions: List[OpenAIQuestion]
\ No newline at end of file
+    questions: List[OpenAIQuestion]
+
+def _close_objects(node) -> None:
+    """Mark every object in a JSON schema closed with all properties required, as strict mode expects."""
+    if isinstance(node, dict):
+        if "properties" in node:
+            node["additionalProperties"] = False
+            node["required"] = list(node["properties"])
+        for value in node.values():
+            _close_objects(value)
+    elif isinstance(node, list):
+        for value in node:
+            _close_objects(value)
+
+def json_schema_response_format(model=OpenAIQuestionSet) -> dict:
+    """OpenAI response_format constraining a completion to a pydantic model's JSON schema."""
+    schema = model.model_json_schema()
+    _close_objects(schema)
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": model.__name__, "strict": True, "schema": schema}
+    }
@@ -0,0 +1,102 @@
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+
+class HasherOverloaded(Exception):
+    """Raised when the hashing pool is full or too slow to answer in time."""
+
+def hash_cost(hashed: bytes) -> int:
+    """The work factor stored in a bcrypt hash ($2b$<cost>$...)."""
+    return int(bytes(hashed).split(b'$')[2])
+
+def calibrate_rounds(target_ms: float, minimum: int = MIN_ROUNDS, maximum: int = MAX_ROUNDS) -> int:
+    """Highest bcrypt cost whose hash takes no longer than target_ms on this machine."""
+    start = time.perf_counter()
+    bcrypt.hashpw(b'calibration', bcrypt.gensalt(minimum))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    # Each extra round doubles the work
+    rounds = minimum + math.floor(math.log2(max(target_ms / elapsed_ms, 1)))
+    return min(rounds, maximum)
+
+class PasswordHasher:
+    """bcrypt hashing on a small bounded thread pool instead of the request thread.
+
+    bcrypt releases the GIL, so hashes run in parallel while request
+    threads stay free. At most `workers` jobs run and `max_queue` wait;
+    beyond that, or when a caller waits longer than `timeout`, calls
+    raise HasherOverloaded so the request can fail fast. The cost comes
+    from BCRYPT_ROUNDS. When that is "auto" it is calibrated to
+    BCRYPT_TARGET_MS on first use, separately in every process.
+    """
+
+    def __init__(self, rounds: int = None, workers: int = None, max_queue: int = None, timeout: float = None):
+        configured = rounds or os.getenv('BCRYPT_ROUNDS', '12')
+        self._rounds = None if configured == 'auto' else int(configured)
+        self.workers = workers or int(os.getenv('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv('PASSWORD_HASH_MAX_QUEUE', str(self.workers * 8)))
+        self.timeout = timeout or float(os.getenv('PASSWORD_HASH_TIMEOUT_SECONDS', '5'))
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self._executor = None
+
+    @property
+    def rounds(self) -> int:
+        if self._rounds is None:
+            with self._lock:
+                if self._rounds is None:
+                    target_ms = float(os.getenv('BCRYPT_TARGET_MS', '250'))
+                    self._rounds = calibrate_rounds(target_ms)
+                    logger.info(f"Calibrated bcrypt cost {self._rounds} for a {target_ms:.0f}ms target")
+        return self._rounds
+
+    @rounds.setter
+    def rounds(self, value: int) -> None:
+        self._rounds = value
+
+    def _run(self, fn, *args):
+        """Run fn on the pool, raising HasherOverloaded instead of queueing without bound."""
+        if not self._slots.acquire(blocking=False):
+            raise HasherOverloaded(f"{self.workers + self.max_queue} password hashes already pending")
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='bcrypt')
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HasherOverloaded(f"Password hash took longer than {self.timeout}s")
+
+    def hash(self, password: str) -> bytes:
+        salt = bcrypt.gensalt(self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt)
+
+    def verify(self, password: str, hashed: bytes) -> bool:
+        # Postgres hands bytea columns back as memoryview
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), bytes(hashed))
+
+    def needs_rehash(self, hashed: bytes) -> bool:
+        """Whether a stored hash was made with a lower cost than the current one.
+
+        Hashes are never downgraded, so workers or hosts settling on
+        different costs do not keep re-hashing the same password.
+        """
+        return hash_cost(hashed) < self.rounds
+
+if __name__ == "__main__":
+    target_ms = float(os.getenv('BCRYPT_TARGET_MS', '250'))
+    print(f"BCRYPT_ROUNDS={calibrate_rounds(target_ms)}  # about {target_ms:.0f}ms per hash on this machine")
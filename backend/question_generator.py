@@ -1,84 +1,148 @@
+import asyncio
 import json
 import logging
 import os
+import time
 from datetime import date
-from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
-from langchain_core.prompts.chat import (
-    HumanMessagePromptTemplate,
-    ChatPromptTemplate,
-    SystemMessagePromptTemplate,
-)
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain.output_parsers import PydanticOutputParser
-from jinja2 import Environment, FileSystemLoader
-from .app import app, db, DailyQuestions
-from .article_ingestion import ArticleIngestion
+from .app import app_context, db, DailyQuestions, GenerationTrace, questions_events
+from .dedup_index import DedupIndex, dedup_index
+from .article_ingestion import ArticleIngestion, create_article_ingestion
 from .article_processor import ArticleProcessor
-from .openai_question_schema import OpenAIQuestionSet
-from .jinja_helper import process_template
+from .generation_planner import FUSED, PER_CHUNK, GenerationPlanner
+from .question_stream import QuestionStreamParser
+from .openai_question_schema import OpenAIQuestion, OpenAIQuestionSet, json_schema_response_format
+from .jinja_helper import get_prompt_registry
+from .generation_lock import GenerationLock
+from .instrumentation import Trace, annotate, annotate_trace, count, span, timed_iter, trace
+from .llm_cache import CachedChatModel, shared_cache_backend
+from .llm_rate_limit import RateLimitedChatModel
 
-# Load environment variables
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-# Configure Jinja2 environment
-template_env = Environment(
-    loader=FileSystemLoader('backend/prompts'),
-    trim_blocks=True,
-    lstrip_blocks=True
-)
+# Parsing is stateless, so one parser and its format instructions serve every chunk
+quiz_parser = PydanticOutputParser(pydantic_object=OpenAIQuestionSet)
+QUIZ_FORMAT_INSTRUCTIONS = quiz_parser.get_format_instructions()
+# Structured mode sends the schema itself instead of format instructions and an example
+QUIZ_RESPONSE_FORMAT = json_schema_response_format(OpenAIQuestionSet)
+QUIZ_OUTPUT_MODES = ("text", "structured")
+NUM_ANSWERS = 4
+
+def validate_questions(raw_questions: list, num_answers: int = NUM_ANSWERS, start: int = 0,
+                       is_repeat=None) -> tuple[list, list]:
+    """Validate questions one by one, returning (valid question dicts, reasons the others were rejected).
+
+    is_repeat, when given, rejects questions that were already asked on an earlier day.
+    """
+    valid, errors = [], []
+    for i, raw in enumerate(raw_questions, start):
+        try:
+            question = OpenAIQuestion.model_validate(raw)
+        except ValueError as e:
+            errors.append(f"question {i+1} does not match the schema: {str(e).splitlines()[0]}")
+            continue
+        correct = sum(answer.is_correct for answer in question.answers)
+        if len(question.answers) != num_answers:
+            errors.append(f"question {i+1} has {len(question.answers)} answers instead of {num_answers}")
+        elif correct != 1:
+            errors.append(f"question {i+1} has {correct} correct answers instead of 1")
+        elif not question.text.strip() or any(not answer.text.strip() for answer in question.answers):
+            errors.append(f"question {i+1} has an empty question or answer")
+        elif is_repeat and is_repeat(question.model_dump()):
+            errors.append(f"question {i+1} repeats a question from an earlier day")
+        else:
+            valid.append(question.model_dump())
+    return valid, errors
+
+def create_chat_model():
+    """Create the ChatOpenAI client behind the rate limiter, wrapped in the response cache when one is configured."""
+    logger.info("Initializing ChatOpenAI...")
+    try:
+        # Retries are left to RateLimitedChatModel, which also paces calls to the shared budget
+        model = RateLimitedChatModel(ChatOpenAI(
+            model_name="gpt-4o",
+            api_key=os.getenv('OPENAI_API_KEY'),
+            max_retries=0
+        ))
+        logger.info("ChatOpenAI initialized successfully")
+        cache_backend = shared_cache_backend()
+        if cache_backend is not None:
+            model = CachedChatModel(model, cache_backend)
+            logger.info(f"LLM response cache enabled ({type(cache_backend).__name__})")
+        return model
+    except Exception as e:
+        logger.error(f"Error initializing ChatOpenAI: {str(e)}")
+        raise
 
 class QuestionGenerator:
-    def __init__(self):
-        self.article_ingestion = ArticleIngestion()
-        self.article_processor = ArticleProcessor()
+    def __init__(self, model=None, max_concurrency: int = None, llm_semaphore: asyncio.Semaphore = None,
+                 article_ingestion: ArticleIngestion = None, article_processor: ArticleProcessor = None,
+                 planner: GenerationPlanner = None, output_mode: str = None, max_repair_attempts: int = None,
+                 dedup_index: DedupIndex = None):
+        # Repeats of earlier days' articles and questions are dropped when an index is given
+        self.dedup_index = dedup_index
+        self.article_ingestion = article_ingestion or create_article_ingestion(dedup_index)
+        self.article_processor = article_processor or ArticleProcessor()
+        self.planner = planner or GenerationPlanner()
+        self.plan = None
+        self.llm_calls = 0
         self.questions = []
-        
-        logger.info("Initializing ChatOpenAI...")
-        try:
-            self.model = ChatOpenAI(
-                model_name="gpt-4o",
-                api_key=os.getenv('OPENAI_API_KEY')
-            )
-            logger.info("ChatOpenAI initialized successfully")
-        except Exception as e:
-            logger.error(f"Error initializing ChatOpenAI: {str(e)}")
-            raise
+        self.chunk_errors = []
+        # Maximum number of LLM calls in flight at once across all chunks
+        self.max_concurrency = max_concurrency or int(os.getenv('MAX_CONCURRENT_LLM_CALLS', '4'))
+        # A semaphore shared between generators caps in-flight calls across all of them
+        self.llm_semaphore = llm_semaphore
+        self.model = model if model is not None else create_chat_model()
+        # "structured" asks for JSON-schema output and re-requests only the questions that fail validation
+        self.output_mode = output_mode or os.getenv('QUIZ_OUTPUT_MODE', 'text')
+        if self.output_mode not in QUIZ_OUTPUT_MODES:
+            raise ValueError(f"Unknown quiz output mode: {self.output_mode}")
+        self.max_repair_attempts = (max_repair_attempts if max_repair_attempts is not None
+                                    else int(os.getenv('QUIZ_MAX_REPAIR_ATTEMPTS', '2')))
+        self.repaired_questions = 0
+
+    def _is_repeat(self, question: dict) -> bool:
+        return self.dedup_index is not None and self.dedup_index.question_repeat(question)
+
+    def _build_synthesis_messages(self, chunk: str) -> list:
+        """Build the chat messages asking the model to synthesize key facts from a chunk."""
+        system_prompt = get_prompt_registry().render_static("synthesize_text.jinja", {"num_key_facts": "10"})
+        return [SystemMessage(content=system_prompt), HumanMessage(content=chunk)]
+
+    def _build_quiz_messages(self, synthesized_text: str, num_questions: int) -> list:
+        """Build the chat messages asking the model to write quiz questions from synthesized facts."""
+        data = {
+            "num_quiz_questions": str(num_questions),
+            "num_total_possible_answers": str(NUM_ANSWERS),
+            "tone": "short and to the point"
+        }
+        if self.output_mode == "structured":
+            data["structured_output"] = True
+        else:
+            data["format_instructions"] = QUIZ_FORMAT_INSTRUCTIONS
+        system_prompt = get_prompt_registry().render_static("create_multiple_choice_quiz.jinja", data)
+        return [SystemMessage(content=system_prompt), HumanMessage(content=synthesized_text)]
+
+    def _build_repair_messages(self, synthesized_text: str, num_questions: int,
+                               accepted: list, errors: list) -> list:
+        """Build the chat messages re-requesting only the questions that failed validation."""
+        feedback = "Some questions were rejected: " + "; ".join(errors) + "."
+        if accepted:
+            feedback += " Do not repeat these accepted questions: " + " | ".join(q["text"] for q in accepted)
+        feedback += f" Write {num_questions} replacement question{'s' if num_questions != 1 else ''}."
+        return self._build_quiz_messages(synthesized_text, num_questions) + [HumanMessage(content=feedback)]
 
     def generate_questions_for_chunk(self, chunk: str, num_questions: int = 4) -> None:
         """Generates questions for a given chunk using OpenAI API."""
         try:
             # First synthesize the text to extract key information
-            query_template = process_template("synthesize_text.jinja", {"num_key_facts": "10"})
-            query = SystemMessagePromptTemplate.from_template(query_template)
-            text = HumanMessagePromptTemplate.from_template(chunk)
-            chat_prompt = ChatPromptTemplate.from_messages(messages=[query, text])    
-            chat_prompt_formatted = chat_prompt.format_prompt()
-            synthesized_text = self.model.invoke(chat_prompt_formatted.to_messages()).content
+            synthesized_text = self.model.invoke(self._build_synthesis_messages(chunk)).content
             
             # Generate quiz questions from synthesized text
-            parser = PydanticOutputParser(pydantic_object=OpenAIQuestionSet)
-            query_template = process_template(
-                "create_multiple_choice_quiz.jinja",
-                {
-                    "num_quiz_questions": str(num_questions),
-                    "num_total_possible_answers": "4", 
-                    "tone": "short and to the point",
-                    "format_instructions": parser.get_format_instructions()
-                }
-            )
-            query = SystemMessagePromptTemplate.from_template(query_template)
-            text = HumanMessagePromptTemplate.from_template(synthesized_text)
-            chat_prompt = ChatPromptTemplate.from_messages(messages=[query, text])
-            chat_prompt_formatted = chat_prompt.format_prompt()
-            response = self.model.invoke(chat_prompt_formatted.to_messages())
-            questions_data = parser.parse(response.content)
+            response = self.model.invoke(self._build_quiz_messages(synthesized_text, num_questions))
+            questions_data = quiz_parser.parse(response.content)
             
             # Update questions list with the parsed data
             self.questions.extend(questions_data.model_dump()['questions'])
@@ -90,16 +154,154 @@ class QuestionGenerator:
             logger.error(f"Response content: {response.content if 'response' in locals() else 'No response'}")
             raise
 
+    async def _ainvoke(self, messages: list, semaphore: asyncio.Semaphore, stage: str = "quiz", **kwargs):
+        """Make one LLM call, holding the semaphore only while it is in flight, timed as an llm.<stage> span."""
+        queued = time.perf_counter()
+        async with semaphore:
+            self.llm_calls += 1
+            with span(f"llm.{stage}", queued_ms=round((time.perf_counter() - queued) * 1000, 1)):
+                count("llm_calls")
+                return await self.model.ainvoke(messages, **kwargs)
+
+    async def _asynthesize(self, chunk: str, semaphore: asyncio.Semaphore) -> str:
+        return (await self._ainvoke(self._build_synthesis_messages(chunk), semaphore, "synthesis")).content
+
+    async def _aquiz_structured(self, source_text: str, num_questions: int, semaphore: asyncio.Semaphore,
+                                accepted: list = None, errors: list = None) -> list:
+        """Request schema-constrained questions, re-requesting only those that fail validation.
+
+        Passing the questions already accepted and the reasons others were
+        rejected skips the first request and starts with a repair.
+        """
+        accepted = list(accepted or [])
+        first_attempt = 1 if errors else 0
+        for attempt in range(first_attempt, self.max_repair_attempts + 1):
+            missing = num_questions - len(accepted)
+            if attempt == 0:
+                messages = self._build_quiz_messages(source_text, num_questions)
+            else:
+                self.repaired_questions += missing
+                messages = self._build_repair_messages(source_text, missing, accepted, errors)
+            response = await self._ainvoke(messages, semaphore, "repair" if attempt else "quiz",
+                                           response_format=QUIZ_RESPONSE_FORMAT)
+            try:
+                raw_questions = json.loads(response.content)["questions"]
+                valid, errors = validate_questions(raw_questions, is_repeat=self._is_repeat)
+            except (ValueError, KeyError, TypeError) as e:
+                valid, errors = [], [f"the response was not a question set ({str(e)})"]
+            accepted.extend(valid[:missing])
+            missing = num_questions - len(accepted)
+            if missing <= 0:
+                return accepted
+            if not errors:
+                errors = [f"{missing} question{'s were' if missing != 1 else ' was'} missing"]
+            logger.warning(f"Quiz attempt {attempt + 1}: {'; '.join(errors)}")
+
+        if not accepted:
+            raise Exception(f"No valid questions after {self.max_repair_attempts + 1} attempts: {'; '.join(errors or [])}")
+        logger.warning(f"Keeping {len(accepted)} of {num_questions} questions after {self.max_repair_attempts} repairs")
+        return accepted
+
+    async def _aquiz(self, source_text: str, num_questions: int, semaphore: asyncio.Semaphore) -> list:
+        if self.output_mode == "structured":
+            return await self._aquiz_structured(source_text, num_questions, semaphore)
+        try:
+            response = await self._ainvoke(self._build_quiz_messages(source_text, num_questions), semaphore)
+            questions = quiz_parser.parse(response.content).model_dump()['questions']
+            fresh = [question for question in questions if not self._is_repeat(question)]
+            if len(fresh) < len(questions):
+                logger.info(f"Dropped {len(questions) - len(fresh)} questions repeated from earlier days")
+            return fresh
+        except Exception as e:
+            logger.error(f"Error generating quiz: {str(e)}")
+            logger.error(f"Response content: {response.content if 'response' in locals() else 'No response'}")
+            raise
+
+    async def agenerate_questions_for_chunk(self, chunk: str, semaphore: asyncio.Semaphore,
+                                            num_questions: int = 4) -> list:
+        """Asynchronously generate questions for a chunk and return them.
+
+        Each LLM call holds the semaphore only while it is in flight, so the
+        synthesis stage of one chunk overlaps the quiz stage of another.
+        """
+        try:
+            synthesized_text = await self._asynthesize(chunk, semaphore)
+            questions = await self._aquiz(synthesized_text, num_questions, semaphore)
+            logger.info(f"Generated {len(questions)} questions from chunk")
+            return questions
+            
+        except Exception as e:
+            logger.error(f"Error in agenerate_questions_for_chunk: {str(e)}")
+            logger.error(f"Synthesized text: {synthesized_text if 'synthesized_text' in locals() else 'No synthesized text'}")
+            raise
+
+    def _collect(self, results: list, stage: str) -> list:
+        """Split gathered results into successes and chunk_errors, raising if every chunk failed."""
+        successes = []
+        for i, result in enumerate(results):
+            if isinstance(result, BaseException):
+                logger.error(f"Chunk {i+1} of {len(results)} failed: {str(result)}")
+                self.chunk_errors.append((i, result))
+            else:
+                successes.append(result)
+        if results and not successes:
+            raise Exception(f"All {len(results)} chunks failed to {stage}") from self.chunk_errors[0][1]
+        return successes
+
+    async def _process_per_chunk(self, semaphore: asyncio.Semaphore) -> None:
+        """Synthesize and quiz every chunk, starting each as soon as the chunker yields it."""
+        tasks = []
+        for chunk in timed_iter("chunking", self.article_processor.iter_chunks(self.article_ingestion.article_text)):
+            tasks.append(asyncio.create_task(self.agenerate_questions_for_chunk(chunk, semaphore)))
+            await asyncio.sleep(0)  # let the new task send its request while chunking continues
+        logger.info(f"Processing {len(tasks)} chunks")
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        
+        # Collect results in chunk order so question order stays deterministic
+        for questions in self._collect(results, "generate questions"):
+            self.questions.extend(questions)
+
+    def _prompt_overhead(self) -> tuple[int, int]:
+        """Token counts of the synthesis and quiz system prompts."""
+        count = self.article_processor.count_tokens
+        synthesis = self._build_synthesis_messages("")[0].content
+        quiz = self._build_quiz_messages("", self.planner.target_questions)[0].content
+        return count(synthesis), count(quiz)
+
+    async def _plan_quiz_source(self, semaphore: asyncio.Semaphore) -> str:
+        """Chunk and plan the article, returning the text the single quiz call is written from."""
+        with span("chunking") as chunking:
+            chunks = list(self.article_processor.iter_chunks(self.article_ingestion.article_text))
+            chunking.attrs["items"] = len(chunks)
+        self.plan = self.planner.plan(self.article_processor.chunk_token_counts, *self._prompt_overhead(),
+                                      article_tokens=self.article_processor.article_tokens)
+        annotate(strategy=self.plan.strategy)
+        if self.plan.strategy == FUSED:
+            # The article itself, not its chunks, which repeat their overlap at every boundary
+            return self.article_ingestion.article_text
+        
+        # Map: synthesize the planned chunks concurrently; the quiz call reduces all facts at once
+        results = await asyncio.gather(
+            *(self._asynthesize(chunks[i], semaphore) for i in self.plan.chunk_indices),
+            return_exceptions=True
+        )
+        return "\n\n".join(self._collect(results, "synthesize"))
+
     async def process_article(self) -> None:
-        """Process article and generate questions."""
+        """Process article and generate questions using the cheapest planned strategy."""
         try:
-            # Process the text into chunks
-            self.article_processor.process_text(self.article_ingestion.article_text)
+            self.chunk_errors = []
+            semaphore = self.llm_semaphore or asyncio.Semaphore(self.max_concurrency)
             
-            # Generate questions for each chunk
-            for i, chunk in enumerate(self.article_processor.chunks):
-                logger.info(f"Processing chunk {i+1} of {len(self.article_processor.chunks)}")
-                self.generate_questions_for_chunk(chunk)
+            if self.planner.strategy == PER_CHUNK:
+                # Nothing to plan: stream chunks straight into synthesis and quiz calls
+                await self._process_per_chunk(semaphore)
+            else:
+                source_text = await self._plan_quiz_source(semaphore)
+                self.questions.extend(await self._aquiz(source_text, self.plan.num_questions, semaphore))
+                self.plan.actual_calls = self.llm_calls
+                annotate_trace(plan=self.plan.to_dict())
+                logger.info(f"Generation plan results: {self.plan.to_dict()}")
             
             logger.info(f"Generated total of {len(self.questions)} questions")
             
@@ -107,49 +309,223 @@ class QuestionGenerator:
             logger.error(f"Error processing article: {str(e)}", exc_info=True)
             raise
 
-async def generate_daily_questions():
-    with app.app_context():
-        today = date.today()
-        logger.info(f"Starting daily question generation for {today}")
+    async def _astream_quiz(self, source_text: str, num_questions: int, semaphore: asyncio.Semaphore):
+        """Stream the quiz call, yielding each valid question as soon as it has been parsed."""
+        kwargs = {"response_format": QUIZ_RESPONSE_FORMAT} if self.output_mode == "structured" else {}
+        parser = QuestionStreamParser()
+        accepted, errors = [], []
+        queued = time.perf_counter()
+        async with semaphore:
+            self.llm_calls += 1
+            with span("llm.quiz_stream", queued_ms=round((time.perf_counter() - queued) * 1000, 1)) as streaming:
+                count("llm_calls")
+                started = time.perf_counter()
+                async for chunk in self.model.astream(self._build_quiz_messages(source_text, num_questions), **kwargs):
+                    streaming.attrs.setdefault("first_chunk_ms", round((time.perf_counter() - started) * 1000, 1))
+                    for raw in parser.feed(chunk.content):
+                        valid, rejected = validate_questions([raw], start=parser.count - 1, is_repeat=self._is_repeat)
+                        errors.extend(rejected)
+                        for question in valid[:num_questions - len(accepted)]:
+                            accepted.append(question)
+                            yield question
+        
+        if len(accepted) < num_questions and self.output_mode == "structured" and self.max_repair_attempts:
+            errors = errors or [f"{num_questions - len(accepted)} questions were missing"]
+            repaired = await self._aquiz_structured(source_text, num_questions, semaphore, accepted, errors)
+            for question in repaired[len(accepted):]:
+                yield question
+        elif not accepted:
+            raise Exception(f"No valid questions in the streamed quiz: {'; '.join(errors) or 'empty response'}")
+
+    async def astream_questions(self):
+        """Generate questions like process_article, yielding each one as soon as it is ready.
+
+        The planned strategies stream their single quiz call; the per-chunk
+        strategy yields each chunk's questions as that chunk finishes.
+        """
+        self.chunk_errors = []
+        semaphore = self.llm_semaphore or asyncio.Semaphore(self.max_concurrency)
         
-        # Check if questions already exist for today
-        existing = DailyQuestions.query.filter_by(date=today).first()
+        if self.planner.strategy == PER_CHUNK:
+            tasks = [
+                asyncio.create_task(self.agenerate_questions_for_chunk(chunk, semaphore))
+                for chunk in timed_iter("chunking", self.article_processor.iter_chunks(self.article_ingestion.article_text))
+            ]
+            pending = set(tasks)
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in sorted(done, key=tasks.index):
+                        if task.exception() is not None:
+                            logger.error(f"Chunk {tasks.index(task)+1} of {len(tasks)} failed: {str(task.exception())}")
+                            self.chunk_errors.append((tasks.index(task), task.exception()))
+                            continue
+                        for question in task.result():
+                            self.questions.append(question)
+                            yield question
+            finally:
+                for task in pending:
+                    task.cancel()
+            if tasks and not self.questions:
+                raise Exception(f"All {len(tasks)} chunks failed to generate questions") from self.chunk_errors[0][1]
+        else:
+            source_text = await self._plan_quiz_source(semaphore)
+            async for question in self._astream_quiz(source_text, self.plan.num_questions, semaphore):
+                self.questions.append(question)
+                yield question
+            self.plan.actual_calls = self.llm_calls
+            annotate_trace(plan=self.plan.to_dict())
+            logger.info(f"Generation plan results: {self.plan.to_dict()}")
+
+def source_data(question_gen: QuestionGenerator) -> dict:
+    """The source block stored alongside the questions."""
+    return {
+        'title': question_gen.article_ingestion.article_title,
+        'preview': question_gen.article_ingestion.article_text[:200] + '...'
+    }
+
+async def build_questions_data(question_gen: QuestionGenerator) -> dict:
+    """Run ingestion and generation, returning the payload stored in DailyQuestions."""
+    # Get random article
+    logger.info("Fetching random Wikipedia article...")
+    with span("ingestion"):
+        await question_gen.article_ingestion.get_random_article()
+    
+    # Process article and generate questions
+    logger.info("Processing article content...")
+    with span("generation"):
+        await question_gen.process_article()
+    
+    # Prepare data for storage
+    return {
+        'questions': question_gen.questions,
+        'source': source_data(question_gen)
+    }
+
+def daily_rows(day: date, questions_data: dict, run: Trace = None) -> list:
+    """The DailyQuestions row for a day, plus its article's signature when the dedup index picked it
+    and the trace of the run that generated it."""
+    rows = [DailyQuestions(date=day, questions=json.dumps(questions_data))]
+    signature = dedup_index.signature_row(day, questions_data['source']['title'])
+    if signature is not None:
+        rows.append(signature)
+    if run is not None:
+        rows.append(GenerationTrace(date=day, trace=json.dumps(run.to_dict())))
+    return rows
+
+async def generate_daily_questions(target_date: date = None, lock_timeout: float = None):
+    """Generate and store the questions for target_date (default today) unless they already exist.
+
+    Only one caller per date runs the pipeline, across processes; others
+    wait up to lock_timeout seconds and then raise GenerationInProgress.
+    """
+    with app_context():
+        day = target_date or date.today()
+        logger.info(f"Starting daily question generation for {day}")
+        
+        # Check if questions already exist for the date
+        existing = DailyQuestions.query.filter_by(date=day).first()
         if existing:
-            logger.info("Questions already exist for today")
+            logger.info(f"Questions already exist for {day}")
             return
         
+        if lock_timeout is None:
+            lock_timeout = float(os.getenv('GENERATION_LOCK_TIMEOUT_SECONDS', '900'))
+        lock = GenerationLock(db.engine, day)
+        await asyncio.to_thread(lock.acquire, lock_timeout)
+        stored = False
+        
         try:
-            question_gen = QuestionGenerator()
-            
-            # Get random article
-            logger.info("Fetching random Wikipedia article...")
-            await question_gen.article_ingestion.get_random_article()
+            # Another caller may have finished generating while we waited for the lock
+            db.session.rollback()
+            if DailyQuestions.query.filter_by(date=day).first():
+                logger.info(f"Questions were generated for {day} while waiting for the lock")
+                return
             
-            # Process article and generate questions
-            logger.info("Processing article content...")
-            await question_gen.process_article()
+            dedup_index.refresh()
+            question_gen = QuestionGenerator(dedup_index=dedup_index)
+            with trace(f"generate {day}") as run:
+                questions_data = await build_questions_data(question_gen)
             
-            # Prepare data for storage
-            questions_data = {
-                'questions': question_gen.questions,
-                'source': {
-                    'title': question_gen.article_ingestion.article_title,
-                    'preview': question_gen.article_ingestion.article_text[:200] + '...'
-                }
-            }
-            
-            # Store in database
-            daily_questions = DailyQuestions(
-                date=today,
-                questions=json.dumps(questions_data)
-            )
-            db.session.add(daily_questions)
+            # Store in database, with the run's trace
+            db.session.add_all(daily_rows(day, questions_data, run))
             db.session.commit()
-            logger.info(f"Successfully stored questions for {today}")
+            stored = True
+            logger.info(f"Successfully stored questions for {day}")
             
             # Log a summary
             logger.info(f"Generated {len(question_gen.questions)} questions from article: {question_gen.article_ingestion.article_title}")
+            model = question_gen.model
+            if isinstance(model, CachedChatModel):
+                logger.info(f"LLM cache stats: {model.stats()}")
+                model = model.model
+            if isinstance(model, RateLimitedChatModel):
+                logger.info(f"LLM rate limit stats: {model.stats()}")
             
         except Exception as e:
             logger.error(f"Error generating daily questions: {str(e)}", exc_info=True)
             raise
+        finally:
+            if 'question_gen' in locals():
+                dedup_index.release_article(question_gen.article_ingestion.article_title, stored)
+                await question_gen.article_ingestion.close()
+            lock.release()
+
+
+async def stream_daily_questions(target_date: date = None, lock_timeout: float = None):
+    """Generate and store a day's questions like generate_daily_questions, yielding (event, data) pairs.
+
+    Yields ("source", ...) as soon as the article is chosen, ("question", ...)
+    for each question as it is parsed from the streamed quiz response and
+    ("done", ...) once the set is stored. A day that is already stored, or
+    is stored by another caller while waiting for the lock, is replayed.
+    """
+    with app_context():
+        day = target_date or date.today()
+        existing = DailyQuestions.query.filter_by(date=day).first()
+        if existing:
+            for event in questions_events(json.loads(existing.questions)):
+                yield event
+            return
+        
+        if lock_timeout is None:
+            lock_timeout = float(os.getenv('GENERATION_LOCK_TIMEOUT_SECONDS', '900'))
+        lock = GenerationLock(db.engine, day)
+        await asyncio.to_thread(lock.acquire, lock_timeout)
+        stored = False
+        
+        try:
+            db.session.rollback()
+            existing = DailyQuestions.query.filter_by(date=day).first()
+            if existing:
+                for event in questions_events(json.loads(existing.questions)):
+                    yield event
+                return
+            
+            dedup_index.refresh()
+            question_gen = QuestionGenerator(dedup_index=dedup_index)
+            logger.info(f"Streaming question generation for {day}")
+            with trace(f"stream {day}") as run:
+                with span("ingestion"):
+                    await question_gen.article_ingestion.get_random_article()
+                source = source_data(question_gen)
+                yield "source", source
+                
+                with span("generation"):
+                    async for question in question_gen.astream_questions():
+                        yield "question", question
+            
+            db.session.add_all(daily_rows(day, {'questions': question_gen.questions, 'source': source}, run))
+            db.session.commit()
+            stored = True
+            logger.info(f"Successfully stored {len(question_gen.questions)} streamed questions for {day}")
+            yield "done", {"count": len(question_gen.questions)}
+            
+        except Exception as e:
+            logger.error(f"Error streaming daily questions: {str(e)}", exc_info=True)
+            raise
+        finally:
+            if 'question_gen' in locals():
+                dedup_index.release_article(question_gen.article_ingestion.article_title, stored)
+                await question_gen.article_ingestion.close()
+            lock.release()
@@ -0,0 +1,55 @@
+import json
+from typing import Iterator
+
+class QuestionStreamParser:
+    """Pull complete question objects out of a quiz response while it is still streaming.
+
+    Text is fed in arbitrary pieces. Every object that closes directly
+    inside the first array of the response (the "questions" list) is
+    decoded and yielded at once, so callers never wait for the closing
+    brackets of the whole set. Anything around the JSON, such as a
+    markdown fence, is ignored.
+    """
+
+    def __init__(self):
+        self._buffer = []      # text of the object being read
+        self._stack = []       # open '{' and '[' outside strings
+        self._in_string = False
+        self._escaped = False
+        self._array_depth = None
+        self.count = 0
+
+    def feed(self, text: str) -> Iterator[dict]:
+        for char in text:
+            capturing = self._array_depth is not None and len(self._stack) > self._array_depth
+            if capturing:
+                self._buffer.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._stack.append(char)
+                if char == "[" and self._array_depth is None:
+                    self._array_depth = len(self._stack)
+                elif char == "{" and len(self._stack) == (self._array_depth or 0) + 1:
+                    self._buffer = ["{"]
+            elif char in "}]" and self._stack:
+                self._stack.pop()
+                if char == "}" and self._array_depth is not None and len(self._stack) == self._array_depth:
+                    raw = "".join(self._buffer)
+                    self._buffer = []
+                    try:
+                        question = json.loads(raw)
+                    except ValueError:
+                        continue
+                    self.count += 1
+                    yield question
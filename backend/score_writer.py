@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from datetime import timedelta
+from typing import Callable
+from sqlalchemy import Table, and_, bindparam, case
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+def dialect_insert(connection: Connection, table: Table):
+    """An INSERT for the connection's dialect, which supports ON CONFLICT clauses."""
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif connection.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"No conflict-aware insert for {connection.dialect.name}")
+    return insert(table)
+
+def insert_scores(connection: Connection, table: Table, rows: list[dict]) -> set[tuple]:
+    """Insert score rows in one statement, skipping any (user_id, date) already stored.
+
+    Returns the (user_id, date) keys that were actually inserted, so a
+    conflict on the unique index doubles as the "already submitted" check.
+    """
+    statement = (
+        dialect_insert(connection, table)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=['user_id', 'date'])
+        .returning(table.c.user_id, table.c.date)
+    )
+    return {(row.user_id, row.date) for row in connection.execute(statement)}
+
+def update_user_stats(connection: Connection, table: Table, rows: list[dict]) -> None:
+    """Fold newly inserted scores into each player's running totals and streaks.
+
+    One upsert per score, in date order, so totals stay correct without
+    ever rereading a player's history. A streak continues when the last
+    score was for the day before and restarts at 1 otherwise.
+    """
+    if not rows:
+        return
+    insert = dialect_insert(connection, table)
+    continues = table.c.last_played == bindparam('previous_day')
+    statement = insert.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={
+            'games_played': table.c.games_played + 1,
+            'total_score': table.c.total_score + insert.excluded.total_score,
+            'current_streak': case((continues, table.c.current_streak + 1), else_=1),
+            'best_streak': case(
+                (and_(continues, table.c.current_streak + 1 > table.c.best_streak), table.c.current_streak + 1),
+                else_=table.c.best_streak,
+            ),
+            'last_played': insert.excluded.last_played,
+        },
+    )
+    # Separate executions: a batched VALUES list could not upsert one player twice
+    for row in sorted(rows, key=lambda row: row['date']):
+        connection.execute(statement, {
+            'user_id': row['user_id'],
+            'games_played': 1,
+            'total_score': row['score'],
+            'current_streak': 1,
+            'best_streak': 1,
+            'last_played': row['date'],
+            'previous_day': row['date'] - timedelta(days=1),
+        })
+
+def update_score_counts(connection: Connection, table: Table, rows: list[dict]) -> None:
+    """Add newly inserted scores to the per-day count of players at each score.
+
+    The (date, score) rows stay a handful per day, so the day's
+    distribution is read back without aggregating the score table.
+    """
+    counts = Counter((row['date'], row['score']) for row in rows)
+    if not counts:
+        return
+    insert = dialect_insert(connection, table)
+    statement = insert.on_conflict_do_update(
+        index_elements=['date', 'score'],
+        set_={'players': table.c.players + insert.excluded.players},
+    )
+    for (day, score), players in sorted(counts.items()):
+        connection.execute(statement, {'date': day, 'score': score, 'players': players})
+
+class ScoreWriter:
+    """Optional write-behind buffer that inserts concurrent score submissions in small batches.
+
+    Each caller blocks until the batch holding its score is committed, so
+    it still learns whether the score was new, but a burst of submissions
+    costs one insert and one commit per batch_size scores (or per
+    max_delay seconds) instead of one each. Enabled with SCORE_WRITE_BEHIND.
+    """
+
+    def __init__(self, record: Callable[[Connection, list[dict]], set[tuple]], batch_size: int = None,
+                 max_delay: float = None, enabled: bool = None):
+        # record(connection, rows) stores the rows and returns the inserted (user_id, date) keys
+        self.record = record
+        self.batch_size = batch_size or int(os.getenv('SCORE_BATCH_SIZE', '50'))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv('SCORE_BATCH_MAX_DELAY_MS', '20')) / 1000
+        self.enabled = enabled if enabled is not None else os.getenv('SCORE_WRITE_BEHIND', 'false').lower() == 'true'
+        self.batches = 0
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        # Forked children start with an empty buffer and their own flusher thread
+        self._condition = threading.Condition()
+        self._pending = []  # (engine, row, future)
+        self._thread = None
+
+    def submit(self, engine: Engine, row: dict, timeout: float = 5) -> bool:
+        """Queue a score and wait for its batch; True if it was inserted, False if already stored."""
+        future = Future()
+        with self._condition:
+            self._pending.append((engine, row, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="score-writer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future.result(timeout)
+
+    def _take_batch(self) -> list:
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            # Give concurrent submissions a moment to join the batch
+            deadline = time.monotonic() + self.max_delay
+            while len(self._pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            engine = self._pending[0][0]
+            batch, rest = [], []
+            for entry in self._pending:
+                (batch if entry[0] is engine and len(batch) < self.batch_size else rest).append(entry)
+            self._pending = rest
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            self.write_batch(batch[0][0], [(row, future) for _, row, future in batch])
+
+    def write_batch(self, engine: Engine, batch: list[tuple[dict, Future]]) -> None:
+        """Insert a batch in one transaction and resolve each caller's future.
+
+        If the batch fails, its rows are retried one at a time, so only the
+        caller whose row is at fault gets the error.
+        """
+        try:
+            with engine.begin() as connection:
+                inserted = self.record(connection, [row for row, _ in batch])
+            self.batches += 1
+        except Exception as e:
+            if len(batch) > 1:
+                logger.warning(f"Error writing batch of {len(batch)} scores, retrying one at a time: {str(e)}")
+                for entry in batch:
+                    self.write_batch(engine, [entry])
+                return
+            logger.error(f"Error writing score: {str(e)}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        claimed = set()
+        for row, future in batch:
+            # Only the first submission of a key in the batch was inserted
+            key = (row['user_id'], row['date'])
+            future.set_result(key in inserted and key not in claimed)
+            claimed.add(key)
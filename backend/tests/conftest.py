@@ -0,0 +1,26 @@
+import os
+import pytest
+import tiktoken
+
+# Keep the app off the production Postgres URL during tests
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+# Cheapest bcrypt cost so sign-ups in tests stay fast
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+
+class WhitespaceEncoder:
+    """Offline stand-in for a tiktoken encoding: one token per whitespace-separated word."""
+
+    def encode(self, text: str) -> list:
+        return text.split()
+
+    def decode(self, tokens: list) -> str:
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def fake_encoder(monkeypatch):
+    """Avoid downloading the tiktoken BPE file in tests."""
+    encoder = WhitespaceEncoder()
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model_name: encoder)
+    return encoder
@@ -0,0 +1,62 @@
+from aiohttp import web
+
+
+class StubMediaWiki:
+    """Minimal local stand-in for the MediaWiki action API used by ArticleIngestion."""
+
+    def __init__(self, categories: dict, pages: dict, disambiguation: set = frozenset(), page_size: int = 50):
+        self.categories = categories
+        self.pages = pages
+        self.disambiguation = set(disambiguation)
+        self.page_size = page_size
+        self.requests = []
+        self.peers = set()
+        self.runner = None
+        self.api_url = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        params = request.query
+        self.requests.append(dict(params))
+        self.peers.add(request.transport.get_extra_info('peername'))
+        if params.get("list") == "categorymembers":
+            return web.json_response(self._category_members(params))
+        if "extracts" in params.get("prop", ""):
+            return web.json_response(self._extract(params["titles"]))
+        return web.json_response({"error": {"code": "badrequest"}}, status=400)
+
+    def _category_members(self, params) -> dict:
+        category = params["cmtitle"].split(":", 1)[1]
+        members = [
+            {"ns": 0, "title": title, "timestamp": f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}Z"}
+            for i, title in enumerate(self.categories.get(category, []))
+        ]
+        if "cmstart" in params:
+            members = [m for m in members if m["timestamp"] >= params["cmstart"]]
+        start = int(params.get("cmcontinue", 0))
+        limit = min(int(params.get("cmlimit", 10)), self.page_size)
+        data = {"query": {"categorymembers": members[start:start + limit]}}
+        if start + limit < len(members):
+            data["continue"] = {"cmcontinue": str(start + limit), "continue": "-||"}
+        return data
+
+    def _extract(self, title: str) -> dict:
+        if title not in self.pages:
+            return {"query": {"pages": {"-1": {"ns": 0, "title": title, "missing": ""}}}}
+        page = {"pageid": 1, "ns": 0, "title": title, "extract": self.pages[title]}
+        if title in self.disambiguation:
+            page["pageprops"] = {"disambiguation": ""}
+        return {"query": {"pages": {"1": page}}}
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/w/api.php", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.api_url = f"http://127.0.0.1:{port}/w/api.php"
+        return self.api_url
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
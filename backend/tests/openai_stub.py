@@ -0,0 +1,68 @@
+import asyncio
+import json
+import time
+from aiohttp import web
+
+
+class StubOpenAI:
+    """Local OpenAI-compatible chat completions endpoint that can be slowed down or made to throttle.
+
+    Each request takes the next entry of `script`, if any: an int status
+    to fail with (429 carries retry-after-ms), or a float number of
+    seconds to wait before answering. Requests past the script answer at
+    once with `content`.
+    """
+
+    def __init__(self, content: str = "Hello from the stub", script: list = None, retry_after_ms: int = 20):
+        self.content = content
+        self.script = list(script or [])
+        self.retry_after_ms = retry_after_ms
+        self.requests = []
+        self.runner = None
+        self.base_url = None
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests.append((time.monotonic(), body))
+        step = self.script.pop(0) if self.script else None
+        if isinstance(step, int):
+            headers = {"retry-after-ms": str(self.retry_after_ms)} if step == 429 else {}
+            return web.json_response({"error": {"message": "stubbed failure", "type": "requests"}},
+                                     status=step, headers=headers)
+        if isinstance(step, float):
+            await asyncio.sleep(step)
+        if body.get("stream"):
+            return await self._stream(request)
+        return web.json_response({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": self.content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        })
+
+    async def _stream(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in self.content.split(" "):
+            chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": "stub", "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/v1"
+        return self.base_url
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
@@ -0,0 +1,532 @@
+import pytest
+import json
+import re
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+from sqlalchemy import event, inspect
+import backend.app as app_module
+from backend.app import db, DailyQuestions, User, questions_cache, user_cache, get_app
+from backend.generation_lock import GenerationInProgress, GenerationLock
+from backend.password_hasher import HasherOverloaded, hash_cost
+
+app = get_app()
+
+QUESTIONS = {
+    "questions": [{"text": "Who?", "answers": [{"text": "Me", "is_correct": True}, {"text": "You", "is_correct": False}]}],
+    "source": {"title": "Pirates", "preview": "Pirates..."}
+}
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        questions_cache.invalidate()
+        user_cache.clear()
+        client = app.test_client()
+        client.post('/signup', json={'username': 'player', 'password': 'secret'})
+        yield client
+        db.session.remove()
+        db.drop_all()
+
+
+def store_questions(day: date, data: dict) -> None:
+    db.session.add(DailyQuestions(date=day, questions=json.dumps(data)))
+    db.session.commit()
+
+
+@contextmanager
+def record_statements(matches=lambda statement: True):
+    """Collect the SQL statements run inside the block that matches accepts."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if matches(statement):
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def count_daily_question_queries():
+    return record_statements(lambda statement: 'daily_questions' in statement)
+
+
+def test_get_questions_serves_cached_payload_with_etag(client):
+    store_questions(date.today(), QUESTIONS)
+    with count_daily_question_queries() as statements:
+        first = client.get('/get_questions')
+        second = client.get('/get_questions')
+
+    assert first.status_code == 200
+    assert first.get_json() == QUESTIONS
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert second.data == first.data
+    assert len(statements) == 1
+
+
+def test_get_questions_answers_304_for_matching_etag(client):
+    store_questions(date.today(), QUESTIONS)
+    etag = client.get('/get_questions').headers['ETag']
+
+    response = client.get('/get_questions', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_get_questions_cache_invalidated_on_write(client):
+    store_questions(date.today(), QUESTIONS)
+    first = client.get('/get_questions')
+
+    row = DailyQuestions.query.filter_by(date=date.today()).first()
+    updated = dict(QUESTIONS, source={"title": "Basketball", "preview": "..."})
+    row.questions = json.dumps(updated)
+    db.session.commit()
+    second = client.get('/get_questions')
+
+    assert second.get_json() == updated
+    assert second.headers['ETag'] != first.headers['ETag']
+
+
+def test_get_questions_cache_rolls_over_with_date(client, monkeypatch):
+    tomorrow = date.today() + timedelta(days=1)
+    tomorrow_questions = dict(QUESTIONS, source={"title": "Tomorrow", "preview": "..."})
+    store_questions(date.today(), QUESTIONS)
+    store_questions(tomorrow, tomorrow_questions)
+    client.get('/get_questions')
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return tomorrow
+
+    monkeypatch.setattr(app_module, 'date', Tomorrow)
+    assert client.get('/get_questions').get_json() == tomorrow_questions
+
+
+def fake_generation(monkeypatch, script: str) -> None:
+    """Run a stand-in for the on-demand generation child process."""
+    monkeypatch.setattr(app_module, 'generation_command', lambda lock_timeout: [sys.executable, '-c', script])
+
+
+def print_events(*events) -> str:
+    return "".join(
+        f"print({json.dumps(json.dumps({'event': name, 'data': data}))}, flush=True)\n" for name, data in events
+    )
+
+
+def test_get_questions_returns_503_while_another_caller_generates(client, monkeypatch):
+    fake_generation(monkeypatch, print_events(('busy', {'retry_after': 7})))
+
+    response = client.get('/get_questions')
+
+    assert response.status_code == 503
+    assert response.get_json()['retry_after'] == 7
+    assert response.headers['Retry-After'] == str(response.get_json()['retry_after'])
+
+
+def test_concurrent_requests_share_one_generation_child(client, monkeypatch, tmp_path):
+    release = tmp_path / 'release'
+    script = (
+        "import os, time\n"
+        + print_events(('source', QUESTIONS['source']))
+        + f"while not os.path.exists({str(release)!r}): time.sleep(0.01)\n"
+        + print_events(('question', {'text': 'First?'}), ('done', {'count': 1}))
+    )
+    commands = []
+    monkeypatch.setattr(app_module, 'generation_command',
+                        lambda lock_timeout: commands.append(lock_timeout) or [sys.executable, '-c', script])
+
+    first = app_module.generation_events(1)
+    assert next(first) == ('source', QUESTIONS['source'])
+    second = app_module.generation_events(1)
+    assert next(second) == ('source', QUESTIONS['source'])
+    release.touch()
+
+    assert list(first) == list(second) == [('question', {'text': 'First?'}), ('done', {'count': 1})]
+    assert len(commands) == 1
+
+
+def test_generation_lock_waits_for_holder_then_times_out(client):
+    day = date(2030, 1, 1)
+    holder = GenerationLock(db.engine, day)
+    holder.acquire(timeout=0)
+
+    with pytest.raises(GenerationInProgress):
+        GenerationLock(db.engine, day).acquire(timeout=0.05)
+
+    waiter = GenerationLock(db.engine, day)
+    thread = threading.Thread(target=waiter.acquire, args=(5,))
+    thread.start()
+    holder.release()
+    thread.join()
+    waiter.release()
+
+
+def parse_events(body: bytes) -> list:
+    events = []
+    for block in body.decode('utf-8').strip().split('\n\n'):
+        name, data = block.split('\n')
+        events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+def test_stream_questions_replays_stored_questions(client):
+    store_questions(date.today(), QUESTIONS)
+
+    response = client.get('/stream_questions')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert parse_events(response.data) == [
+        ('source', QUESTIONS['source']),
+        ('question', QUESTIONS['questions'][0]),
+        ('done', {'count': 1}),
+    ]
+
+
+def test_stream_questions_serves_stored_day_from_cache(client):
+    store_questions(date.today(), QUESTIONS)
+    first = client.get('/stream_questions').data
+    with count_daily_question_queries() as statements:
+        second = client.get('/stream_questions').data
+
+    assert second == first == questions_cache.get(date.today())[3]
+    assert statements == []
+
+
+def test_stream_questions_sends_each_question_as_generated(client, monkeypatch, tmp_path):
+    release = tmp_path / 'release'
+    fake_generation(monkeypatch, (
+        "import os, time\n"
+        + print_events(('source', QUESTIONS['source']), ('question', {'text': 'First?'}))
+        + f"while not os.path.exists({str(release)!r}): time.sleep(0.01)\n"
+        + print_events(('question', {'text': 'Second?'}), ('done', {'count': 2}))
+    ))
+
+    response = client.get('/stream_questions', buffered=False)
+    chunks = response.iter_encoded()
+    first_two = next(chunks) + next(chunks)
+    assert parse_events(first_two) == [('source', QUESTIONS['source']), ('question', {'text': 'First?'})]
+
+    release.touch()
+    rest = b''.join(chunks)
+    assert parse_events(rest) == [('question', {'text': 'Second?'}), ('done', {'count': 2})]
+
+
+def test_stream_questions_returns_503_while_another_caller_generates(client, monkeypatch):
+    fake_generation(monkeypatch, print_events(('busy', {'retry_after': 7})))
+
+    response = client.get('/stream_questions')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
+
+
+def test_hung_generation_child_is_killed_at_its_deadline(client, monkeypatch):
+    monkeypatch.setenv('GENERATION_TIMEOUT_SECONDS', '0.5')
+    fake_generation(monkeypatch, "import time\n" + print_events(('source', QUESTIONS['source'])) + "time.sleep(60)\n")
+
+    response = client.get('/get_questions')
+
+    assert response.status_code == 503
+    assert response.get_json()['error'] == 'Question generation timed out'
+    assert date.today() not in app_module._generation_runs
+
+
+def test_on_demand_generation_can_be_left_to_the_scheduler(client, monkeypatch):
+    monkeypatch.setenv('ON_DEMAND_GENERATION', 'false')
+    monkeypatch.setattr(app_module, 'generation_command', lambda lock_timeout: pytest.fail("generation started"))
+
+    # Not 503, which the frontend would keep retrying until the scheduler stores the day
+    for route in ('/get_questions', '/stream_questions'):
+        response = client.get(route)
+        assert response.status_code == 404
+        assert response.get_json() == {'error': 'Quiz not available yet'}
+
+
+def test_pages_render_blueprint_links(client):
+    assert client.get('/').status_code == 200
+    assert client.get('/login').status_code == 200
+
+
+def test_create_app_reads_pool_settings_and_overrides(monkeypatch):
+    monkeypatch.setenv('DB_POOL_SIZE', '20')
+    monkeypatch.setenv('DB_POOL_RECYCLE_SECONDS', '600')
+
+    options = app_module.engine_options('postgresql://user@db/trivia')
+    configured = app_module.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SECRET_KEY': 'test'})
+
+    assert options['pool_size'] == 20
+    assert options['pool_recycle'] == 600
+    assert options['pool_pre_ping'] is True
+    assert 'pool_size' not in configured.config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert configured.config['SECRET_KEY'] == 'test'
+    assert configured is not app
+
+
+def test_engines_are_usable_after_fork_disposal(tmp_path):
+    forked = app_module.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/trivia.db'})
+    with forked.app_context():
+        db.create_all()
+        store_questions(date.today(), QUESTIONS)
+        db.session.remove()
+
+    app_module.dispose_engines_after_fork()
+
+    with forked.app_context():
+        assert DailyQuestions.query.filter_by(date=date.today()).count() == 1
+
+
+def test_login_upgrades_hash_when_cost_changes(client, monkeypatch):
+    monkeypatch.setattr(app_module.password_hasher, '_rounds', 5)
+
+    response = client.post('/login', json={'username': 'player', 'password': 'secret'})
+
+    assert response.status_code == 200
+    user = app_module.User.query.filter_by(username='player').first()
+    assert hash_cost(user.password) == 5
+
+
+def test_login_fails_fast_when_hashing_is_overloaded(client, monkeypatch):
+    def overloaded(*args):
+        raise HasherOverloaded("full")
+
+    monkeypatch.setattr(app_module.password_hasher, '_run', overloaded)
+
+    response = client.post('/login', json={'username': 'player', 'password': 'secret'})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+@pytest.fixture
+def request_client():
+    """Client whose requests each push their own app context, as they do when served."""
+    with app.app_context():
+        db.create_all()
+        user_cache.clear()
+    client = app.test_client()
+    client.post('/signup', json={'username': 'player', 'password': 'secret'})
+    yield client
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def count_user_queries():
+    return record_statements(lambda statement: 'FROM user' in statement)
+
+
+def test_authenticated_requests_reuse_cached_principal(request_client):
+    with app.app_context():
+        store_questions(date.today(), QUESTIONS)
+
+    with count_user_queries() as statements:
+        for _ in range(3):
+            assert request_client.get('/get_questions').status_code == 200
+
+    assert len(statements) == 1
+    assert 'password' not in statements[0]
+    principal = user_cache.get(1)
+    assert principal.username == 'player'
+    assert not hasattr(principal, 'password')
+
+
+def test_logout_and_user_changes_invalidate_cached_principal(request_client):
+    request_client.get('/get_user_scores')
+    assert user_cache.get(1) is not None
+
+    with app.app_context():
+        db.session.get(User, 1).username = 'renamed'
+        db.session.commit()
+    assert user_cache.get(1) is None
+
+    request_client.get('/get_user_scores')
+    assert user_cache.get(1).username == 'renamed'
+    request_client.get('/logout')
+    assert user_cache.get(1) is None
+    assert request_client.get('/get_user_scores').status_code in (302, 401)
+
+
+def test_user_cache_expires_and_evicts_least_recently_used():
+    cache = app_module.UserCache(max_entries=2, ttl_seconds=60)
+    for user_id in (1, 2):
+        cache.put(app_module.UserPrincipal(user_id, f'user{user_id}'))
+    cache.get(1)
+    cache.put(app_module.UserPrincipal(3, 'user3'))
+
+    assert cache.get(2) is None
+    assert cache.get(1).username == 'user1'
+
+    expired = app_module.UserCache(ttl_seconds=0)
+    expired.put(app_module.UserPrincipal(1, 'user1'))
+    assert expired.get(1) is None
+
+
+# Statements on the score table itself, not the stats and summary tables kept alongside it
+SCORE_TABLE = re.compile(r'\b(into|from|join|update) score\b', re.IGNORECASE)
+
+
+@pytest.fixture
+def todays_quiz():
+    """A stored five-question quiz for today, so scores from 0 to 5 can be submitted."""
+    with app.app_context():
+        store_questions(date.today(), {**QUESTIONS, 'questions': QUESTIONS['questions'] * 5})
+
+
+def test_submit_score_is_one_insert_and_reports_duplicates(client, todays_quiz):
+    with record_statements(SCORE_TABLE.search) as statements:
+        first = client.post('/submit_score', json={'score': 3})
+        second = client.post('/submit_score', json={'score': 4})
+
+    assert first.status_code == 200
+    assert second.status_code == 400
+    assert second.get_json()['error'] == 'Already submitted score for today'
+    assert len(statements) == 2
+    assert all(statement.lstrip().upper().startswith('INSERT') for statement in statements)
+    assert [s.score for s in app_module.Score.query.all()] == [3]
+
+
+def test_submit_score_rejects_scores_outside_the_quiz(client):
+    assert client.post('/submit_score', json={'score': 1}).get_json()['error'] == 'No quiz available for today'
+    store_questions(date.today(), QUESTIONS)
+
+    for bad in (None, '1', 1.5, True, -1, 2):
+        response = client.post('/submit_score', json={'score': bad})
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Score must be a whole number from 0 to 1'
+    assert client.post('/submit_score', data='not json').status_code == 400
+    assert client.post('/submit_score', json={'score': 1}).status_code == 200
+    assert app_module.Score.query.count() == 1
+
+
+def test_score_index_is_unique_on_user_and_date(client):
+    indexes = {index.name: index for index in app_module.Score.__table__.indexes}
+
+    assert indexes['ix_score_user_date'].unique
+    assert [column.name for column in indexes['ix_score_user_date'].columns] == ['user_id', 'date']
+
+
+def test_ensure_indexes_removes_duplicate_scores_before_creating_the_unique_index(client):
+    user_id = User.query.filter_by(username='player').one().id
+    index = next(index for index in app_module.Score.__table__.indexes if index.name == 'ix_score_user_date')
+    index.drop(db.engine)
+    db.session.add_all([app_module.Score(user_id=user_id, score=score, date=date(2024, 5, 1)) for score in (3, 1, 2)])
+    db.session.add(app_module.Score(user_id=user_id, score=4, date=date(2024, 5, 2)))
+    db.session.commit()
+
+    assert app_module.ensure_indexes() == 2
+
+    assert sorted((row.date.day, row.score) for row in app_module.Score.query) == [(1, 3), (2, 4)]
+    assert 'ix_score_user_date' in {index['name'] for index in inspect(db.engine).get_indexes('score')}
+    assert app_module.ensure_indexes() == 0
+
+
+def store_scores(user_id: int, scores: dict) -> None:
+    """Store {date: score} through the same path as submissions, so stats follow along."""
+    rows = [{'user_id': user_id, 'score': score, 'date': day} for day, score in sorted(scores.items())]
+    app_module.record_scores(db.session.connection(), rows)
+    db.session.commit()
+
+
+def test_score_history_filters_range_and_pages_by_cursor(client):
+    user_id = User.query.filter_by(username='player').one().id
+    store_scores(user_id, {date(2024, 4, 30): 1, date(2024, 5, 1): 2, date(2024, 5, 2): 3, date(2024, 5, 3): 4})
+
+    first = client.get('/score_history?start=2024-05-01&end=2024-05-31&limit=2').get_json()
+    second = client.get(f"/score_history?start=2024-05-01&end=2024-05-31&limit=2&cursor={first['next_cursor']}").get_json()
+
+    assert first['scores'] == [{'date': '2024-05-03', 'score': 4}, {'date': '2024-05-02', 'score': 3}]
+    assert first['next_cursor'] == '2024-05-02'
+    assert second['scores'] == [{'date': '2024-05-01', 'score': 2}]
+    assert second['next_cursor'] is None
+    assert client.get('/score_history?start=May').status_code == 400
+
+
+def test_stats_are_updated_on_submit_without_reading_history(client, todays_quiz, monkeypatch):
+    user_id = User.query.filter_by(username='player').one().id
+    today = date.today()
+    store_scores(user_id, {today - timedelta(days=5): 1, today - timedelta(days=2): 2, today - timedelta(days=1): 3})
+    with record_statements() as statements:
+        client.post('/submit_score', json={'score': 4})
+
+    assert not any(SCORE_TABLE.search(statement) and statement.lstrip().upper().startswith('SELECT') for statement in statements)
+    stats = client.get('/score_history').get_json()['stats']
+    assert stats == {
+        'games_played': 4,
+        'average_score': 2.5,
+        'current_streak': 3,
+        'best_streak': 3,
+        'last_played': today.isoformat(),
+    }
+
+
+def test_stale_streak_reads_as_zero_and_stats_can_be_rebuilt(client):
+    user_id = User.query.filter_by(username='player').one().id
+    store_scores(user_id, {date(2024, 5, 1): 2, date(2024, 5, 2): 4, date(2024, 5, 4): 3})
+    before = client.get('/score_history').get_json()['stats']
+
+    app_module.rebuild_score_summaries()
+
+    assert before['current_streak'] == 0
+    assert before['best_streak'] == 2
+    assert client.get('/score_history').get_json()['stats'] == before
+    assert db.session.get(app_module.UserStats, user_id).current_streak == 1
+    assert app_module.score_distribution(date(2024, 5, 2)) == [(4, 1)]
+
+
+def signup(username: str):
+    """A separate signed-in client for another player."""
+    other = app.test_client()
+    other.post('/signup', json={'username': username, 'password': 'secret'})
+    return other
+
+
+def test_submit_reports_share_of_players_beaten(request_client, todays_quiz):
+    for username, score in [('a', 1), ('b', 2), ('c', 2)]:
+        signup(username).post('/submit_score', json={'score': score})
+
+    response = request_client.post('/submit_score', json={'score': 3})
+
+    assert response.get_json()['beat_percent'] == 75
+
+
+def test_daily_summary_is_counted_on_submit_and_cached(request_client, todays_quiz):
+    for username, score in [('a', 1), ('b', 3)]:
+        signup(username).post('/submit_score', json={'score': score})
+    request_client.post('/submit_score', json={'score': 3})
+    app_module.summary_cache.clear()
+    with record_statements() as statements:
+        summary = request_client.get('/daily_summary').get_json()
+        queries = len(statements)
+        request_client.get('/daily_summary')
+
+    assert summary['players'] == 3
+    assert summary['histogram'] == [
+        {'score': 1, 'players': 1, 'beat_percent': 0},
+        {'score': 3, 'players': 2, 'beat_percent': 33},
+    ]
+    assert summary['leaderboard'] == [
+        {'username': 'b', 'score': 3},
+        {'username': 'player', 'score': 3},
+        {'username': 'a', 'score': 1},
+    ]
+    assert len(statements) == queries
+    assert not any('count(' in statement.lower() for statement in statements)
+
+
+def test_daily_summary_cache_expires():
+    cache = app_module.DailySummaryCache(ttl_seconds=0)
+    cache.put(date(2024, 5, 1), {'players': 1})
+
+    assert cache.get(date(2024, 5, 1)) is None
@@ -1,6 +1,10 @@
 import pytest
 import asyncio
-from src.article_ingestion import ArticleIngestion
+import os
+from backend.article_ingestion import ArticleIngestion
+
+# Fetches from Wikipedia
+pytestmark = pytest.mark.skipif(not os.getenv('LIVE_API_TESTS'), reason='set LIVE_API_TESTS=1 to call the live APIs')
 
 @pytest.mark.asyncio
 async def test_get_random_article():
@@ -15,8 +19,7 @@ async def test_get_random_article():
     assert not article_ingestion.article_title.lower().endswith('(disambiguation)')
     
     # Get the Wikipedia URL for the article
-    page = article_ingestion.wiki.page(article_ingestion.article_title)
-    article_url = page.fullurl
+    article_url = f"https://en.wikipedia.org/wiki/{article_ingestion.article_title.replace(' ', '_')}"
     
     # Save the article text to a file
     with open('raw_scraped.txt', 'w', encoding='utf-8') as f:
@@ -0,0 +1,144 @@
+import pytest
+import pytest_asyncio
+from backend.article_ingestion import ArticleIngestion
+from backend.category_index import CategoryIndex
+from mediawiki_stub import StubMediaWiki
+
+LONG_TEXT = "== History ==\n" + "Pirates sailed the seas. " * 80
+SHORT_TEXT = "Too short."
+
+
+@pytest_asyncio.fixture
+async def stub_wiki():
+    stub = StubMediaWiki(
+        categories={
+            "Pirates": ["Blackbeard", "Short pirate", "Pirate (disambiguation)", "Pirate flag"],
+        },
+        pages={
+            "Blackbeard": LONG_TEXT,
+            "Short pirate": SHORT_TEXT,
+            "Pirate (disambiguation)": LONG_TEXT,
+            "Pirate flag": LONG_TEXT,
+        },
+        disambiguation={"Pirate flag"},
+    )
+    await stub.start()
+    yield stub
+    await stub.stop()
+
+
+@pytest.mark.asyncio
+async def test_get_random_article_picks_first_suitable_candidate(stub_wiki, tmp_path):
+    article_ingestion = ArticleIngestion(api_url=stub_wiki.api_url, max_parallel_candidates=4,
+                                         category_index=CategoryIndex(path=str(tmp_path / "index.json")))
+    article_ingestion.categories = ["Pirates"]
+
+    await article_ingestion.get_random_article()
+    await article_ingestion.close()
+
+    # Short, disambiguation-titled and disambiguation-flagged pages are all rejected
+    assert article_ingestion.article_title == "Blackbeard"
+    assert article_ingestion.article_text == LONG_TEXT
+
+
+@pytest.mark.asyncio
+async def test_get_random_article_reuses_pooled_connections(stub_wiki, tmp_path):
+    article_ingestion = ArticleIngestion(api_url=stub_wiki.api_url, max_parallel_candidates=2,
+                                         category_index=CategoryIndex(path=str(tmp_path / "index.json")))
+    article_ingestion.categories = ["Pirates"]
+
+    for _ in range(3):
+        await article_ingestion.get_random_article()
+        assert article_ingestion.article_title == "Blackbeard"
+    await article_ingestion.close()
+
+    assert len(stub_wiki.requests) > len(stub_wiki.peers)
+
+
+@pytest.mark.asyncio
+async def test_get_random_article_gives_up_after_max_retries(stub_wiki, tmp_path):
+    stub_wiki.pages["Blackbeard"] = SHORT_TEXT
+    article_ingestion = ArticleIngestion(api_url=stub_wiki.api_url, max_parallel_candidates=3,
+                                         category_index=CategoryIndex(path=str(tmp_path / "index.json")))
+    article_ingestion.categories = ["Pirates"]
+
+    with pytest.raises(Exception, match="Failed to find suitable article after 10 attempts"):
+        await article_ingestion.get_random_article()
+    await article_ingestion.close()
+
+
+@pytest.mark.asyncio
+async def test_category_index_pages_fully_and_persists(stub_wiki, tmp_path):
+    stub_wiki.page_size = 3
+    stub_wiki.categories["Pirates"] = [f"Pirate {i}" for i in range(10)]
+    index_path = str(tmp_path / "index.json")
+    index = CategoryIndex(path=index_path)
+    article_ingestion = ArticleIngestion(api_url=stub_wiki.api_url, category_index=index)
+
+    await index.refresh("Pirates", article_ingestion._api_get)
+    index.mark_rejected("Pirate 0")
+    index.save()
+    await article_ingestion.close()
+
+    assert len(stub_wiki.requests) == 4
+    reloaded = CategoryIndex(path=index_path)
+    assert reloaded.categories["Pirates"]["members"] == [f"Pirate {i}" for i in range(10)]
+    assert not reloaded.is_stale("Pirates")
+    assert "Pirate 0" not in reloaded.sample(["Pirates"], 10)
+    assert len(reloaded.sample(["Pirates"], 10)) == 9
+
+
+@pytest.mark.asyncio
+async def test_category_index_refreshes_incrementally_after_ttl(stub_wiki, tmp_path):
+    index = CategoryIndex(path=str(tmp_path / "index.json"), ttl_seconds=0)
+    article_ingestion = ArticleIngestion(api_url=stub_wiki.api_url, category_index=index)
+
+    await index.refresh("Pirates", article_ingestion._api_get)
+    stub_wiki.categories["Pirates"].append("Anne Bonny")
+    await index.refresh("Pirates", article_ingestion._api_get)
+    await article_ingestion.close()
+
+    assert stub_wiki.requests[-1]["cmstart"] == "2024-01-01T00:00:03Z"
+    assert index.categories["Pirates"]["members"][-1] == "Anne Bonny"
+    assert len(index.categories["Pirates"]["members"]) == 5
+    assert index.is_stale("Pirates")
+
+
+@pytest.mark.asyncio
+async def test_category_index_full_refresh_drops_removed_members(stub_wiki, tmp_path):
+    index = CategoryIndex(path=str(tmp_path / "index.json"), ttl_seconds=0, full_refresh_seconds=0)
+    article_ingestion = ArticleIngestion(api_url=stub_wiki.api_url, category_index=index)
+
+    await index.refresh("Pirates", article_ingestion._api_get)
+    stub_wiki.categories["Pirates"].remove("Blackbeard")
+    await index.refresh("Pirates", article_ingestion._api_get)
+    await article_ingestion.close()
+
+    assert "cmstart" not in stub_wiki.requests[-1]
+    assert index.categories["Pirates"]["members"] == ["Short pirate", "Pirate (disambiguation)", "Pirate flag"]
+    assert "Blackbeard" not in index.sample(["Pirates"], 10)
+
+
+@pytest.mark.asyncio
+async def test_rejected_titles_are_never_fetched_again(stub_wiki, tmp_path):
+    index = CategoryIndex(path=str(tmp_path / "index.json"))
+    article_ingestion = ArticleIngestion(api_url=stub_wiki.api_url, max_parallel_candidates=4,
+                                         category_index=index)
+    article_ingestion.categories = ["Pirates"]
+    rejected_after = {}
+    mark_rejected = index.mark_rejected
+
+    def recording_mark_rejected(title):
+        rejected_after.setdefault(title, len(stub_wiki.requests))
+        mark_rejected(title)
+
+    index.mark_rejected = recording_mark_rejected
+
+    for _ in range(5):
+        await article_ingestion.get_random_article()
+    await article_ingestion.close()
+
+    category_queries = [r for r in stub_wiki.requests if r.get("list") == "categorymembers"]
+    assert len(category_queries) == 1
+    for title, position in rejected_after.items():
+        assert all(r.get("titles") != title for r in stub_wiki.requests[position:])
@@ -0,0 +1,69 @@
+import os
+from backend.article_processor import ArticleProcessor, iter_paragraphs, starts_section
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'test_data')
+
+
+def read_test_article():
+    with open(os.path.join(TEST_DATA, 'raw_scraped.txt'), 'r', encoding='utf-8') as f:
+        return ''.join(f.readlines()[3:])
+
+
+def test_chunks_respect_target_size_and_cover_article(fake_encoder):
+    article_text = read_test_article()
+    processor = ArticleProcessor(target_tokens=300, overlap_tokens=40)
+
+    processor.process_text(article_text)
+
+    assert len(processor.chunks) > 1
+    assert all(count <= 300 for count in processor.chunk_token_counts)
+    assert processor.chunk_token_counts == [len(chunk.split()) for chunk in processor.chunks]
+    chunked_words = set(' '.join(processor.chunks).split())
+    assert chunked_words == set(article_text.split())
+
+
+def test_chunks_break_on_section_and_paragraph_boundaries(fake_encoder):
+    sections = [f"== Section {i} ==\n" + " ".join(["Fact."] * 60) for i in range(4)]
+    processor = ArticleProcessor(target_tokens=100, overlap_tokens=0)
+
+    chunks = list(processor.iter_chunks("\n\n\n".join(sections)))
+
+    assert [chunk.split("\n")[0] for chunk in chunks] == [f"== Section {i} ==" for i in range(4)]
+
+
+def test_chunks_overlap_with_trailing_paragraphs(fake_encoder):
+    paragraphs = [f"Paragraph {i} " + "word " * 18 for i in range(6)]
+    processor = ArticleProcessor(target_tokens=45, overlap_tokens=25)
+
+    chunks = list(processor.iter_chunks("\n\n".join(paragraphs)))
+
+    assert len(chunks) > 1
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.split("\n\n")[0] == previous.split("\n\n")[-1]
+
+
+def test_oversized_paragraph_is_split_on_sentences(fake_encoder):
+    paragraph = " ".join(f"Sentence number {i} is here." for i in range(40))
+    processor = ArticleProcessor(target_tokens=50, overlap_tokens=0)
+
+    chunks = list(processor.iter_chunks(paragraph))
+
+    assert len(chunks) == 4
+    assert all(chunk.endswith("here.") for chunk in chunks)
+
+
+def test_iter_chunks_is_lazy(fake_encoder):
+    processor = ArticleProcessor(target_tokens=20, overlap_tokens=0)
+    chunks = processor.iter_chunks("\n\n".join("word " * 15 for _ in range(10)))
+
+    first = next(chunks)
+
+    assert first.split() == ["word"] * 15
+    assert len(processor.chunks) == 1
+
+
+def test_paragraph_and_section_helpers():
+    assert list(iter_paragraphs("a\n\n\n\nb\nc\n\n")) == ["a", "b\nc"]
+    assert starts_section("== History ==")
+    assert starts_section("Equipment\nThe ball is round.")
+    assert not starts_section("The ball is round.\nIt is kicked.")
@@ -0,0 +1,108 @@
+import pytest
+import json
+from datetime import date
+from sqlalchemy.exc import OperationalError
+import backend.backfill as backfill_module
+import backend.dump_ingestion as dump_ingestion_module
+from backend.app import db, DailyQuestions, GenerationTrace, get_app
+
+app = get_app()
+
+
+@pytest.fixture
+def database():
+    with app.app_context():
+        db.create_all()
+        yield
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.mark.asyncio
+async def test_backfill_resumes_and_stores_missing_days_in_batches(database, fake_encoder, monkeypatch, tmp_path):
+    monkeypatch.setenv('CATEGORY_INDEX_PATH', str(tmp_path / 'index.json'))
+    monkeypatch.setattr(backfill_module, 'create_chat_model', lambda: object())
+    with app.app_context():
+        db.session.add(DailyQuestions(date=date(2024, 1, 2), questions=json.dumps({'questions': []})))
+        db.session.commit()
+
+    models = set()
+    batches = []
+
+    async def fake_build(question_gen):
+        models.add(id(question_gen.model))
+        if question_gen.article_ingestion._session.closed:
+            raise RuntimeError("session closed")
+        return {'questions': [], 'source': {'title': 'T', 'preview': '...'}}
+
+    real_write_batch = backfill_module.write_batch
+
+    def recording_write_batch(batch):
+        batches.append([day for day, _, _ in batch])
+        return real_write_batch(batch)
+
+    monkeypatch.setattr(backfill_module, 'build_questions_data', fake_build)
+    monkeypatch.setattr(backfill_module, 'write_batch', recording_write_batch)
+
+    result = await backfill_module.backfill(date(2024, 1, 1), date(2024, 1, 5), workers=2, batch_size=2)
+
+    assert result == {'generated': 4, 'failed': []}
+    assert len(models) == 1
+    assert sorted(day for batch in batches for day in batch) == [date(2024, 1, d) for d in (1, 3, 4, 5)]
+    assert max(len(batch) for batch in batches) == 2
+    assert backfill_module.stored_dates(date(2024, 1, 1), date(2024, 1, 5)) == {date(2024, 1, d) for d in range(1, 6)}
+    with app.app_context():
+        assert {row.date for row in GenerationTrace.query} == {date(2024, 1, d) for d in (1, 3, 4, 5)}
+
+
+@pytest.mark.asyncio
+async def test_days_of_a_batch_that_cannot_be_written_are_reported_failed(database, fake_encoder, monkeypatch,
+                                                                          tmp_path):
+    monkeypatch.setenv('CATEGORY_INDEX_PATH', str(tmp_path / 'index.json'))
+    monkeypatch.setattr(backfill_module, 'create_chat_model', lambda: object())
+
+    titles = iter(['A', 'B', 'C'])
+
+    async def fake_build(question_gen):
+        title = next(titles)
+        question_gen.dedup_index.reserve_article(title, f"The article about {title}")
+        return {'questions': [], 'source': {'title': title, 'preview': '...'}}
+
+    def failing_write_batch(batch):
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(backfill_module, 'build_questions_data', fake_build)
+    monkeypatch.setattr(backfill_module, 'write_batch', failing_write_batch)
+
+    # Three days with batches of two: one full batch and the final partial flush both fail
+    result = await backfill_module.backfill(date(2024, 1, 1), date(2024, 1, 3), workers=2, batch_size=2)
+
+    assert result == {'generated': 0, 'failed': [date(2024, 1, d) for d in (1, 2, 3)]}
+    # The failed days' articles can be picked again
+    assert backfill_module.dedup_index.reserved == {}
+    assert not backfill_module.dedup_index.seen_title('A')
+
+
+@pytest.mark.asyncio
+async def test_backfill_reads_articles_from_the_dump_when_selected(database, fake_encoder, monkeypatch, tmp_path):
+    monkeypatch.setenv('CATEGORY_INDEX_PATH', str(tmp_path / 'index.json'))
+    monkeypatch.setenv('ARTICLE_SOURCE', 'dump')
+    monkeypatch.setattr(backfill_module, 'create_chat_model', lambda: object())
+
+    class FakeDumpIngestion:
+        def __init__(self, dedup_index=None):
+            self.dedup_index = dedup_index
+
+    sources = []
+
+    async def fake_build(question_gen):
+        sources.append(type(question_gen.article_ingestion))
+        return {'questions': [], 'source': {'title': 'T', 'preview': '...'}}
+
+    monkeypatch.setattr(dump_ingestion_module, 'DumpArticleIngestion', FakeDumpIngestion)
+    monkeypatch.setattr(backfill_module, 'build_questions_data', fake_build)
+
+    result = await backfill_module.backfill(date(2024, 1, 1), date(2024, 1, 2), workers=2)
+
+    assert result == {'generated': 2, 'failed': []}
+    assert sources == [FakeDumpIngestion, FakeDumpIngestion]
@@ -0,0 +1,57 @@
+import pytest
+import json
+from backend.app import db, get_app, user_cache
+from backend.benchmark import compare, main, percentile
+
+app = get_app()
+
+SMALL_RUN = [
+    '--chunking-runs', '1', '--generation-runs', '1', '--llm-latency-ms', '0', '--llm-ms-per-token', '0',
+    '--fetch-latency-ms', '0', '--players', '3', '--concurrency', '1', '--requests', '6',
+    '--history-days', '5', '--submit-rounds', '1',
+]
+
+
+@pytest.fixture
+def database():
+    with app.app_context():
+        db.create_all()
+        user_cache.clear()
+        yield
+        db.session.remove()
+        db.drop_all()
+
+
+def test_benchmark_runs_offline_and_writes_comparable_results(database, fake_encoder, tmp_path, capsys):
+    output = tmp_path / 'results.json'
+
+    assert main(['--output', str(output)] + SMALL_RUN) == 0
+
+    results = json.loads(output.read_text())
+    assert set(results) == {"meta", "chunking", "generation", "http", "metrics"}
+    assert results["generation"]["short"]["llm_calls"] > 0
+    assert results["generation"]["short"]["completion_tokens"] > 0
+    for route in ("/get_questions", "/get_user_scores", "/score_history", "/submit_score"):
+        assert results["http"][route]["errors"] == 0
+    assert results["metrics"]["http./get_questions.p50_ms"] == results["http"]["/get_questions"]["p50_ms"]
+
+    # Only chunking is rerun, so only its metrics are compared
+    assert main(['--output', str(tmp_path / 'again.json'), '--compare', str(output), '--max-regression', '1000000',
+                 '--suites', 'chunking'] + SMALL_RUN) == 0
+    assert "chunking." in capsys.readouterr().out
+
+
+def test_compare_flags_only_regressions_past_the_threshold():
+    previous = {"http./a.p50_ms": 10, "http./a.requests_per_second": 100, "generation.short.completion_tokens": 50}
+    current = {"http./a.p50_ms": 13, "http./a.requests_per_second": 95, "generation.short.completion_tokens": 50}
+
+    lines, regressions = compare(previous, current, max_regression=20)
+
+    assert len(lines) == 3
+    assert regressions == [line for line in lines if line.startswith("http./a.p50_ms")]
+
+
+def test_percentile_uses_the_nearest_rank():
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile([], 50) == 0.0
@@ -0,0 +1,129 @@
+import pytest
+import pytest_asyncio
+import json
+import random
+from datetime import date
+from backend.app import db, DailyQuestions, get_app
+from backend.article_ingestion import ArticleIngestion
+from backend.category_index import CategoryIndex
+from backend.dedup_index import DedupIndex, minhash, similarity, word_shingles
+from backend.question_generator import validate_questions
+from mediawiki_stub import StubMediaWiki
+
+app = get_app()
+WORDS = ["ship", "crew", "gold", "harbor", "storm", "cannon", "island", "map", "sail", "captain", "navy", "port"]
+
+
+def article(seed: int, length: int = 400) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) + str(rng.randrange(50)) for _ in range(length))
+
+
+def question(text: str) -> dict:
+    return {"text": text, "answers": [{"text": "A", "is_correct": True}, {"text": "B", "is_correct": False}]}
+
+
+@pytest.fixture
+def database():
+    with app.app_context():
+        db.create_all()
+        yield
+        db.session.remove()
+        db.drop_all()
+
+
+def store_day(day: date, title: str, questions: list) -> None:
+    db.session.add(DailyQuestions(date=day, questions=json.dumps({
+        "questions": questions, "source": {"title": title, "preview": "..."}
+    })))
+    db.session.commit()
+
+
+def test_signatures_estimate_text_similarity():
+    text = article(1)
+    edited = text.replace("ship", "boat", 3)
+
+    assert similarity(minhash(word_shingles(text)), minhash(word_shingles(edited))) > 0.8
+    assert similarity(minhash(word_shingles(text)), minhash(word_shingles(article(2)))) < 0.2
+
+
+def test_refresh_reads_only_new_days_and_flags_repeats(database):
+    index = DedupIndex()
+    store_day(date(2024, 1, 1), "Blackbeard", [question("Which ship did Blackbeard sail in 1717?")])
+    index.refresh()
+    store_day(date(2024, 1, 2), "Anne_Bonny", [question("Where was Anne Bonny born?")])
+    index.refresh()
+
+    assert index.seen_title("Anne Bonny") and index.seen_title("blackbeard")
+    assert len(index.questions) == 2
+    assert index.question_repeat(question("Which ship did Blackbeard sail in 1717"))
+    assert not index.question_repeat(question("Which port did Blackbeard blockade?"))
+
+
+def test_article_signatures_are_stored_with_the_day(database):
+    index = DedupIndex()
+    index.reserve_article("Blackbeard", article(1))
+    db.session.add(index.signature_row(date(2024, 1, 1), "Blackbeard"))
+    db.session.commit()
+
+    fresh = DedupIndex()
+    fresh.refresh()
+
+    # A copy under a different title is still caught; an unrelated article is not
+    assert fresh.article_repeat("Edward Teach", article(1).replace("gold", "silver", 5)) == "Blackbeard"
+    assert fresh.article_repeat("Basketball", article(2)) is None
+    assert index.signature_row(date(2024, 1, 2), "Unreserved") is None
+
+
+def test_released_reservations_keep_only_stored_articles():
+    index = DedupIndex()
+    index.reserve_article("Blackbeard", article(1))
+    index.reserve_article("Basketball", article(2))
+
+    index.release_article("Blackbeard", stored=True)
+    index.release_article("Basketball", stored=False)
+
+    assert index.reserved == {}
+    assert index.seen_title("Blackbeard")
+    assert index.article_repeat("Edward Teach", article(1)) == "Blackbeard"
+    assert index.article_repeat("Basketball", article(2)) is None
+
+
+def test_validation_rejects_questions_asked_before():
+    valid, errors = validate_questions(
+        [question("Who was Blackbeard?"), question("Who was Calico Jack?")],
+        num_answers=2,
+        is_repeat=lambda q: "Blackbeard" in q["text"],
+    )
+
+    assert [q["text"] for q in valid] == ["Who was Calico Jack?"]
+    assert errors == ["question 1 repeats a question from an earlier day"]
+
+
+@pytest_asyncio.fixture
+async def stub_wiki():
+    text = "== History ==\n" + article(1)
+    stub = StubMediaWiki(
+        categories={"Pirates": ["Blackbeard", "Edward Teach", "Anne Bonny"]},
+        pages={"Blackbeard": text, "Edward Teach": text, "Anne Bonny": "== Life ==\n" + article(3)},
+    )
+    await stub.start()
+    yield stub
+    await stub.stop()
+
+
+@pytest.mark.asyncio
+async def test_ingestion_skips_used_titles_and_near_duplicate_text(stub_wiki, tmp_path):
+    index = DedupIndex()
+    index.reserve_article("Blackbeard", "== History ==\n" + article(1))
+    article_ingestion = ArticleIngestion(api_url=stub_wiki.api_url, max_parallel_candidates=3,
+                                         category_index=CategoryIndex(path=str(tmp_path / "index.json")),
+                                         dedup_index=index)
+    article_ingestion.categories = ["Pirates"]
+
+    await article_ingestion.get_random_article()
+    await article_ingestion.close()
+
+    assert article_ingestion.article_title == "Anne Bonny"
+    assert "Blackbeard" not in [params.get("titles") for params in stub_wiki.requests]
+    assert index.seen_title("Anne Bonny")
@@ -0,0 +1,101 @@
+import bz2
+import pytest
+from xml.sax.saxutils import escape
+from backend.article_ingestion import ArticleIngestion, create_article_ingestion
+from backend.dump_ingestion import (DumpArticleIngestion, DumpIndex, approximate_text_length, build_index, iter_streams,
+                                    wikitext_to_text)
+
+LONG_WIKITEXT = "'''Blackbeard''' was a [[pirate|famous pirate]].<ref>Source</ref>{{Infobox|name=x}}\n\n" + \
+    "== History ==\nHe sailed the [[Caribbean]] seas. " * 40
+
+
+def page(title: str, text: str, ns: int = 0, redirect: bool = False) -> str:
+    return (f"<page><title>{title}</title><ns>{ns}</ns>" + ("<redirect title=\"x\" />" if redirect else "") +
+            f"<revision><text>{escape(text)}</text></revision></page>")
+
+
+@pytest.fixture
+def dump(tmp_path):
+    # Two bz2 streams, as in the real multistream dumps
+    streams = [
+        "<mediawiki><siteinfo><sitename>Wikipedia</sitename></siteinfo>" +
+        page("Blackbeard", LONG_WIKITEXT + "\n[[Category:Pirates]][[Category:18th-century people|Teach]]") +
+        page("Short pirate", "Too short. [[Category:Pirates]]") +
+        page("Pirate (disambiguation)", LONG_WIKITEXT + "[[Category:Pirates]]"),
+        page("Pirate flag", "{{Disambiguation}}" + LONG_WIKITEXT + "[[Category:Pirates]]") +
+        page("Category:Pirates", LONG_WIKITEXT, ns=14) +
+        page("Teach", "", redirect=True) +
+        page("Anne Bonny", LONG_WIKITEXT + "[[Category:Pirates]]") +
+        page("Basketball", LONG_WIKITEXT + "[[Category:Basketball]]") +
+        "</mediawiki>",
+    ]
+    path = tmp_path / "pages-articles-multistream.xml.bz2"
+    path.write_bytes(b"".join(bz2.compress(stream.encode("utf-8")) for stream in streams))
+    build_index(str(path), str(path) + ".idx")
+    return str(path)
+
+
+def test_streams_are_split_at_their_offsets(dump):
+    streams = list(iter_streams(dump))
+
+    assert len(streams) == 2
+    assert streams[0][0] == 0
+    with open(dump, "rb") as f:
+        f.seek(streams[1][0])
+        assert bz2.decompress(f.read()) == streams[1][1]
+
+
+def test_index_holds_only_suitable_articles_with_categories(dump):
+    index = DumpIndex(dump + ".idx")
+
+    articles = [index.article(i) for i in range(len(index))]
+
+    assert [article["title"] for article in articles] == ["Blackbeard", "Anne Bonny", "Basketball"]
+    assert articles[0]["categories"] == ["Pirates", "18th-century people"]
+    assert all(article["text_length"] > 1000 for article in articles)
+    start, count = index.members(index.category_id("Pirates"))
+    assert sorted(index.member(start + i) for i in range(count)) == [0, 1]
+    assert index.category_id("Personal_finance") is None
+    index.close()
+
+
+def test_postings_sorted_in_small_runs_give_the_same_index(dump, tmp_path):
+    build_index(dump, str(tmp_path / "runs.idx"), run_size=1)
+
+    assert (tmp_path / "runs.idx").read_bytes() == open(dump + ".idx", "rb").read()
+
+
+def test_text_length_is_approximated_without_parsing_wikitext():
+    wikitext = "Teach<ref name=a>Source</ref> led{{cite|a={{nested}}}} a crew.<!-- note -->[[Category:Pirates]]"
+
+    assert approximate_text_length(wikitext) == len("Teach led a crew.")
+    assert approximate_text_length(LONG_WIKITEXT) >= len(wikitext_to_text(LONG_WIKITEXT))
+
+
+@pytest.mark.asyncio
+async def test_random_article_comes_from_selected_categories(dump):
+    article_ingestion = DumpArticleIngestion(dump_path=dump, categories=["Pirates", "Personal_finance"])
+
+    titles = set()
+    for _ in range(20):
+        await article_ingestion.get_random_article()
+        titles.add(article_ingestion.article_title)
+
+    assert titles == {"Blackbeard", "Anne Bonny"}
+    assert "He sailed the Caribbean seas." in article_ingestion.article_text
+    assert "[[" not in article_ingestion.article_text and "{{" not in article_ingestion.article_text
+
+
+def test_wikitext_is_reduced_to_plain_text():
+    text = wikitext_to_text("'''Teach''' ([[File:Flag.png|thumb|A [[flag]]]]) led a [[crew|band]]<!-- note -->."
+                            "{{cite|a={{nested}}}}\n\n\n== Death ==\n[https://example.org Killed] in 1718.")
+
+    assert text == "Teach () led a band.\n\n== Death ==\nKilled in 1718."
+
+
+def test_article_source_is_chosen_from_environment(dump, monkeypatch):
+    monkeypatch.setenv("WIKIPEDIA_DUMP_PATH", dump)
+
+    assert isinstance(create_article_ingestion(), ArticleIngestion)
+    monkeypatch.setenv("ARTICLE_SOURCE", "dump")
+    assert isinstance(create_article_ingestion(), DumpArticleIngestion)
@@ -0,0 +1,54 @@
+import pytest
+import io
+import json
+from datetime import date
+import backend.generate_day as generate_day
+from backend.generation_lock import GenerationInProgress
+
+
+def read_events(stream: io.StringIO) -> list:
+    return [tuple(json.loads(line).values()) for line in stream.getvalue().splitlines()]
+
+
+@pytest.mark.asyncio
+async def test_run_prints_each_event_as_a_json_line(monkeypatch):
+    async def fake_stream(target_date, lock_timeout):
+        yield 'source', {'title': 'Pirates'}
+        yield 'question', {'text': 'Who?'}
+        yield 'done', {'count': 1}
+
+    monkeypatch.setattr(generate_day, 'stream_daily_questions', fake_stream)
+    output = io.StringIO()
+
+    assert await generate_day.run(writer=generate_day.EventWriter(output)) == 0
+    assert read_events(output) == [('source', {'title': 'Pirates'}), ('question', {'text': 'Who?'}), ('done', {'count': 1})]
+
+
+@pytest.mark.asyncio
+async def test_run_reports_a_busy_lock(monkeypatch):
+    async def busy_stream(target_date, lock_timeout):
+        raise GenerationInProgress(date.today(), retry_after=9)
+        yield
+
+    monkeypatch.setattr(generate_day, 'stream_daily_questions', busy_stream)
+    output = io.StringIO()
+
+    assert await generate_day.run(writer=generate_day.EventWriter(output)) == 2
+    assert read_events(output) == [('busy', {'retry_after': 9})]
+
+
+@pytest.mark.asyncio
+async def test_run_keeps_generating_after_the_reader_goes_away(monkeypatch):
+    finished = []
+
+    async def fake_stream(target_date, lock_timeout):
+        yield 'source', {'title': 'Pirates'}
+        yield 'question', {'text': 'Who?'}
+        finished.append(True)
+
+    monkeypatch.setattr(generate_day, 'stream_daily_questions', fake_stream)
+    output = io.StringIO()
+    output.close()
+
+    assert await generate_day.run(writer=generate_day.EventWriter(output)) == 0
+    assert finished == [True]
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Packages only the question generator needs; the web entry point must not load them
+GENERATOR_ONLY = {'langchain', 'langchain_core', 'langchain_openai', 'langchain_community', 'openai', 'tiktoken'}
+# Generous bound on the cumulative import time of the web entry point
+WEB_IMPORT_BUDGET_MS = float(os.getenv('WEB_IMPORT_BUDGET_MS', '1500'))
+
+
+def import_profile(module: str) -> tuple[set, dict]:
+    """Import a module in a fresh interpreter, returning its loaded modules and -X importtime cumulative times."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import sys, {module}; print(",".join(sys.modules))'],
+        capture_output=True, text=True, cwd=PROJECT_ROOT, check=True
+    )
+    cumulative_ms = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                cumulative_ms[name.strip()] = int(cumulative) / 1000
+    return set(result.stdout.strip().split(',')), cumulative_ms
+
+
+def test_web_entry_point_does_not_load_the_generator_stack():
+    modules, _ = import_profile('backend.wsgi')
+
+    assert 'backend.question_generator' not in modules
+    assert {name.split('.')[0] for name in modules} & GENERATOR_ONLY == set()
+
+
+def test_web_entry_point_import_time_within_budget():
+    _, cumulative_ms = import_profile('backend.wsgi')
+
+    assert cumulative_ms['backend.wsgi'] < WEB_IMPORT_BUDGET_MS
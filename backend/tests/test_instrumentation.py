@@ -0,0 +1,157 @@
+import pytest
+import asyncio
+import json
+import os
+from datetime import date
+from types import SimpleNamespace
+from backend.app import db, GenerationTrace, get_app, user_cache
+from backend.generation_planner import GenerationPlanner
+from backend.instrumentation import (HTTP_SECONDS, LLM_TOKENS, MetricsRegistry, annotate, count, span,
+                                     timed_iter, trace)
+from backend.question_generator import QuestionGenerator, daily_rows
+
+app = get_app()
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        user_cache.clear()
+        client = app.test_client()
+        client.post('/signup', json={'username': 'player', 'password': 'secret'})
+        yield client
+        db.session.remove()
+        db.drop_all()
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1))
+    requests.inc(route='/a"b')
+    requests.inc(2, route='/a"b')
+    latency.observe(0.5, route="/a")
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{route="/a\\"b"} 3',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a",le="0.1"} 0',
+        'latency_seconds_bucket{route="/a",le="1"} 1',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 1',
+        'latency_seconds_sum{route="/a"} 0.5',
+        'latency_seconds_count{route="/a"} 1',
+    ]
+
+
+def test_shared_registry_adds_up_every_worker(tmp_path, monkeypatch):
+    def worker_registry():
+        registry = MetricsRegistry()
+        registry.counter("requests_total", "Requests", ("route",))
+        registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1))
+        return registry
+
+    # Another worker's snapshot, written under its own pid
+    other = worker_registry()
+    other.metrics["requests_total"].inc(2, route="/a")
+    other.metrics["latency_seconds"].observe(0.05, route="/a")
+    other.directory = str(tmp_path)
+    monkeypatch.setattr(os, 'getpid', lambda: 1)
+    other.write_snapshot()
+    monkeypatch.undo()
+
+    registry = worker_registry()
+    registry.share(str(tmp_path), interval=60)
+    registry.metrics["requests_total"].inc(route="/a")
+    registry.metrics["latency_seconds"].observe(0.5, route="/a")
+    lines = registry.render().splitlines()
+
+    assert 'requests_total{route="/a"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_count{route="/a"} 2' in lines
+
+
+@pytest.mark.asyncio
+async def test_trace_collects_spans_and_totals_across_tasks():
+    async def stage(i: int):
+        with span("llm.quiz", chunk=i):
+            await asyncio.sleep(0.01)
+            annotate(cache_hit=i == 0)
+            count("llm_calls")
+
+    with trace("run") as run:
+        items = list(timed_iter("chunking", iter(range(3))))
+        await asyncio.gather(*(stage(i) for i in items))
+        with pytest.raises(RuntimeError):
+            with span("ingestion"):
+                raise RuntimeError("no article")
+
+    result = run.to_dict()
+    assert result["totals"] == {"llm_calls": 3}
+    assert result["stages"]["llm.quiz"]["count"] == 3
+    assert result["stages"]["llm.quiz"]["total_ms"] >= 30
+    chunking = next(s for s in result["spans"] if s["name"] == "chunking")
+    assert chunking["items"] == 3
+    assert [s["cache_hit"] for s in result["spans"] if s["name"] == "llm.quiz"].count(True) == 1
+    assert next(s for s in result["spans"] if s["name"] == "ingestion")["error"] == "RuntimeError"
+
+
+class FakeChatModel:
+    async def ainvoke(self, messages):
+        if messages[0].content.startswith("Synthesize"):
+            return SimpleNamespace(content="FACTS")
+        return SimpleNamespace(content=json.dumps({"questions": [{
+            "text": "Who?", "answers": [{"text": f"Answer {i}", "is_correct": i == 0} for i in range(4)]
+        }]}))
+
+
+@pytest.mark.asyncio
+async def test_generation_trace_times_every_stage_and_is_stored_with_the_day(client, fake_encoder):
+    question_gen = QuestionGenerator(model=FakeChatModel(), planner=GenerationPlanner(strategy="per_chunk"))
+    question_gen.article_processor.iter_chunks = lambda text: iter(["chunk-1", "chunk-2"])
+
+    with trace("generate") as run:
+        await question_gen.process_article()
+    with app.app_context():
+        db.session.add_all(daily_rows(date(2024, 1, 1), {'questions': question_gen.questions,
+                                                         'source': {'title': 'T', 'preview': '...'}}, run))
+        db.session.commit()
+        stored = json.loads(db.session.query(GenerationTrace).filter_by(date=date(2024, 1, 1)).one().trace)
+
+    assert {name: stage["count"] for name, stage in stored["stages"].items()} == {
+        "chunking": 1, "llm.synthesis": 2, "llm.quiz": 2,
+    }
+    assert stored["totals"]["llm_calls"] == 4
+
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'trivia_last_generation_stage_seconds{date="2024-01-01",stage="llm.quiz"}' in metrics
+    assert 'trivia_last_generation_total{date="2024-01-01",name="llm_calls"} 4' in metrics
+
+
+def test_routes_report_latency_and_database_time(client):
+    before = HTTP_SECONDS.count(route='/score_history', method='GET', status=200)
+
+    response = client.get('/score_history')
+    metrics = client.get('/metrics').get_data(as_text=True)
+
+    assert HTTP_SECONDS.count(route='/score_history', method='GET', status=200) == before + 1
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+    assert 'statements' in response.headers['Server-Timing']
+    assert 'trivia_http_db_seconds_count{route="/score_history"}' in metrics
+    assert LLM_TOKENS.name in metrics
+
+
+def test_metrics_are_local_only_without_a_token(client):
+    assert client.get('/metrics').status_code == 200
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code == 403
+
+
+def test_metrics_token_is_required_when_configured(client, monkeypatch):
+    monkeypatch.setenv('METRICS_TOKEN', 'scrape')
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape'}).status_code == 200
@@ -0,0 +1,124 @@
+import pytest
+import time
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
+import backend.llm_cache as llm_cache
+from backend.llm_cache import CachedChatModel, FileCacheBackend, SQLCacheBackend, create_cache_backend, shared_cache_backend
+
+
+class CountingChatModel:
+    model_name = "fake-model"
+    _identifying_params = {"model_name": "fake-model", "temperature": 0.7}
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages, config=None, **kwargs):
+        self.calls += 1
+        return AIMessage(content=f"response {self.calls}", response_metadata={"token_usage": {"total_tokens": 7}})
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        return self.invoke(messages, config, **kwargs)
+
+    async def astream(self, messages, config=None, **kwargs):
+        self.calls += 1
+        for piece in ["streamed ", "response ", str(self.calls)]:
+            yield AIMessageChunk(content=piece)
+
+
+@pytest.fixture(params=["sqlite", "file"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLCacheBackend(f"sqlite:///{tmp_path}/cache.sqlite3")
+    return FileCacheBackend(str(tmp_path / "cache"))
+
+
+def prompt(text: str) -> list:
+    return [SystemMessage(content="Synthesize key facts"), HumanMessage(content=text)]
+
+
+def test_identical_requests_are_replayed(backend):
+    model = CountingChatModel()
+    cached = CachedChatModel(model, backend)
+
+    first = cached.invoke(prompt("article"))
+    second = cached.invoke(prompt("article"))
+
+    assert model.calls == 1
+    assert second.content == first.content
+    assert second.response_metadata == {"token_usage": {"total_tokens": 7}}
+    assert cached.stats()["hits"] == 1
+    assert cached.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_changed_messages_or_parameters_miss(backend):
+    model = CountingChatModel()
+    cached = CachedChatModel(model, backend)
+
+    await cached.ainvoke(prompt("article"))
+    await cached.ainvoke(prompt("another article"))
+    await cached.ainvoke(prompt("article"), temperature=0)
+    model._identifying_params = {"model_name": "fake-model", "temperature": 0.2}
+    await cached.ainvoke(prompt("article"))
+
+    assert model.calls == 4
+    assert cached.hits == 0
+
+
+@pytest.mark.asyncio
+async def test_streamed_responses_are_cached_and_replayed(backend):
+    model = CountingChatModel()
+    cached = CachedChatModel(model, backend)
+
+    first = [chunk.content async for chunk in cached.astream(prompt("article"))]
+    second = [chunk.content async for chunk in cached.astream(prompt("article"))]
+    invoked = await cached.ainvoke(prompt("article"))
+
+    assert first == ["streamed ", "response ", "1"]
+    assert second == ["streamed response 1"]
+    assert invoked.content == "streamed response 1"
+    assert model.calls == 1
+
+
+def test_entries_expire_after_max_age(backend):
+    model = CountingChatModel()
+    cached = CachedChatModel(model, backend)
+    cached.invoke(prompt("article"))
+
+    backend.max_age_seconds = 0
+    time.sleep(0.01)
+    cached.invoke(prompt("article"))
+    assert model.calls == 2
+    assert backend.evict() >= 1
+
+
+def test_size_eviction_drops_least_recently_used(backend):
+    model = CountingChatModel()
+    cached = CachedChatModel(model, backend)
+    for text in ("one", "two", "three"):
+        cached.invoke(prompt(text))
+        time.sleep(0.01)
+    cached.invoke(prompt("one"))
+
+    # Room for a single entry: only the most recently read one survives
+    backend.max_bytes = 300
+    assert backend.evict() == 2
+    calls = model.calls
+    cached.invoke(prompt("one"))
+    assert model.calls == calls
+    cached.invoke(prompt("three"))
+    assert model.calls == calls + 1
+
+
+def test_cache_backend_can_be_disabled():
+    assert create_cache_backend("off") is None
+
+
+def test_shared_backend_is_created_once_per_process(monkeypatch, tmp_path):
+    monkeypatch.setenv('LLM_CACHE_URL', f"sqlite:///{tmp_path}/cache.sqlite3")
+    monkeypatch.setattr(llm_cache, '_shared_cache_backend', llm_cache._UNSET)
+
+    backend = shared_cache_backend()
+
+    assert isinstance(backend, SQLCacheBackend)
+    assert shared_cache_backend() is backend
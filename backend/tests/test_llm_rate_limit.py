@@ -0,0 +1,146 @@
+import pytest
+import pytest_asyncio
+import time
+import openai
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+from backend.instrumentation import span, trace
+from backend.llm_rate_limit import RateLimitedChatModel, TokenBucket, create_rate_limits
+from openai_stub import StubOpenAI
+
+MESSAGES = [HumanMessage(content="Write a question about pirates")]
+
+
+@pytest_asyncio.fixture
+async def stub_openai():
+    stub = StubOpenAI()
+    await stub.start()
+    yield stub
+    await stub.stop()
+
+
+def limited(stub: StubOpenAI, **kwargs) -> RateLimitedChatModel:
+    model = ChatOpenAI(model_name="gpt-4o", api_key="test", base_url=stub.base_url, max_retries=0)
+    options = {"base_delay": 0.01, "max_delay": 0.05, "call_timeout": 2, "deadline": 5}
+    options.update(kwargs)
+    return RateLimitedChatModel(model, TokenBucket("requests", 6000), TokenBucket("tokens", 10 ** 7), **options)
+
+
+@pytest.mark.asyncio
+async def test_throttled_calls_are_retried_after_the_servers_delay(stub_openai):
+    stub_openai.script = [429, 429]
+    model = limited(stub_openai)
+
+    response = await model.ainvoke(MESSAGES)
+
+    assert response.content == "Hello from the stub"
+    assert model.stats()["retries"] == 2
+    first, second, third = (at for at, _ in stub_openai.requests)
+    assert second - first >= 0.02 and third - second >= 0.02
+
+
+@pytest.mark.asyncio
+async def test_non_retryable_errors_and_exhausted_retries_raise(stub_openai):
+    stub_openai.script = [400]
+    with pytest.raises(openai.BadRequestError):
+        await limited(stub_openai).ainvoke(MESSAGES)
+
+    stub_openai.script = [429, 429, 429]
+    with pytest.raises(openai.RateLimitError):
+        await limited(stub_openai, max_retries=2).ainvoke(MESSAGES)
+
+
+@pytest.mark.asyncio
+async def test_slow_attempts_are_cut_off_and_retried(stub_openai):
+    stub_openai.script = [1.0]
+    model = limited(stub_openai, call_timeout=0.2)
+
+    started = time.monotonic()
+    response = await model.ainvoke(MESSAGES)
+
+    assert response.content == "Hello from the stub"
+    assert time.monotonic() - started < 0.9
+    assert model.retries == 1
+
+
+@pytest.mark.asyncio
+async def test_deadline_bounds_the_whole_call(stub_openai):
+    stub_openai.script = [1.0, 1.0, 1.0]
+
+    with pytest.raises(TimeoutError):
+        await limited(stub_openai, call_timeout=0.3, deadline=0.5).ainvoke(MESSAGES)
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins_over_a_slow_first_attempt(stub_openai):
+    stub_openai.script = [1.0]
+    model = limited(stub_openai, hedge_after=0.1)
+
+    started = time.monotonic()
+    response = await model.ainvoke(MESSAGES)
+
+    assert response.content == "Hello from the stub"
+    assert time.monotonic() - started < 0.6
+    assert model.stats()["hedges"] == 1
+    assert len(stub_openai.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_retries_until_the_first_chunk(stub_openai):
+    stub_openai.script = [429]
+    model = limited(stub_openai)
+
+    chunks = [chunk.content async for chunk in model.astream(MESSAGES)]
+
+    assert "".join(chunks).strip() == "Hello from the stub"
+    assert model.retries == 1
+
+
+@pytest.mark.asyncio
+async def test_admission_paces_calls_to_the_request_budget(stub_openai):
+    model = limited(stub_openai)
+    model.requests_bucket = TokenBucket("requests", 600, capacity=1)  # one call per 0.1s
+
+    started = time.monotonic()
+    for _ in range(4):
+        await model.ainvoke(MESSAGES)
+
+    assert time.monotonic() - started >= 0.28
+    assert model.throttled_seconds > 0
+
+
+def test_token_bucket_waits_for_large_prompts():
+    bucket = TokenBucket("tokens", 60000, capacity=1000)
+
+    assert bucket.take(800) == 0
+    assert bucket.take(800) == pytest.approx(0.6, abs=0.05)
+    # A prompt larger than the bucket is admitted once the bucket is full
+    assert bucket.take(5000) == pytest.approx(0.8, abs=0.05)
+
+
+def test_sql_buckets_share_one_budget(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_REQUESTS_PER_MINUTE", "2")
+    url = f"sqlite:///{tmp_path}/limits.db"
+    first, _ = create_rate_limits(url)
+    second, _ = create_rate_limits(url)
+
+    assert first.take(1) == 0
+    assert second.take(1) == 0
+    assert first.take(1) > 0 and second.take(1) > 0
+
+
+@pytest.mark.asyncio
+async def test_reported_token_usage_is_charged_to_the_current_stage(stub_openai):
+    model = limited(stub_openai)
+
+    with trace("run") as run:
+        with span("llm.quiz"):
+            await model.ainvoke(MESSAGES)
+        with span("llm.quiz_stream"):
+            [chunk async for chunk in model.astream(MESSAGES)]
+
+    quiz, streamed = run.to_dict()["spans"]
+    assert (quiz["prompt_tokens"], quiz["completion_tokens"]) == (10, 5)
+    # Streamed responses carry no usage, so they are estimated
+    assert streamed["tokens_estimated"] and streamed["completion_tokens"] > 0
+    assert run.totals["prompt_tokens"] == 10 + streamed["prompt_tokens"]
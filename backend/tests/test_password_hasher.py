@@ -0,0 +1,59 @@
+import pytest
+import threading
+import time
+from backend.password_hasher import HasherOverloaded, PasswordHasher, calibrate_rounds, hash_cost
+
+
+def test_hash_and_verify_on_the_pool():
+    hasher = PasswordHasher(rounds=4, workers=2)
+
+    hashed = hasher.hash("secret")
+
+    assert hash_cost(hashed) == 4
+    assert hasher.verify("secret", hashed)
+    assert not hasher.verify("wrong", memoryview(hashed))
+
+
+def test_needs_rehash_only_when_cost_rises():
+    hasher = PasswordHasher(rounds=5)
+    hashed = hasher.hash("secret")
+
+    assert not hasher.needs_rehash(hashed)
+    hasher.rounds = 4
+    assert not hasher.needs_rehash(hashed)
+    hasher.rounds = 6
+    assert hasher.needs_rehash(hashed)
+
+
+def test_full_queue_fails_fast():
+    hasher = PasswordHasher(rounds=4, workers=1, max_queue=1)
+    release = threading.Event()
+    blockers = [threading.Thread(target=hasher._run, args=(release.wait, 5)) for _ in range(2)]
+    for blocker in blockers:
+        blocker.start()
+    while hasher._slots._value:
+        time.sleep(0.001)
+
+    try:
+        with pytest.raises(HasherOverloaded):
+            hasher.hash("secret")
+    finally:
+        release.set()
+        for blocker in blockers:
+            blocker.join()
+
+    assert hasher.verify("secret", hasher.hash("secret"))
+
+
+def test_slow_hash_times_out():
+    hasher = PasswordHasher(rounds=4, workers=1, timeout=0.01)
+    release = threading.Event()
+
+    with pytest.raises(HasherOverloaded):
+        hasher._run(release.wait, 5)
+    release.set()
+
+
+def test_calibration_stays_within_bounds():
+    assert calibrate_rounds(target_ms=0.001, minimum=4, maximum=8) == 4
+    assert calibrate_rounds(target_ms=10_000, minimum=4, maximum=8) == 8
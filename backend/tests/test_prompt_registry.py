@@ -0,0 +1,24 @@
+from backend.jinja_helper import PromptRegistry, get_prompt_registry, process_template
+
+
+def test_registry_compiles_each_template_once():
+    registry = PromptRegistry()
+    first = registry.get_template("synthesize_text.jinja")
+    second = registry.get_template("synthesize_text.jinja")
+
+    assert first is second
+    assert len(registry.template_hash("synthesize_text.jinja")) == 64
+    assert registry.template_hash("synthesize_text.jinja") != registry.template_hash("create_multiple_choice_quiz.jinja")
+
+
+def test_static_renders_are_memoized_per_data():
+    registry = PromptRegistry()
+    ten = registry.render_static("synthesize_text.jinja", {"num_key_facts": "10"})
+
+    assert registry.render_static("synthesize_text.jinja", {"num_key_facts": "10"}) is ten
+    assert "Synthesize 5 key facts" in registry.render_static("synthesize_text.jinja", {"num_key_facts": "5"})
+
+
+def test_process_template_uses_shared_registry():
+    assert get_prompt_registry() is get_prompt_registry()
+    assert process_template("synthesize_text.jinja", {"num_key_facts": "10"}).startswith("Synthesize 10 key facts")
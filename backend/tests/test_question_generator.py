@@ -1,9 +1,10 @@
 import pytest
 import json
-from src.question_generator import QuestionGenerator
-from src.article_processor import ArticleProcessor
-from src.jinja_helper import process_template
-from src.openai_question_schema import OpenAIQuestionSet
+import os
+from backend.question_generator import QuestionGenerator
+from backend.article_processor import ArticleProcessor
+from backend.jinja_helper import process_template
+from backend.openai_question_schema import OpenAIQuestionSet
 from langchain_core.prompts.chat import (
     HumanMessagePromptTemplate,
     ChatPromptTemplate,
@@ -11,9 +12,14 @@ from langchain_core.prompts.chat import (
 )
 from langchain.output_parsers import PydanticOutputParser
 
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'test_data')
+
+# Calls the OpenAI API and writes its outputs into test_data for inspection
+pytestmark = pytest.mark.skipif(not os.getenv('LIVE_API_TESTS'), reason='set LIVE_API_TESTS=1 to call the live APIs')
+
 def read_test_article():
     """Read the test article from raw_scraped.txt"""
-    with open('tests/test_data/raw_scraped.txt', 'r', encoding='utf-8') as f:
+    with open(f'{TEST_DATA}/raw_scraped.txt', 'r', encoding='utf-8') as f:
         lines = f.readlines()
         # Skip the title and URL lines and their following newline
         article_text = ''.join(lines[3:])
@@ -34,7 +40,7 @@ async def test_question_generation_pipeline():
     article_processor.process_text(article_text)
     
     # Save chunks for analysis
-    with open('tests/test_data/test_output_chunks.txt', 'w', encoding='utf-8') as f:
+    with open(f'{TEST_DATA}/test_output_chunks.txt', 'w', encoding='utf-8') as f:
         for i, chunk in enumerate(article_processor.chunks):
             f.write(f"\n{'='*80}\nChunk {i+1}:\n{'='*80}\n")
             f.write(chunk)
@@ -60,10 +66,10 @@ async def test_question_generation_pipeline():
             chunk_output['synthesized_text'] = synthesized_text
 
             # Save the synthesized text for debugging
-            with open(f'tests/test_data/test_synthesis_prompt_{i+1}.txt', 'w', encoding='utf-8') as f:
+            with open(f'{TEST_DATA}/test_synthesis_prompt_{i+1}.txt', 'w', encoding='utf-8') as f:
                 f.write(str(chat_prompt_formatted))
             # Save the synthesized text for debugging
-            with open(f'tests/test_data/test_synthesis_output_{i+1}.txt', 'w', encoding='utf-8') as f:
+            with open(f'{TEST_DATA}/test_synthesis_output_{i+1}.txt', 'w', encoding='utf-8') as f:
                 f.write(str(synthesized_text))
             
 
@@ -89,11 +95,11 @@ async def test_question_generation_pipeline():
             questions_data = parser.parse(response.content)
 
             # Save the prompt for debugging
-            with open(f'tests/test_data/test_question_prompt_{i+1}.txt', 'w', encoding='utf-8') as f:
+            with open(f'{TEST_DATA}/test_question_prompt_{i+1}.txt', 'w', encoding='utf-8') as f:
                 f.write(str(chat_prompt))
             
             # Save raw response for debugging
-            with open(f'tests/test_data/test_output_raw_response_{i+1}.txt', 'w', encoding='utf-8') as f:
+            with open(f'{TEST_DATA}/test_output_raw_response_{i+1}.txt', 'w', encoding='utf-8') as f:
                 f.write(str(questions_data.model_dump()['questions']))
             
             chunk_output['questions'] = questions_data.model_dump()['questions']
@@ -107,7 +113,7 @@ async def test_question_generation_pipeline():
         break
     
     # Save all outputs to a JSON file for analysis
-    with open('tests/test_data/all_outputs.json', 'w', encoding='utf-8') as f:
+    with open(f'{TEST_DATA}/all_outputs.json', 'w', encoding='utf-8') as f:
         json.dump(all_outputs, f, indent=2, ensure_ascii=False)
     
     # Print debug info if there are errors
@@ -0,0 +1,348 @@
+import pytest
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from backend.article_processor import ArticleProcessor
+from backend.generation_planner import FUSED, MAP_REDUCE, SAMPLED, GenerationPlanner
+from backend.instrumentation import trace
+from backend.question_generator import QUIZ_FORMAT_INSTRUCTIONS, QuestionGenerator, validate_questions
+
+
+def make_quiz_json(label: str) -> str:
+    return json.dumps({
+        "questions": [{
+            "text": f"Question about {label}?",
+            "answers": [{"text": f"Answer {i}", "is_correct": i == 0} for i in range(4)]
+        }]
+    })
+
+
+class FakeChatModel:
+    """Chat model double that answers after a fixed delay and tracks concurrency."""
+
+    def __init__(self, delay: float = 0.05, fail_on: str = None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            human = messages[-1].content
+            if self.fail_on and self.fail_on in human:
+                raise RuntimeError("model failure")
+            if messages[0].content.startswith("Synthesize"):
+                return SimpleNamespace(content=f"FACTS:{human}")
+            return SimpleNamespace(content=make_quiz_json(human.removeprefix("FACTS:")))
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.mark.asyncio
+async def test_process_article_runs_chunks_concurrently_in_order(fake_encoder):
+    model = FakeChatModel(delay=0.05)
+    question_gen = QuestionGenerator(model=model, max_concurrency=8, planner=GenerationPlanner(strategy="per_chunk"))
+    question_gen.article_processor.iter_chunks = lambda text: iter([f"chunk-{i}" for i in range(6)])
+
+    start = time.perf_counter()
+    await question_gen.process_article()
+    elapsed = time.perf_counter() - start
+
+    assert [q["text"] for q in question_gen.questions] == [f"Question about chunk-{i}?" for i in range(6)]
+    assert model.calls == 12
+    # Two sequential stages per chunk, not twelve sequential calls
+    assert elapsed < 12 * model.delay / 2
+
+
+@pytest.mark.asyncio
+async def test_process_article_respects_concurrency_limit(fake_encoder):
+    model = FakeChatModel(delay=0.01)
+    question_gen = QuestionGenerator(model=model, max_concurrency=2, planner=GenerationPlanner(strategy="per_chunk"))
+    question_gen.article_processor.iter_chunks = lambda text: iter([f"chunk-{i}" for i in range(5)])
+
+    await question_gen.process_article()
+
+    assert model.max_in_flight == 2
+    assert len(question_gen.questions) == 5
+
+
+@pytest.mark.asyncio
+async def test_process_article_reports_failed_chunks_without_cancelling_others(fake_encoder):
+    model = FakeChatModel(delay=0.01, fail_on="chunk-1")
+    question_gen = QuestionGenerator(model=model, planner=GenerationPlanner(strategy="per_chunk"))
+    question_gen.article_processor.iter_chunks = lambda text: iter(["chunk-0", "chunk-1", "chunk-2"])
+
+    await question_gen.process_article()
+
+    assert [q["text"] for q in question_gen.questions] == ["Question about chunk-0?", "Question about chunk-2?"]
+    assert [index for index, _ in question_gen.chunk_errors] == [1]
+
+
+@pytest.mark.asyncio
+async def test_process_article_raises_when_every_chunk_fails(fake_encoder):
+    question_gen = QuestionGenerator(model=FakeChatModel(delay=0, fail_on="chunk"),
+                                     planner=GenerationPlanner(strategy="per_chunk"))
+    question_gen.article_processor.iter_chunks = lambda text: iter(["chunk-0", "chunk-1"])
+
+    with pytest.raises(Exception, match="All 2 chunks failed"):
+        await question_gen.process_article()
+
+
+def make_article(sections: int, words_per_section: int) -> str:
+    return "\n\n".join(
+        f"== Section {s} ==\n" + " ".join(f"s{s}w{w}" for w in range(words_per_section)) + "."
+        for s in range(sections)
+    )
+
+
+def planned_generator(model, text: str, **planner_kwargs) -> QuestionGenerator:
+    question_gen = QuestionGenerator(
+        model=model,
+        article_processor=ArticleProcessor(target_tokens=100, overlap_tokens=0),
+        planner=GenerationPlanner(**planner_kwargs)
+    )
+    question_gen.article_ingestion.article_text = text
+    return question_gen
+
+
+def test_planner_picks_strategy_by_article_size():
+    planner = GenerationPlanner(fused_max_tokens=500, map_reduce_max_chunks=4)
+
+    assert planner.plan([200, 200], 50, 300).strategy == FUSED
+    assert planner.plan([400, 400, 400], 50, 300).strategy == MAP_REDUCE
+    sampled = planner.plan([400] * 12, 50, 300)
+    assert sampled.strategy == SAMPLED
+    assert sampled.chunk_indices == [0, 6]
+    assert sampled.estimated_calls == 3
+    assert sampled.calls_saved == 21
+    assert sampled.tokens_saved > 0
+
+
+@pytest.mark.asyncio
+async def test_short_article_uses_one_fused_call(fake_encoder):
+    model = FakeChatModel(delay=0)
+    question_gen = planned_generator(model, make_article(2, 50), fused_max_tokens=1000)
+
+    await question_gen.process_article()
+
+    assert model.calls == 1
+    assert question_gen.plan.strategy == FUSED
+    assert question_gen.plan.actual_calls == 1
+    assert question_gen.plan.calls_saved == question_gen.plan.baseline_calls - 1
+
+
+@pytest.mark.asyncio
+async def test_fused_call_sends_the_article_once_despite_chunk_overlap(fake_encoder):
+    prompts = []
+
+    class RecordingModel(FakeChatModel):
+        async def ainvoke(self, messages):
+            prompts.append(messages[-1].content)
+            return await super().ainvoke(messages)
+
+    # Plain paragraphs of 40 words, so every chunk carries the previous one's last paragraph
+    text = "\n\n".join(" ".join(f"p{p}w{w}" for w in range(40)) + "." for p in range(12))
+    question_gen = QuestionGenerator(
+        model=RecordingModel(delay=0),
+        article_processor=ArticleProcessor(target_tokens=150, overlap_tokens=50),
+        planner=GenerationPlanner(fused_max_tokens=1000)
+    )
+    question_gen.article_ingestion.article_text = text
+
+    with trace("generate") as run:
+        await question_gen.process_article()
+
+    processor = question_gen.article_processor
+    assert processor.article_tokens == 480
+    assert sum(processor.chunk_token_counts) > 480
+    assert prompts == [text]
+    assert question_gen.plan.estimated_prompt_tokens == question_gen._prompt_overhead()[1] + 480
+    assert run.to_dict()["attrs"]["plan"] == question_gen.plan.to_dict()
+
+
+@pytest.mark.asyncio
+async def test_medium_article_synthesizes_every_chunk_then_quizzes_once(fake_encoder):
+    model = FakeChatModel(delay=0)
+    question_gen = planned_generator(model, make_article(3, 90), fused_max_tokens=100, map_reduce_max_chunks=5)
+
+    await question_gen.process_article()
+
+    assert question_gen.plan.strategy == MAP_REDUCE
+    assert question_gen.plan.chunk_indices == [0, 1, 2]
+    assert model.calls == 4
+    assert len(question_gen.questions) == 1
+    assert "s2w0" in question_gen.questions[0]["text"]
+
+
+@pytest.mark.asyncio
+async def test_long_article_synthesizes_only_sampled_chunks(fake_encoder):
+    model = FakeChatModel(delay=0)
+    question_gen = planned_generator(model, make_article(10, 90), fused_max_tokens=100, map_reduce_max_chunks=5)
+
+    await question_gen.process_article()
+
+    assert question_gen.plan.strategy == SAMPLED
+    assert question_gen.plan.chunk_indices == [0, 5]
+    assert model.calls == 3
+    assert question_gen.plan.actual_calls == 3
+
+
+@pytest.mark.asyncio
+async def test_map_reduce_tolerates_failed_synthesis(fake_encoder):
+    model = FakeChatModel(delay=0, fail_on="s1w0")
+    question_gen = planned_generator(model, make_article(3, 90), fused_max_tokens=100, map_reduce_max_chunks=5)
+
+    await question_gen.process_article()
+
+    assert [index for index, _ in question_gen.chunk_errors] == [1]
+    assert len(question_gen.questions) == 1
+
+
+def make_question(label: str, correct: int = 1, answers: int = 4) -> dict:
+    return {
+        "text": f"Question about {label}?",
+        "answers": [{"text": f"Answer {i}", "is_correct": i < correct} for i in range(answers)]
+    }
+
+
+class ScriptedStructuredModel:
+    """Chat model double returning scripted question sets and recording each request."""
+
+    def __init__(self, responses: list):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def ainvoke(self, messages, **kwargs):
+        self.requests.append((messages, kwargs))
+        return SimpleNamespace(content=json.dumps({"questions": self.responses.pop(0)}))
+
+
+def structured_generator(model, **kwargs) -> QuestionGenerator:
+    question_gen = QuestionGenerator(model=model, output_mode="structured", **kwargs)
+    question_gen.article_ingestion.article_text = "A short article."
+    return question_gen
+
+
+def test_validate_questions_rejects_each_bad_question_separately():
+    valid, errors = validate_questions([
+        make_question("a"),
+        make_question("b", correct=2),
+        make_question("c", answers=3),
+        {"text": "No answers?"},
+    ])
+
+    assert [q["text"] for q in valid] == ["Question about a?"]
+    assert len(errors) == 3
+    assert "2 correct answers" in errors[0]
+    assert "3 answers" in errors[1]
+    assert "schema" in errors[2]
+
+
+def test_structured_prompt_drops_format_example(fake_encoder):
+    text_gen = QuestionGenerator(model=FakeChatModel(), output_mode="text")
+    structured_gen = QuestionGenerator(model=FakeChatModel(), output_mode="structured")
+
+    text_prompt = text_gen._build_quiz_messages("facts", 4)[0].content
+    structured_prompt = structured_gen._build_quiz_messages("facts", 4)[0].content
+
+    assert "EXAMPLE OF GOOD QUESTION" in text_prompt
+    assert QUIZ_FORMAT_INSTRUCTIONS in text_prompt
+    assert "EXAMPLE OF GOOD QUESTION" not in structured_prompt
+    assert QUIZ_FORMAT_INSTRUCTIONS not in structured_prompt
+    assert "Generate exactly 4 questions" in structured_prompt
+    assert len(structured_prompt) < len(text_prompt)
+
+
+@pytest.mark.asyncio
+async def test_structured_mode_re_requests_only_invalid_questions(fake_encoder):
+    model = ScriptedStructuredModel([
+        [make_question("a"), make_question("b", correct=0), make_question("c"), make_question("d", answers=2)],
+        [make_question("e"), make_question("f")],
+    ])
+    question_gen = structured_generator(model, planner=GenerationPlanner(strategy="fused"))
+
+    await question_gen.process_article()
+
+    assert [q["text"] for q in question_gen.questions] == [
+        f"Question about {label}?" for label in ["a", "c", "e", "f"]
+    ]
+    assert len(model.requests) == 2
+    assert all(kwargs["response_format"]["type"] == "json_schema" for _, kwargs in model.requests)
+    repair_messages = model.requests[1][0]
+    assert "Generate exactly 2 questions" in repair_messages[0].content
+    assert "rejected" in repair_messages[-1].content
+    assert "Question about a?" in repair_messages[-1].content
+    assert question_gen.repaired_questions == 2
+
+
+@pytest.mark.asyncio
+async def test_structured_mode_keeps_valid_questions_when_repairs_run_out(fake_encoder):
+    model = ScriptedStructuredModel([
+        [make_question("a"), make_question("b", correct=0)],
+        [make_question("c", correct=0)],
+    ])
+    question_gen = structured_generator(model, planner=GenerationPlanner(strategy="fused", target_questions=2),
+                                        max_repair_attempts=1)
+
+    await question_gen.process_article()
+
+    assert [q["text"] for q in question_gen.questions] == ["Question about a?"]
+    assert len(model.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_structured_mode_raises_when_no_question_is_valid(fake_encoder):
+    model = ScriptedStructuredModel([[make_question("a", correct=0)]])
+    question_gen = structured_generator(model, planner=GenerationPlanner(strategy="fused"), max_repair_attempts=0)
+
+    with pytest.raises(Exception, match="No valid questions"):
+        await question_gen.process_article()
+
+
+class StreamingQuizModel:
+    """Chat model double that streams a quiz response a few characters at a time."""
+
+    def __init__(self, questions: list, piece: int = 8, delay: float = 0.001):
+        self.text = json.dumps({"questions": questions})
+        self.piece = piece
+        self.delay = delay
+        self.finished = False
+
+    async def astream(self, messages, **kwargs):
+        for start in range(0, len(self.text), self.piece):
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(content=self.text[start:start + self.piece])
+        self.finished = True
+
+
+@pytest.mark.asyncio
+async def test_astream_questions_yields_first_question_before_response_ends(fake_encoder):
+    model = StreamingQuizModel([make_question(label) for label in "abcd"])
+    question_gen = QuestionGenerator(model=model, planner=GenerationPlanner(strategy="fused"))
+    question_gen.article_ingestion.article_text = "A short article."
+
+    seen = []
+    async for question in question_gen.astream_questions():
+        seen.append((question["text"], model.finished))
+
+    assert [text for text, _ in seen] == [f"Question about {label}?" for label in "abcd"]
+    assert seen[0][1] is False
+    assert question_gen.questions == [make_question(label) for label in "abcd"]
+    assert question_gen.plan.actual_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_astream_questions_skips_invalid_streamed_questions(fake_encoder):
+    model = StreamingQuizModel([make_question("a", correct=0), make_question("b")])
+    question_gen = QuestionGenerator(model=model, output_mode="text", planner=GenerationPlanner(strategy="fused"))
+    question_gen.article_ingestion.article_text = "A short article."
+
+    questions = [question async for question in question_gen.astream_questions()]
+
+    assert [q["text"] for q in questions] == ["Question about b?"]
@@ -0,0 +1,39 @@
+import json
+from backend.question_stream import QuestionStreamParser
+
+QUESTION_SET = {
+    "questions": [
+        {"text": "Which {brace} is \"quoted\"?", "answers": [{"text": "This ] one", "is_correct": True}]},
+        {"text": "Second?", "answers": [{"text": "\\\\", "is_correct": False}]},
+    ]
+}
+
+
+def test_questions_are_yielded_as_each_object_closes():
+    text = json.dumps(QUESTION_SET)
+    first_end = text.index('"Second?"')
+    parser = QuestionStreamParser()
+
+    early = list(parser.feed(text[:first_end]))
+    late = list(parser.feed(text[first_end:]))
+
+    assert early == [QUESTION_SET["questions"][0]]
+    assert late == [QUESTION_SET["questions"][1]]
+    assert parser.count == 2
+
+
+def test_any_split_of_the_stream_yields_the_same_questions():
+    text = "```json\n" + json.dumps(QUESTION_SET, indent=2) + "\n```"
+    for size in (1, 3, 7, 64):
+        parser = QuestionStreamParser()
+        questions = []
+        for start in range(0, len(text), size):
+            questions.extend(parser.feed(text[start:start + size]))
+        assert questions == QUESTION_SET["questions"]
+
+
+def test_truncated_stream_yields_only_complete_questions():
+    text = json.dumps(QUESTION_SET)
+    parser = QuestionStreamParser()
+
+    assert list(parser.feed(text[:text.index('"Second?"') + 12])) == [QUESTION_SET["questions"][0]]
@@ -0,0 +1,42 @@
+import pytest
+import json
+from datetime import date, timedelta
+import backend.main as scheduler
+from backend.app import db, DailyQuestions, get_app
+
+app = get_app()
+
+
+@pytest.fixture
+def database():
+    with app.app_context():
+        db.create_all()
+        yield
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.mark.asyncio
+async def test_refill_buffer_generates_missing_days_with_retries(database, monkeypatch):
+    today = date.today()
+    monkeypatch.setattr(scheduler, 'BUFFER_DAYS', 3)
+    monkeypatch.setattr(scheduler, 'REFILL_BACKOFF_SECONDS', 0)
+    with app.app_context():
+        db.session.add(DailyQuestions(date=today + timedelta(days=1), questions=json.dumps({'questions': []})))
+        db.session.commit()
+
+    attempts = []
+
+    async def fake_generate(target_date):
+        attempts.append(target_date)
+        if attempts.count(target_date) == 1 and target_date == today + timedelta(days=2):
+            raise RuntimeError("rate limited")
+        with app.app_context():
+            db.session.add(DailyQuestions(date=target_date, questions=json.dumps({'questions': []})))
+            db.session.commit()
+
+    monkeypatch.setattr(scheduler, 'generate_daily_questions', fake_generate)
+    await scheduler.refill_buffer()
+
+    assert attempts == [today, today + timedelta(days=2), today + timedelta(days=2), today + timedelta(days=3)]
+    assert scheduler.missing_buffer_dates() == []
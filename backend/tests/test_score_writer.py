@@ -0,0 +1,78 @@
+import pytest
+import threading
+from datetime import date
+from sqlalchemy import Column, Date, Index, Integer, MetaData, Table, create_engine, select
+from backend.score_writer import ScoreWriter, insert_scores
+
+metadata = MetaData()
+scores = Table(
+    'score', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, nullable=False),
+    Column('score', Integer, nullable=False),
+    Column('date', Date, nullable=False),
+    Index('ix_score_user_date', 'user_id', 'date', unique=True),
+)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/scores.db')
+    metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_insert_scores_skips_existing_keys(engine):
+    today = date(2024, 5, 1)
+    with engine.begin() as connection:
+        assert insert_scores(connection, scores, [{'user_id': 1, 'score': 2, 'date': today}]) == {(1, today)}
+        assert insert_scores(connection, scores, [
+            {'user_id': 1, 'score': 4, 'date': today},
+            {'user_id': 2, 'score': 1, 'date': today},
+        ]) == {(2, today)}
+        assert connection.execute(select(scores.c.score).where(scores.c.user_id == 1)).scalar() == 2
+
+
+def test_write_behind_batches_concurrent_submissions(engine):
+    writer = ScoreWriter(lambda connection, rows: insert_scores(connection, scores, rows), batch_size=20, max_delay=0.05, enabled=True)
+    today = date(2024, 5, 1)
+    results = {}
+
+    def submit(user_id):
+        results[user_id] = writer.submit(engine, {'user_id': user_id % 15, 'score': 1, 'date': today})
+
+    threads = [threading.Thread(target=submit, args=(user_id,)) for user_id in range(30)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(results.values()) == 15
+    assert writer.batches < 30
+    with engine.connect() as connection:
+        assert len(connection.execute(select(scores)).all()) == 15
+
+
+def test_failed_batch_is_retried_row_by_row(engine):
+    writer = ScoreWriter(lambda connection, rows: insert_scores(connection, scores, rows), batch_size=3, max_delay=0.2,
+                         enabled=True)
+    today = date(2024, 5, 1)
+    results = {}
+
+    def submit(user_id, score):
+        try:
+            results[user_id] = writer.submit(engine, {'user_id': user_id, 'score': score, 'date': today})
+        except Exception as e:
+            results[user_id] = e
+
+    threads = [threading.Thread(target=submit, args=(user_id, score)) for user_id, score in ((1, 2), (2, None), (3, 4))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results[1] is True and results[3] is True
+    assert isinstance(results[2], Exception)
+    with engine.connect() as connection:
+        assert sorted(connection.execute(select(scores.c.user_id)).scalars()) == [1, 3]
@@ -0,0 +1,16 @@
+from .app import DailyScoreCount, Score, UserStats, create_app, db, ensure_indexes, rebuild_score_summaries
+
+# Entry point for production servers: gunicorn -c gunicorn.conf.py backend.wsgi:app
+app = create_app()
+
+with app.app_context():
+    db.create_all()
+    duplicates_removed = ensure_indexes()
+    # Summaries are kept up to date on submit; fill them in once for scores stored before they existed,
+    # and again if duplicate scores they may have counted were just removed
+    summaries_missing = UserStats.query.first() is None or DailyScoreCount.query.first() is None
+    if (summaries_missing or duplicates_removed) and Score.query.first() is not None:
+        rebuild_score_summaries()
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', debug=True)
@@ -0,0 +1,4 @@
+from backend.backfill import main
+
+if __name__ == "__main__":
+    main()
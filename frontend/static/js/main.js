@@ -1,6 +1,9 @@
 let currentQuestions = null;
 let currentQuestionIndex = 0;
 let score = 0;
+// Questions arrive one at a time from /stream_questions; these track the rest of the stream
+let questionsComplete = false;
+let questionWaiters = [];
 
 // Event Listeners
 document.addEventListener('DOMContentLoaded', () => {
@@ -24,7 +27,7 @@ document.addEventListener('DOMContentLoaded', () => {
 async function startGame() {
     try {
         console.log('Starting game...');
-        const response = await fetch('/get_questions');
+        const response = await fetch('/stream_questions');
         console.log('Response:', response);
         
         if (response.status === 403) {
@@ -32,30 +35,111 @@ async function startGame() {
             return;
         }
         
-        if (!response.ok) {
-            throw new Error('Failed to fetch questions');
+        if (response.status === 503) {
+            // Another request is already generating today's quiz
+            const data = await response.json();
+            const retryAfter = data.retry_after || 15;
+            showMessage(`Today's quiz is being generated. Retrying in ${retryAfter} seconds...`, 'info');
+            setTimeout(startGame, retryAfter * 1000);
+            return;
         }
-
-        currentQuestions = await response.json();
-        console.log('Questions loaded:', currentQuestions);
         
-        if (!currentQuestions || !currentQuestions.questions || currentQuestions.questions.length === 0) {
-            showMessage('No questions available for today. Please check back later!', 'info');
+        if (response.status === 404) {
+            showMessage(`Today's quiz is not available yet. Please check back later!`, 'info');
             return;
         }
+        
+        if (!response.ok || !response.body) {
+            throw new Error('Failed to fetch questions');
+        }
 
         // Reset game state
+        currentQuestions = { source: null, questions: [] };
         currentQuestionIndex = 0;
         score = 0;
+        questionsComplete = false;
+        questionWaiters = [];
+        
+        await readQuestionStream(response.body.getReader(), handleStreamEvent);
+        finishQuestionStream();
         
-        // Show first question
-        document.getElementById('welcome-screen').classList.add('hidden');
-        document.getElementById('question-screen').classList.remove('hidden');
-        showQuestion();
+        if (currentQuestions.questions.length === 0) {
+            showMessage('No questions available for today. Please check back later!', 'info');
+        }
         
     } catch (error) {
         console.error('Error starting game:', error);
-        showMessage('Log in or sign up to take the quiz!', 'error');
+        finishQuestionStream();
+        if (!currentQuestions || currentQuestions.questions.length === 0) {
+            showMessage('Log in or sign up to take the quiz!', 'error');
+        }
+    }
+}
+
+async function readQuestionStream(reader, onEvent) {
+    // Minimal server-sent events reader: blocks of "event: name" and "data: json" lines
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let name = 'message';
+            let data = '';
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) {
+                    name = line.slice('event: '.length);
+                } else if (line.startsWith('data: ')) {
+                    data += line.slice('data: '.length);
+                }
+            });
+            onEvent(name, data ? JSON.parse(data) : null);
+        }
+    }
+}
+
+function handleStreamEvent(name, data) {
+    console.log('Stream event:', name, data);
+    if (name === 'source') {
+        currentQuestions.source = data;
+    } else if (name === 'question') {
+        currentQuestions.questions.push(data);
+        if (currentQuestions.questions.length === 1) {
+            // Show the first question while the rest are still being generated
+            document.getElementById('welcome-screen').classList.add('hidden');
+            document.getElementById('question-screen').classList.remove('hidden');
+            showQuestion();
+        }
+        notifyQuestionWaiters();
+    } else if (name === 'done') {
+        finishQuestionStream();
+    } else if (name === 'error') {
+        console.error('Question stream failed:', data);
+        finishQuestionStream();
+    }
+}
+
+function finishQuestionStream() {
+    questionsComplete = true;
+    notifyQuestionWaiters();
+}
+
+function notifyQuestionWaiters() {
+    const waiters = questionWaiters;
+    questionWaiters = [];
+    waiters.forEach(resolve => resolve());
+}
+
+async function waitForQuestion(index) {
+    // Resolves once question `index` has arrived or the stream has ended without it
+    while (!questionsComplete && index >= currentQuestions.questions.length) {
+        await new Promise(resolve => questionWaiters.push(resolve));
     }
 }
 
@@ -176,15 +260,17 @@ function handleAnswer(choiceIndex) {
     // Show loading animation
     const loader = document.getElementById('next-question-loader');
     const loaderText = loader.querySelector('.loader-text');
-    const isLastQuestion = currentQuestionIndex === currentQuestions.questions.length - 1;
+    const isLastQuestion = questionsComplete && currentQuestionIndex === currentQuestions.questions.length - 1;
     loaderText.textContent = isLastQuestion ? 'Preparing your quiz results...' : 'Loading next question...';
     loader.classList.remove('hidden');
     setTimeout(() => {
         loader.classList.add('visible');
     }, 50);
     
-    setTimeout(() => {
+    setTimeout(async () => {
         currentQuestionIndex++;
+        // The next question may still be streaming in
+        await waitForQuestion(currentQuestionIndex);
         
         if (currentQuestionIndex < currentQuestions.questions.length) {
             // Hide loader before showing next question
@@ -245,13 +331,20 @@ function showResults() {
             `;
         }
         
-        // Submit score to backend
-        submitScore(score);
-        
-        // Load and display calendar if user is logged in
-        if (document.getElementById('calendar')) {
-            loadUserScores();
-        }
+        // Submit score to backend, then show how it compares and the updated calendar
+        submitScore(score).then(result => {
+            if (result && result.beat_percent !== null && result.beat_percent !== undefined) {
+                const comparison = document.createElement('p');
+                comparison.textContent = `You beat ${result.beat_percent}% of today's players`;
+                scoreDisplay.appendChild(comparison);
+            }
+            
+            // Load and display calendar if user is logged in
+            if (document.getElementById('calendar')) {
+                loadUserScores();
+                loadDailySummary();
+            }
+        });
     } catch (error) {
         console.error('Error in showResults:', error);
         alert('An error occurred while displaying results. Your score may not have been saved.');
@@ -274,8 +367,32 @@ async function submitScore(finalScore) {
         
         const data = await response.json();
         console.log('Score submitted successfully:', data);
+        return data;
     } catch (error) {
         console.error('Error submitting score:', error);
+        return null;
+    }
+}
+
+async function loadDailySummary() {
+    const container = document.getElementById('daily-summary');
+    if (!container) return;
+    
+    try {
+        const response = await fetch('/daily_summary');
+        if (!response.ok) return;
+        const summary = await response.json();
+        
+        container.innerHTML = `<h3>Today's leaderboard (${summary.players} players)</h3>`;
+        const list = document.createElement('ol');
+        summary.leaderboard.forEach(entry => {
+            const item = document.createElement('li');
+            item.textContent = `${entry.username}: ${entry.score}`;
+            list.appendChild(item);
+        });
+        container.appendChild(list);
+    } catch (error) {
+        console.error('Error loading daily summary:', error);
     }
 }
 
@@ -359,19 +476,43 @@ async function logout() {
 }
 
 // Calendar Functions
+// Format a date as YYYY-MM-DD in local time, matching the server's calendar days
+function localDateString(date) {
+    const month = String(date.getMonth() + 1).padStart(2, '0');
+    const day = String(date.getDate()).padStart(2, '0');
+    return `${date.getFullYear()}-${month}-${day}`;
+}
+
 async function loadUserScores() {
     try {
-        const response = await fetch('/get_user_scores');
-        const scores = await response.json();
+        // Only the month the calendar shows; stats come precomputed with it
+        const today = new Date();
+        const start = localDateString(new Date(today.getFullYear(), today.getMonth(), 1));
+        const end = localDateString(new Date(today.getFullYear(), today.getMonth() + 1, 0));
+        const response = await fetch(`/score_history?start=${start}&end=${end}&limit=31`);
+        const data = await response.json();
         
         if (response.ok) {
-            displayCalendar(scores);
+            displayStats(data.stats);
+            displayCalendar(data.scores);
         }
     } catch (error) {
         console.error('Error loading scores:', error);
     }
 }
 
+function displayStats(stats) {
+    const container = document.getElementById('player-stats');
+    if (!container || !stats) return;
+    
+    const average = stats.average_score === null ? '-' : stats.average_score;
+    container.innerHTML = `
+        <div><strong>${stats.games_played}</strong> games played</div>
+        <div><strong>${average}</strong> average score</div>
+        <div><strong>${stats.current_streak}</strong> day streak (best ${stats.best_streak})</div>
+    `;
+}
+
 function displayCalendar(scores) {
     const calendar = document.getElementById('calendar');
     if (!calendar) return;
@@ -404,7 +545,7 @@ function displayCalendar(scores) {
     
     // Add days of the month
     for (let day = 1; day <= daysInMonth; day++) {
-        const dateStr = new Date(today.getFullYear(), today.getMonth(), day).toISOFormat().split('T')[0];
+        const dateStr = localDateString(new Date(today.getFullYear(), today.getMonth(), day));
         const dayElement = document.createElement('div');
         dayElement.className = 'calendar-day';
         dayElement.textContent = day;
@@ -418,11 +559,6 @@ function displayCalendar(scores) {
     }
 }
 
-// Helper function to format date as ISO string
-Date.prototype.toISOFormat = function() {
-    return this.toISOString();
-};
-
 function showMessage(message, type = 'error') {
     const messageBox = document.createElement('div');
     messageBox.className = `message ${type}`;
@@ -0,0 +1,34 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+# Production web server settings; every value can be overridden from the environment
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count() * 2 + 1)))
+# Threaded workers keep serving while a request waits on generation or holds a question stream open
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '4'))
+# On-demand generation can hold a request for a while
+timeout = int(os.getenv('WEB_TIMEOUT_SECONDS', '120'))
+graceful_timeout = 30
+keepalive = 5
+# Import the app once in the master; each worker disposes the inherited pool after fork
+preload_app = True
+accesslog = '-'
+
+# Workers share their metrics through this directory so /metrics answers for all of them
+metrics_dir = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'trivia_metrics'))
+
+def on_starting(server):
+    # Start each server from zero rather than adding up a previous run's workers
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+
+def post_fork(server, worker):
+    from backend.instrumentation import registry
+    registry.share(metrics_dir)
+
+def worker_exit(server, worker):
+    # Keep the exiting worker's counts in the totals
+    from backend.instrumentation import registry
+    registry.write_snapshot()